@@ -0,0 +1,67 @@
+"""
+Сравнение задержек провайдеров ИИ на полном пути AIClient
+
+Запуск:
+    python -m benchmarks.ai_providers --providers stub,rules,local --calls 50
+"""
+import argparse
+import time
+from benchmarks.common import use_scratch_database, latency_row, print_table
+
+TASKS = [
+    "Хочу цель: 500 подписчиков, я на 480",
+    "Добавь тренировку: 45 минут кардио",
+    "Записать сторис для блога",
+    "Позвонить клиенту по договору",
+    "Прочитать 20 страниц книги",
+]
+
+
+def run(provider_names, calls: int):
+    from bot.ai.openai_client import AIClient
+    from bot.ai.providers import create_provider, set_provider
+    from config.settings import settings
+
+    categories = list(settings.DEFAULT_CATEGORIES)
+    rows = []
+    for name in provider_names:
+        provider = create_provider(name)
+        set_provider(provider)
+        samples = {"parse": [], "categorize": [], "motivation": []}
+
+        for i in range(calls):
+            text = TASKS[i % len(TASKS)]
+
+            started = time.perf_counter()
+            parsed = AIClient.parse_task(text)
+            samples["parse"].append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            AIClient.categorize_task(parsed["title"], categories)
+            samples["categorize"].append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            AIClient.generate_motivation_message(True, parsed["title"], 1)
+            samples["motivation"].append(time.perf_counter() - started)
+
+        for kind, values in samples.items():
+            row = latency_row(kind, values)
+            row["provider"] = name if provider.available else f"{name} (недоступен -> правила)"
+            rows.append(row)
+
+    set_provider(None)
+    print_table(rows, ["provider", "name", "count", "p50", "p95", "p99", "max"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="A/B сравнение задержек провайдеров ИИ (мс)")
+    parser.add_argument("--providers", default="stub,rules", help="Через запятую: openai, local, stub, rules")
+    parser.add_argument("--calls", type=int, default=50, help="Запросов каждого типа на провайдера")
+    args = parser.parse_args()
+
+    use_scratch_database()
+    run([p.strip() for p in args.providers.split(",") if p.strip()], args.calls)
+
+
+if __name__ == "__main__":
+    main()
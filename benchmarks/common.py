@@ -0,0 +1,101 @@
+"""
+Общие утилиты бенчмарков
+"""
+import itertools
+import os
+import tempfile
+import time
+from typing import List, Dict, Optional
+
+
+def use_scratch_database(url: str = None) -> str:
+    """
+    Направляет бота во временную БД
+
+    Вызывать до импорта модулей bot.*: настройки читаются при импорте.
+
+    Args:
+        url: URL базы (по умолчанию - новый файл SQLite во временной папке)
+
+    Returns:
+        URL базы
+    """
+    if url is None:
+        url = f"sqlite:///{tempfile.mkdtemp(prefix='toxa-bench-')}/bot.db"
+    os.environ["DATABASE_URL"] = url
+    return url
+
+
+_ids = itertools.count(1)
+
+
+def make_message(telegram_id: int, text: str) -> Dict:
+    """Данные обновления с текстовым сообщением (или командой) от пользователя"""
+    message = {
+        "message_id": next(_ids),
+        "date": int(time.time()),
+        "chat": {"id": telegram_id, "type": "private"},
+        "from": {"id": telegram_id, "is_bot": False, "first_name": f"User{telegram_id}"},
+        "text": text,
+    }
+    if text.startswith("/"):
+        command = text.split()[0]
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(command)}]
+    return {"update_id": next(_ids), "message": message}
+
+
+def make_callback(telegram_id: int, data: str, message_text: Optional[str] = None) -> Dict:
+    """Данные обновления с нажатием кнопки под сообщением бота"""
+    return {
+        "update_id": next(_ids),
+        "callback_query": {
+            "id": str(next(_ids)),
+            "chat_instance": str(telegram_id),
+            "from": {"id": telegram_id, "is_bot": False, "first_name": f"User{telegram_id}"},
+            "data": data,
+            "message": {
+                "message_id": next(_ids),
+                "date": int(time.time()),
+                "chat": {"id": telegram_id, "type": "private"},
+                "text": message_text or "",
+            },
+        },
+    }
+
+
+def percentile(values: List[float], p: float) -> float:
+    """Перцентиль p (0-100) методом ближайшего ранга"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(p / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def latency_row(name: str, samples: List[float], elapsed: float = None) -> Dict:
+    """Сводка по задержкам (в миллисекундах) одной группы замеров"""
+    row = {
+        "name": name,
+        "count": len(samples),
+        "p50": percentile(samples, 50) * 1000,
+        "p95": percentile(samples, 95) * 1000,
+        "p99": percentile(samples, 99) * 1000,
+        "max": max(samples) * 1000 if samples else 0.0,
+    }
+    if elapsed:
+        row["rps"] = len(samples) / elapsed
+    return row
+
+
+def print_table(rows: List[Dict], columns: List[str]):
+    """Печатает таблицу результатов"""
+    widths = {c: max(len(c), *(len(_fmt(r.get(c))) for r in rows)) for c in columns}
+    print("  ".join(c.ljust(widths[c]) for c in columns))
+    for row in rows:
+        print("  ".join(_fmt(row.get(c)).ljust(widths[c]) for c in columns))
+
+
+def _fmt(value) -> str:
+    if isinstance(value, float):
+        return f"{value:.2f}"
+    return "" if value is None else str(value)
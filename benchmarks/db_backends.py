@@ -0,0 +1,195 @@
+"""
+Сравнение SQLite и PostgreSQL на запросах бота
+
+Каждый бэкенд проверяется в отдельном процессе (URL базы читается при импорте):
+регистрация пользователей через get_or_create_user, создание задач, учёт токенов
+ИИ через upsert (в том числе из нескольких потоков), страница /tasks и выборка
+пользователей для рассылки. Заодно проверяется, что upsert посчитал всё верно.
+
+PostgreSQL: либо --postgres-url, либо временный кластер (нужны initdb и pg_ctl
+в PATH или в /usr/lib/postgresql/*/bin и драйвер psycopg2). Docker не нужен.
+
+Запуск:
+    python -m benchmarks.db_backends [--users 200] [--postgres-url postgresql+psycopg2://...]
+"""
+import argparse
+import glob
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Iterator, Optional
+from benchmarks.common import use_scratch_database, latency_row, print_table
+
+
+def find_pg_bin() -> Optional[str]:
+    """Папка с initdb и pg_ctl или None"""
+    initdb = shutil.which("initdb")
+    if initdb:
+        return os.path.dirname(initdb)
+    candidates = sorted(glob.glob("/usr/lib/postgresql/*/bin/initdb"))
+    return os.path.dirname(candidates[-1]) if candidates else None
+
+
+@contextmanager
+def temporary_postgres(pg_bin: str) -> Iterator[str]:
+    """Временный кластер PostgreSQL на свободном порту; удаляется после использования"""
+    data_dir = tempfile.mkdtemp(prefix="toxa-pg-")
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+
+    subprocess.run([os.path.join(pg_bin, "initdb"), "-D", data_dir, "-U", "postgres", "-A", "trust"],
+                   check=True, stdout=subprocess.DEVNULL)
+    subprocess.run([os.path.join(pg_bin, "pg_ctl"), "-D", data_dir, "-w", "-l", os.path.join(data_dir, "log"),
+                    "-o", f"-p {port} -k {data_dir} -c listen_addresses=127.0.0.1 -c fsync=off", "start"],
+                   check=True, stdout=subprocess.DEVNULL)
+    try:
+        yield f"postgresql+psycopg2://postgres@127.0.0.1:{port}/postgres"
+    finally:
+        subprocess.run([os.path.join(pg_bin, "pg_ctl"), "-D", data_dir, "-m", "fast", "stop"],
+                       stdout=subprocess.DEVNULL)
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+def run_backend(users: int, threads: int) -> list:
+    """Замеры на текущей DATABASE_URL (вызывается в отдельном процессе)"""
+    from bot.database.db import SessionLocal, init_db, get_or_create_user, database_url
+    from bot.database.models import Task, AIUsage, Category
+    from bot.ai.usage_limiter import usage_limiter
+    from bot.utils.render_cache import render_cache
+    from bot.utils.views import render_tasks_view
+    from config.settings import settings
+
+    init_db()
+    backend = database_url.get_backend_name()
+    rows = []
+
+    def timed(samples, func, *args):
+        started = time.perf_counter()
+        result = func(*args)
+        samples.append(time.perf_counter() - started)
+        return result
+
+    db = SessionLocal()
+    try:
+        category_id = db.query(Category.id).first()[0]
+
+        samples = []
+        user_ids = []
+        started = time.perf_counter()
+        for i in range(users):
+            # Большие ID: в PostgreSQL telegram_id должен быть BIGINT
+            user, _ = timed(samples, get_or_create_user, db, 5_000_000_000 + i, f"user{i}", "Тест")
+            user_ids.append(user.id)
+        rows.append(latency_row("создание пользователя", samples, time.perf_counter() - started))
+
+        samples = []
+        started = time.perf_counter()
+        for i in range(users):
+            timed(samples, get_or_create_user, db, 5_000_000_000 + i, f"user{i}", "Тест")
+        rows.append(latency_row("повторный /start", samples, time.perf_counter() - started))
+
+        def add_tasks(user_id):
+            db.add_all(Task(user_id=user_id, category_id=category_id, title=f"Задача {n}") for n in range(20))
+            db.commit()
+        samples = []
+        started = time.perf_counter()
+        for user_id in user_ids:
+            timed(samples, add_tasks, user_id)
+        rows.append(latency_row("20 задач одной транзакцией", samples, time.perf_counter() - started))
+
+        def tasks_page(user_id):
+            render_cache.bump(user_id)  # Без кэша: меряем запросы
+            return render_tasks_view(db, user_id)
+        samples = []
+        started = time.perf_counter()
+        for user_id in user_ids:
+            timed(samples, tasks_page, user_id)
+        rows.append(latency_row("страница /tasks", samples, time.perf_counter() - started))
+
+        samples = []
+        started = time.perf_counter()
+        from bot.database.models import User
+        count = sum(1 for _ in timed(samples, lambda: list(
+            db.query(User.id, User.telegram_id).order_by(User.id).yield_per(settings.DIGEST_BATCH_SIZE)
+        )))
+        rows.append(latency_row(f"выборка {count} пользователей для рассылки", samples))
+    finally:
+        db.close()
+
+    calls_per_user = 10
+    samples = []
+
+    def record(user_id):
+        started = time.perf_counter()
+        usage_limiter.record(user_id, 100, 50)
+        samples.append(time.perf_counter() - started)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(record, [user_id for user_id in user_ids for _ in range(calls_per_user)]))
+    rows.append(latency_row(f"учёт токенов ИИ ({threads} потоков)", samples, time.perf_counter() - started))
+
+    db = SessionLocal()
+    try:
+        totals = db.query(AIUsage.requests, AIUsage.prompt_tokens, AIUsage.completion_tokens).all()
+    finally:
+        db.close()
+    expected = (calls_per_user, 100 * calls_per_user, 50 * calls_per_user)
+    if len(totals) != users or any(tuple(row) != expected for row in totals):
+        raise AssertionError(f"{backend}: upsert посчитал неверно")
+
+    for row in rows:
+        row["backend"] = backend
+    return rows
+
+
+def run_in_subprocess(url: str, users: int, threads: int) -> list:
+    env = dict(os.environ, DATABASE_URL=url, LEADERBOARD_SNAPSHOT_PATH="")
+    result = subprocess.run(
+        [sys.executable, "-m", "benchmarks.db_backends", "--child", "--users", str(users), "--threads", str(threads)],
+        env=env, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "ошибка")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сравнение SQLite и PostgreSQL (мс)")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--postgres-url", default=os.getenv("BENCH_POSTGRES_URL", ""))
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_backend(args.users, args.threads)))
+        return
+
+    rows = run_in_subprocess(use_scratch_database(), args.users, args.threads)
+
+    if args.postgres_url:
+        rows += run_in_subprocess(args.postgres_url, args.users, args.threads)
+    else:
+        pg_bin = find_pg_bin()
+        if pg_bin is None:
+            print("PostgreSQL не найден (нет initdb) - только SQLite")
+        else:
+            try:
+                with temporary_postgres(pg_bin) as url:
+                    rows += run_in_subprocess(url, args.users, args.threads)
+            except Exception as e:
+                print(f"PostgreSQL пропущен: {e}")
+
+    print_table(rows, ["backend", "name", "count", "p50", "p95", "p99", "max", "rps"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""
+Нагрузочный бенчмарк обработчиков на свежей БД
+
+N синтетических пользователей проходят сценарий: /start, несколько задач
+сообщениями и столько же одним списком, /tasks, листание, выполнение и пропуск задач кнопками, /stats,
+/progress и /top. Обновления идут через Application (как в боте), бот - OfflineBot,
+ИИ - заглушка. По каждому обработчику выводятся p50/p95/p99, пропускная
+способность и среднее число SQL-запросов.
+
+Сохранить результат и сравнить с ним после изменений:
+    python -m benchmarks.handlers --save baseline.json
+    python -m benchmarks.handlers --compare baseline.json   # код 1 при регрессии p95
+
+Запуск:
+    python -m benchmarks.handlers [--users 50] [--tasks 8] [--concurrency 10]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from typing import Dict, List
+from benchmarks.common import use_scratch_database, make_message, make_callback, latency_row, print_table
+
+# Допустимое замедление p95 при сравнении с сохранённым результатом
+REGRESSION_THRESHOLD = 1.2
+
+
+class QueryCounter:
+    """Считает SQL-запросы движка (через событие before_cursor_execute)"""
+
+    def __init__(self, engine):
+        from sqlalchemy import event
+        self.count = 0
+        event.listen(engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+
+class Recorder:
+    """Замеры по обработчикам"""
+
+    def __init__(self, queries: QueryCounter):
+        self.queries = queries
+        self.samples: Dict[str, List[float]] = {}
+        self.query_counts: Dict[str, int] = {}
+
+    async def run(self, application, name: str, data: dict):
+        from telegram import Update
+        update = Update.de_json(data, application.bot)
+        # Обработчики синхронно ходят в БД, поэтому запросы между await не перемешиваются
+        queries_before = self.queries.count
+        started = time.perf_counter()
+        await application.process_update(update)
+        self.samples.setdefault(name, []).append(time.perf_counter() - started)
+        self.query_counts[name] = self.query_counts.get(name, 0) + self.queries.count - queries_before
+
+    def rows(self, elapsed: float) -> List[Dict]:
+        rows = []
+        for name, samples in self.samples.items():
+            row = latency_row(name, samples, sum(samples))
+            row["queries"] = self.query_counts[name] / len(samples)
+            rows.append(row)
+        total = [s for samples in self.samples.values() for s in samples]
+        rows.append(latency_row("всего", total, elapsed))
+        rows[-1]["queries"] = sum(self.query_counts.values()) / len(total)
+        return rows
+
+
+async def user_scenario(application, recorder: Recorder, telegram_id: int, tasks: int):
+    """Сценарий одного пользователя (обновления пользователя - строго по порядку)"""
+    from bot.database.db import SessionLocal
+    from bot.database.models import User, Task
+
+    await recorder.run(application, "/start", make_message(telegram_id, "/start"))
+    for i in range(tasks):
+        await recorder.run(application, "handle_message", make_message(telegram_id, f"Задача {i}: позвонить клиенту"))
+    if tasks > 1:
+        plan = "\n".join(f"- Пункт {i}: написать клиенту" for i in range(tasks))
+        await recorder.run(application, "handle_message: список", make_message(telegram_id, plan))
+    await recorder.run(application, "/tasks", make_message(telegram_id, "/tasks"))
+
+    db = SessionLocal()
+    try:
+        task_ids = [row.id for row in db.query(Task.id).join(User).filter(
+            User.telegram_id == telegram_id
+        ).order_by(Task.id)]
+    finally:
+        db.close()
+
+    if task_ids:
+        await recorder.run(application, "callback: листание",
+                           make_callback(telegram_id, f"tasks:n{task_ids[0]}:0:", "Задачи"))
+    for n, task_id in enumerate(task_ids):
+        action = "complete" if n % 3 else "miss"
+        await recorder.run(application, f"callback: {action}", make_callback(telegram_id, f"{action}_{task_id}"))
+
+    await recorder.run(application, "/stats", make_message(telegram_id, "/stats"))
+    await recorder.run(application, "/progress", make_message(telegram_id, "/progress"))
+    await recorder.run(application, "/top", make_message(telegram_id, "/top"))
+
+
+async def run(users: int, tasks: int, concurrency: int) -> List[Dict]:
+    from telegram.ext import Application
+    from bot.database.db import engine, init_db
+    from bot.main import register_handlers
+    from bot.utils.offline_bot import OfflineBot
+
+    init_db()
+    application = Application.builder().bot(OfflineBot()).build()
+    register_handlers(application)
+    recorder = Recorder(QueryCounter(engine))
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited(telegram_id: int):
+        async with semaphore:
+            await user_scenario(application, recorder, telegram_id, tasks)
+
+    async with application:
+        started = time.perf_counter()
+        await asyncio.gather(*(limited(7_000_000_000 + i) for i in range(users)))
+        elapsed = time.perf_counter() - started
+
+    return recorder.rows(elapsed)
+
+
+def compare(rows: List[Dict], path: str) -> bool:
+    """Сравнивает p95 с сохранённым результатом; True, если регрессий нет"""
+    with open(path, encoding="utf-8") as f:
+        baseline = {row["name"]: row for row in json.load(f)}
+
+    ok = True
+    print(f"\nСравнение с {path} (p95, мс):")
+    for row in rows:
+        before = baseline.get(row["name"])
+        if not before or not before["p95"]:
+            continue
+        ratio = row["p95"] / before["p95"]
+        regression = ratio > REGRESSION_THRESHOLD
+        ok = ok and not regression
+        mark = "  <-- регрессия" if regression else ""
+        print(f"  {row['name']}: {before['p95']:.2f} -> {row['p95']:.2f} ({ratio:.2f}x){mark}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк обработчиков (мс)")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--tasks", type=int, default=8, help="Задач на пользователя")
+    parser.add_argument("--concurrency", type=int, default=10, help="Пользователей одновременно")
+    parser.add_argument("--ai-latency-ms", type=float, default=0.0, help="Задержка заглушки ИИ")
+    parser.add_argument("--save", help="Сохранить результат в JSON")
+    parser.add_argument("--compare", help="Сравнить с сохранённым JSON")
+    args = parser.parse_args()
+
+    use_scratch_database()
+    os.environ["AI_PROVIDER"] = "stub"
+    os.environ["STUB_AI_LATENCY_MS"] = str(args.ai_latency_ms)
+    os.environ["AI_STREAMING"] = "false"
+    os.environ["LEADERBOARD_SNAPSHOT_PATH"] = ""
+
+    rows = asyncio.run(run(args.users, args.tasks, args.concurrency))
+    print(f"Пользователей: {args.users}, задач на пользователя: {args.tasks}, одновременно: {args.concurrency}")
+    print_table(rows, ["name", "count", "p50", "p95", "p99", "max", "rps", "queries"])
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(rows, f, ensure_ascii=False, indent=2)
+    if args.compare and not compare(rows, args.compare):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Бенчмарк рейтингов на 100k пользователей
+
+Сравнивает инкрементальный RankedBoard с сортировкой на каждый запрос
+и замеряет сохранение/загрузку снимка.
+
+Запуск:
+    python -m benchmarks.leaderboard [--users 100000]
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from benchmarks.common import use_scratch_database, print_table
+
+
+def measure(name: str, operations: int, func) -> dict:
+    started = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - started
+    return {"name": name, "ops": operations, "total_ms": elapsed * 1000, "us_per_op": elapsed / operations * 1e6}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк рейтингов")
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--ops", type=int, default=10_000)
+    args = parser.parse_args()
+
+    use_scratch_database()
+    from bot.gamification.leaderboard import RankedBoard, Leaderboards, WEEKLY_BOARD
+
+    rng = random.Random(42)
+    scores = {user_id: rng.randint(0, 50_000) for user_id in range(1, args.users + 1)}
+    user_ids = list(scores)
+    board = RankedBoard()
+    rows = []
+
+    rows.append(measure("начальная загрузка", args.users, lambda: board.load(list(scores.items()))))
+
+    def updates():
+        for _ in range(args.ops):
+            board.add(rng.choice(user_ids), 10)
+    rows.append(measure("начисление XP", args.ops, updates))
+
+    def ranks():
+        for _ in range(args.ops):
+            board.rank(rng.choice(user_ids))
+    rows.append(measure("место пользователя", args.ops, ranks))
+
+    rows.append(measure("топ-10", args.ops, lambda: [board.top(10) for _ in range(args.ops)]))
+
+    naive_ops = max(1, args.ops // 100)
+
+    def naive_ranks():
+        for _ in range(naive_ops):
+            user_id = rng.choice(user_ids)
+            ordered = sorted(scores.values(), reverse=True)
+            ordered.index(scores[user_id])
+    rows.append(measure("место через сортировку (для сравнения)", naive_ops, naive_ranks))
+
+    boards = Leaderboards()
+    boards.boards[WEEKLY_BOARD] = board
+    path = os.path.join(tempfile.mkdtemp(prefix="toxa-bench-"), "leaderboard.json")
+    rows.append(measure("сохранение снимка", 1, lambda: Leaderboards.save_snapshot(boards.snapshot(), path)))
+
+    def load_snapshot():
+        import json
+        with open(path, encoding="utf-8") as f:
+            snapshot = json.load(f)
+        RankedBoard().load([(u, s) for u, s in snapshot["boards"][WEEKLY_BOARD]])
+    rows.append(measure("загрузка снимка", 1, load_snapshot))
+
+    print(f"Пользователей: {args.users}, размер снимка: {os.path.getsize(path) / 1024:.0f} КБ")
+    print_table(rows, ["name", "ops", "total_ms", "us_per_op"])
+
+
+if __name__ == "__main__":
+    main()
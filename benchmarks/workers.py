@@ -0,0 +1,102 @@
+"""
+Пропускная способность режима воркеров (1, 2 и 4 процесса)
+
+Обновления от нескольких пользователей (создание задач, /tasks, /progress)
+раскладываются по воркерам так же, как во фронте; бот в воркерах - OfflineBot,
+ИИ - заглушка с задержкой. Время запуска процессов в замер не входит.
+
+Запуск:
+    python -m benchmarks.workers [--workers 1,2,4] [--users 40] [--messages 10] [--ai-latency-ms 5]
+"""
+import argparse
+import multiprocessing
+import os
+import time
+from benchmarks.common import use_scratch_database, make_message, print_table
+
+
+def offline_bot_factory():
+    """Бот для воркеров (функция уровня модуля: передаётся в процесс через spawn)"""
+    from bot.utils.offline_bot import OfflineBot
+    return OfflineBot()
+
+
+def wait_processed(processed, target: int, timeout: float) -> bool:
+    deadline = time.monotonic() + timeout
+    while processed.value < target:
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.005)
+    return True
+
+
+def run(workers: int, users: int, messages: int, timeout: float) -> dict:
+    from telegram import Update
+    from bot.transport.workers import WorkerPool
+    from bot.utils.offline_bot import OfflineBot
+
+    bot = OfflineBot()
+    processed = multiprocessing.get_context("spawn").Value("i", 0)
+    pool = WorkerPool(workers, bot_factory=offline_bot_factory, processed=processed)
+    telegram_ids = [1_000_000 * workers + i for i in range(users)]
+
+    pool.start()
+    try:
+        # Прогрев: запуск процессов и регистрация пользователей
+        for telegram_id in telegram_ids:
+            pool.dispatch(Update.de_json(make_message(telegram_id, "/start"), bot))
+        if not wait_processed(processed, users, timeout):
+            raise RuntimeError("Воркеры не успели запуститься")
+
+        updates = []
+        for i in range(messages):
+            for telegram_id in telegram_ids:
+                updates.append(make_message(telegram_id, f"Задача {i}: позвонить клиенту"))
+        for telegram_id in telegram_ids:
+            updates.append(make_message(telegram_id, "/tasks"))
+            updates.append(make_message(telegram_id, "/progress"))
+
+        started = time.perf_counter()
+        for data in updates:
+            pool.dispatch(Update.de_json(data, bot))
+        finished = wait_processed(processed, users + len(updates), timeout)
+        elapsed = time.perf_counter() - started
+    finally:
+        pool.stop()
+
+    return {
+        "workers": workers,
+        "updates": len(updates),
+        "seconds": elapsed,
+        "updates_per_s": len(updates) / elapsed,
+        "completed": "да" if finished else "нет (таймаут)",
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк режима воркеров")
+    parser.add_argument("--workers", default="1,2,4", help="Через запятую")
+    parser.add_argument("--users", type=int, default=40)
+    parser.add_argument("--messages", type=int, default=10, help="Новых задач на пользователя")
+    parser.add_argument("--ai-latency-ms", type=float, default=5.0, help="Задержка заглушки ИИ")
+    parser.add_argument("--timeout", type=float, default=300.0)
+    args = parser.parse_args()
+
+    # Настройки читаются воркерами при импорте: передаём их через окружение
+    use_scratch_database()
+    os.environ["AI_PROVIDER"] = "stub"
+    os.environ["STUB_AI_LATENCY_MS"] = str(args.ai_latency_ms)
+    os.environ["LEADERBOARD_SNAPSHOT_PATH"] = ""
+    os.environ["METRICS_PORT"] = "0"
+    os.environ["LOG_FILE"] = ""
+
+    from bot.database.db import init_db
+    init_db()
+
+    rows = [run(int(w), args.users, args.messages, args.timeout) for w in args.workers.split(",")]
+    print(f"Ядер: {os.cpu_count()}, пользователей: {args.users}, задержка ИИ: {args.ai_latency_ms} мс")
+    print_table(rows, ["workers", "updates", "seconds", "updates_per_s", "completed"])
+
+
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,14 @@
 """
-Клиент для работы с OpenAI API
+Клиент для работы с ИИ (провайдер выбирается в настройках, см. bot/ai/providers.py)
 """
 import json
 import re
 import random
-from typing import Optional, Dict, List
-from config.settings import settings
-
-# Пытаемся импортировать OpenAI (опционально)
-try:
-    from openai import OpenAI
-    OPENAI_AVAILABLE = True
-except ImportError:
-    OPENAI_AVAILABLE = False
-    OpenAI = None
-
-# Инициализируем клиент только если есть ключ и библиотека установлена
-client = None
-if OPENAI_AVAILABLE and settings.OPENAI_API_KEY:
-    try:
-        client = OpenAI(api_key=settings.OPENAI_API_KEY)
-    except:
-        pass
+import time
+from typing import Optional, Dict, List, Iterator
+from bot.ai.providers import get_provider, AIProvider, Usage
+from bot.ai.usage_limiter import usage_limiter
+from bot.utils.metrics import AI_LATENCY, AI_FALLBACKS, AI_TOKENS
 
 # Заглушки для мотивационных сообщений
 MOTIVATION_COMPLETED = [
@@ -49,19 +36,21 @@ class AIClient:
     """Клиент для работы с ИИ"""
     
     @staticmethod
-    def categorize_task(task_text: str, available_categories: List[str]) -> str:
+    def categorize_task(task_text: str, available_categories: List[str], user_id: Optional[int] = None) -> str:
         """
         Определяет категорию задачи с помощью ИИ или простых правил
         
         Args:
             task_text: Текст задачи
             available_categories: Список доступных категорий
+            user_id: ID пользователя в БД (для лимитов и учёта токенов)
             
         Returns:
             Название категории
         """
-        # Если нет клиента OpenAI, используем простые правила
-        if not client:
+        # Если нет модели или исчерпан лимит, используем простые правила
+        provider = get_provider()
+        if not AIClient._can_use(provider, "categorize", user_id):
             return AIClient._categorize_by_keywords(task_text, available_categories)
         
         categories_str = ", ".join(available_categories)
@@ -74,8 +63,9 @@ class AIClient:
 Верни ТОЛЬКО название категории, без дополнительных объяснений."""
 
         try:
-            response = client.chat.completions.create(
-                model=settings.OPENAI_MODEL,
+            started = time.perf_counter()
+            completion = provider.complete(
+                "categorize",
                 messages=[
                     {"role": "system", "content": "Ты помощник для категоризации задач. Отвечай только названием категории."},
                     {"role": "user", "content": prompt}
@@ -83,25 +73,52 @@ class AIClient:
                 temperature=0.3,
                 max_tokens=50
             )
+            AI_LATENCY.observe(time.perf_counter() - started, kind="categorize", provider=provider.name)
+            AIClient._record_usage(user_id, completion.usage)
             
-            category = response.choices[0].message.content.strip()
-            
-            # Проверяем, что категория есть в списке
-            if category in available_categories:
+            category = AIClient._match_category(completion.text.strip(), available_categories)
+            if category:
                 return category
             
-            # Если нет точного совпадения, ищем похожую
-            for cat in available_categories:
-                if cat.lower() in category.lower() or category.lower() in cat.lower():
-                    return cat
-            
             # Если ничего не найдено, используем правила
+            AI_FALLBACKS.inc(kind="categorize", reason="bad_answer")
             return AIClient._categorize_by_keywords(task_text, available_categories)
             
         except Exception as e:
             print(f"Ошибка при категоризации (используем правила): {e}")
+            AI_FALLBACKS.inc(kind="categorize", reason="error")
             return AIClient._categorize_by_keywords(task_text, available_categories)
     
+    @staticmethod
+    def _match_category(answer: str, available_categories: List[str]) -> Optional[str]:
+        """Категория из списка по ответу модели: точное совпадение или похожая; None - не нашлась"""
+        if answer in available_categories:
+            return answer
+        for cat in available_categories:
+            if cat.lower() in answer.lower() or answer.lower() in cat.lower():
+                return cat
+        return None
+    
+    @staticmethod
+    def _can_use(provider: AIProvider, kind: str, user_id: Optional[int]) -> bool:
+        """Можно ли идти в модель (иначе ответ без модели - учитываем причину в метриках)"""
+        if not provider.available:
+            AI_FALLBACKS.inc(kind=kind, reason="unavailable")
+            return False
+        if not usage_limiter.allow(user_id):
+            AI_FALLBACKS.inc(kind=kind, reason="limited")
+            return False
+        return True
+    
+    @staticmethod
+    def _record_usage(user_id: Optional[int], usage: Optional[Usage]):
+        """Учитывает токены, потраченные на ответ модели"""
+        if usage is None:
+            return
+        AI_TOKENS.inc(usage.prompt_tokens, type="prompt")
+        AI_TOKENS.inc(usage.completion_tokens, type="completion")
+        usage_limiter.record(user_id, usage.prompt_tokens, usage.completion_tokens)
+    
     @staticmethod
     def _categorize_by_keywords(task_text: str, available_categories: List[str]) -> str:
         """
@@ -132,18 +149,20 @@ class AIClient:
         return "Работа" if "Работа" in available_categories else (available_categories[0] if available_categories else "Работа")
     
     @staticmethod
-    def parse_task(task_text: str) -> Dict:
+    def parse_task(task_text: str, user_id: Optional[int] = None) -> Dict:
         """
         Парсит текст задачи и извлекает информацию
         
         Args:
             task_text: Текст задачи
+            user_id: ID пользователя в БД (для лимитов и учёта токенов)
             
         Returns:
             Словарь с полями: title, category, current_progress, target_progress, deadline
         """
-        # Если нет клиента OpenAI, используем простой парсинг
-        if not client:
+        # Если нет модели или исчерпан лимит, используем простой парсинг
+        provider = get_provider()
+        if not AIClient._can_use(provider, "parse", user_id):
             return AIClient._parse_task_simple(task_text)
         
         prompt = f"""Проанализируй следующую задачу и извлеки информацию в формате JSON:
@@ -159,8 +178,9 @@ class AIClient:
 Верни ТОЛЬКО JSON, без дополнительного текста."""
 
         try:
-            response = client.chat.completions.create(
-                model=settings.OPENAI_MODEL,
+            started = time.perf_counter()
+            completion = provider.complete(
+                "parse",
                 messages=[
                     {"role": "system", "content": "Ты помощник для парсинга задач. Отвечай только валидным JSON."},
                     {"role": "user", "content": prompt}
@@ -168,8 +188,10 @@ class AIClient:
                 temperature=0.3,
                 max_tokens=200
             )
+            AI_LATENCY.observe(time.perf_counter() - started, kind="parse", provider=provider.name)
+            AIClient._record_usage(user_id, completion.usage)
             
-            result_text = response.choices[0].message.content.strip()
+            result_text = completion.text.strip()
             
             # Убираем markdown форматирование, если есть
             result_text = re.sub(r'```json\n?', '', result_text)
@@ -180,8 +202,96 @@ class AIClient:
             
         except Exception as e:
             print(f"Ошибка при парсинге задачи (используем простой парсинг): {e}")
+            AI_FALLBACKS.inc(kind="parse", reason="error")
             return AIClient._parse_task_simple(task_text)
     
+    @staticmethod
+    def parse_tasks_batch(task_texts: List[str], available_categories: List[str],
+                          user_id: Optional[int] = None) -> List[Dict]:
+        """
+        Парсит и категоризирует несколько задач одним запросом к модели
+        
+        Args:
+            task_texts: Тексты задач
+            available_categories: Список доступных категорий
+            user_id: ID пользователя в БД (для лимитов и учёта токенов)
+            
+        Returns:
+            Для каждой задачи - словарь как у parse_task и поле category.
+            Задачи, которые модель не разобрала, разбираются простым парсингом и правилами.
+        """
+        provider = get_provider()
+        if not AIClient._can_use(provider, "parse_batch", user_id):
+            return [AIClient._parse_and_categorize_simple(text, available_categories) for text in task_texts]
+        
+        numbered = "\n".join(f"{number}. {text}" for number, text in enumerate(task_texts, 1))
+        prompt = f"""Проанализируй задачи из списка и для каждой извлеки информацию.
+Доступные категории: {", ".join(available_categories)}
+
+Верни JSON-массив, по одному объекту на задачу, в том же порядке:
+[
+    {{
+        "title": "краткое название задачи",
+        "category": "одна из доступных категорий",
+        "current_progress": число или null,
+        "target_progress": число или null,
+        "deadline": "дата в формате YYYY-MM-DD или null"
+    }}
+]
+
+Задачи:
+{numbered}
+
+Верни ТОЛЬКО JSON, без дополнительного текста."""
+
+        try:
+            started = time.perf_counter()
+            completion = provider.complete(
+                "parse_batch",
+                messages=[
+                    {"role": "system", "content": "Ты помощник для парсинга задач. Отвечай только валидным JSON."},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=0.3,
+                max_tokens=100 * len(task_texts) + 50
+            )
+            AI_LATENCY.observe(time.perf_counter() - started, kind="parse_batch", provider=provider.name)
+            AIClient._record_usage(user_id, completion.usage)
+            
+            result_text = completion.text.strip()
+            result_text = re.sub(r'```json\n?', '', result_text)
+            result_text = re.sub(r'```\n?', '', result_text)
+            items = json.loads(result_text)
+            if not isinstance(items, list):
+                raise ValueError("ответ - не массив")
+            
+        except Exception as e:
+            print(f"Ошибка при пакетном парсинге задач (используем простой парсинг): {e}")
+            AI_FALLBACKS.inc(kind="parse_batch", reason="error")
+            return [AIClient._parse_and_categorize_simple(text, available_categories) for text in task_texts]
+        
+        results = []
+        for i, text in enumerate(task_texts):
+            item = items[i] if i < len(items) else None
+            category = None
+            if isinstance(item, dict) and item.get("title"):
+                category = AIClient._match_category(str(item.get("category") or ""), available_categories)
+            if category is None:
+                # Модель пропустила задачу или ответила не по формату - только её разбираем сами
+                AI_FALLBACKS.inc(kind="parse_batch", reason="bad_answer")
+                results.append(AIClient._parse_and_categorize_simple(text, available_categories))
+                continue
+            item["category"] = category
+            results.append(item)
+        return results
+    
+    @staticmethod
+    def _parse_and_categorize_simple(task_text: str, available_categories: List[str]) -> Dict:
+        """Простой парсинг и категоризация по ключевым словам (fallback)"""
+        parsed = AIClient._parse_task_simple(task_text)
+        parsed["category"] = AIClient._categorize_by_keywords(parsed["title"], available_categories)
+        return parsed
+    
     @staticmethod
     def _parse_task_simple(task_text: str) -> Dict:
         """
@@ -246,7 +356,8 @@ class AIClient:
         return result
     
     @staticmethod
-    def generate_motivation_message(is_completed: bool, task_title: str, user_level: int) -> str:
+    def generate_motivation_message(is_completed: bool, task_title: str, user_level: int,
+                                    user_id: Optional[int] = None) -> str:
         """
         Генерирует мотивационное сообщение
         
@@ -254,17 +365,85 @@ class AIClient:
             is_completed: Выполнена ли задача
             task_title: Название задачи
             user_level: Уровень пользователя
+            user_id: ID пользователя в БД (для лимитов и учёта токенов)
             
         Returns:
             Мотивационное сообщение
         """
-        # Если нет клиента OpenAI, используем заглушки
-        if not client:
-            if is_completed:
-                return random.choice(MOTIVATION_COMPLETED)
-            else:
-                return random.choice(MOTIVATION_MISSED)
+        # Если нет модели или исчерпан лимит, используем заглушки
+        provider = get_provider()
+        if not AIClient._can_use(provider, "motivation", user_id):
+            return AIClient._fallback_motivation(is_completed)
+
+        try:
+            started = time.perf_counter()
+            completion = provider.complete(
+                "motivation",
+                messages=AIClient._motivation_messages(is_completed, task_title, user_level),
+                temperature=0.8,
+                max_tokens=100
+            )
+            AI_LATENCY.observe(time.perf_counter() - started, kind="motivation", provider=provider.name)
+            AIClient._record_usage(user_id, completion.usage)
+            
+            return completion.text.strip()
+            
+        except Exception as e:
+            print(f"Ошибка при генерации мотивации (используем заглушки): {e}")
+            AI_FALLBACKS.inc(kind="motivation", reason="error")
+            return AIClient._fallback_motivation(is_completed)
+    
+    @staticmethod
+    def stream_motivation_message(is_completed: bool, task_title: str, user_level: int,
+                                  user_id: Optional[int] = None) -> Iterator[str]:
+        """
+        Генерирует мотивационное сообщение по частям (по мере ответа модели)
+        
+        Итератор блокирующий: в асинхронном коде его нужно читать через поток.
+        
+        Args:
+            is_completed: Выполнена ли задача
+            task_title: Название задачи
+            user_level: Уровень пользователя
+            user_id: ID пользователя в БД (для лимитов и учёта токенов)
+            
+        Yields:
+            Очередные куски текста
+        """
+        provider = get_provider()
+        if not AIClient._can_use(provider, "motivation", user_id):
+            yield AIClient._fallback_motivation(is_completed)
+            return
+        
+        received = False
+        started = time.perf_counter()
+        try:
+            stream = provider.stream(
+                "motivation",
+                messages=AIClient._motivation_messages(is_completed, task_title, user_level),
+                temperature=0.8,
+                max_tokens=100
+            )
+            
+            for piece in stream:
+                if isinstance(piece, Usage):
+                    AIClient._record_usage(user_id, piece)
+                elif piece:
+                    received = True
+                    yield piece
+            
+            AI_LATENCY.observe(time.perf_counter() - started, kind="motivation_stream", provider=provider.name)
+            
+        except Exception as e:
+            print(f"Ошибка при потоковой генерации мотивации (используем заглушки): {e}")
+            AI_FALLBACKS.inc(kind="motivation", reason="error")
         
+        if not received:
+            yield AIClient._fallback_motivation(is_completed)
+    
+    @staticmethod
+    def _motivation_messages(is_completed: bool, task_title: str, user_level: int) -> List[Dict]:
+        """Промпт для мотивационного сообщения"""
         if is_completed:
             prompt = f"""Сгенерируй короткое мотивационное сообщение (1-2 предложения) в стиле поколения Z, 
 дерзкое и живое, для пользователя уровня {user_level}, который только что выполнил задачу "{task_title}".
@@ -284,24 +463,16 @@ class AIClient:
 - "Бывает. Главное - не сдавайся."
 
 Верни ТОЛЬКО текст сообщения, без кавычек."""
-
-        try:
-            response = client.chat.completions.create(
-                model=settings.OPENAI_MODEL,
-                messages=[
-                    {"role": "system", "content": "Ты мотивационный коуч в стиле поколения Z. Отвечай коротко и дерзко."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.8,
-                max_tokens=100
-            )
-            
-            return response.choices[0].message.content.strip()
-            
-        except Exception as e:
-            print(f"Ошибка при генерации мотивации (используем заглушки): {e}")
-            if is_completed:
-                return random.choice(MOTIVATION_COMPLETED)
-            else:
-                return random.choice(MOTIVATION_MISSED)
-
+        
+        return [
+            {"role": "system", "content": "Ты мотивационный коуч в стиле поколения Z. Отвечай коротко и дерзко."},
+            {"role": "user", "content": prompt}
+        ]
+    
+    @staticmethod
+    def _fallback_motivation(is_completed: bool) -> str:
+        """Мотивационное сообщение из заготовок"""
+        if is_completed:
+            return random.choice(MOTIVATION_COMPLETED)
+        else:
+            return random.choice(MOTIVATION_MISSED)
@@ -0,0 +1,295 @@
+"""
+Провайдеры ИИ: OpenAI, локальный сервер модели, правила и заглушка для нагрузочных тестов
+"""
+import json
+import random
+import re
+import threading
+import time
+import zlib
+from typing import Optional, Dict, List, Iterator, Union
+from config.settings import settings
+
+
+def _import_openai():
+    """
+    Класс клиента OpenAI или None, если библиотека не установлена
+
+    Библиотека тяжёлая, поэтому импортируется при создании провайдера,
+    а не при запуске бота.
+    """
+    try:
+        from openai import OpenAI
+    except ImportError:
+        return None
+    return OpenAI
+
+
+class ProviderError(Exception):
+    """Ошибка провайдера ИИ (AIClient в этом случае переходит на правила)"""
+
+
+class Usage:
+    """Расход токенов на один ответ"""
+
+    def __init__(self, prompt_tokens: int = 0, completion_tokens: int = 0):
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+
+
+class Completion:
+    """Ответ модели"""
+
+    def __init__(self, text: str, usage: Optional[Usage] = None):
+        self.text = text
+        self.usage = usage
+
+
+class AIProvider:
+    """
+    Базовый провайдер ИИ
+
+    kind - тип запроса ("categorize", "parse", "motivation"), нужен заглушке и для статистики.
+    """
+
+    name = "base"
+    available = True
+
+    def complete(self, kind: str, messages: List[Dict], temperature: float, max_tokens: int) -> Completion:
+        """Возвращает ответ модели целиком"""
+        raise NotImplementedError
+
+    def stream(self, kind: str, messages: List[Dict], temperature: float,
+               max_tokens: int) -> Iterator[Union[str, Usage]]:
+        """
+        Возвращает ответ модели по частям
+
+        Yields:
+            Куски текста; последним может прийти Usage с расходом токенов
+        """
+        completion = self.complete(kind, messages, temperature, max_tokens)
+        yield completion.text
+        if completion.usage:
+            yield completion.usage
+
+
+class RuleBasedProvider(AIProvider):
+    """Без модели: AIClient использует ключевые слова, простой парсинг и заготовки"""
+
+    name = "rules"
+    available = False
+
+
+class OpenAIProvider(AIProvider):
+    """OpenAI API (и любые совместимые с ним серверы)"""
+
+    name = "openai"
+
+    def __init__(self, api_key: str, model: str, base_url: Optional[str] = None, timeout: Optional[float] = None):
+        self.model = model
+        self.client = None
+        OpenAI = _import_openai() if api_key else None
+        if OpenAI is not None:
+            try:
+                self.client = OpenAI(api_key=api_key, base_url=base_url, timeout=timeout)
+            except Exception as e:
+                print(f"Не удалось создать клиент {self.name}: {e}")
+        self.available = self.client is not None
+
+    def complete(self, kind: str, messages: List[Dict], temperature: float, max_tokens: int) -> Completion:
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens
+        )
+        usage = None
+        if response.usage is not None:
+            usage = Usage(response.usage.prompt_tokens or 0, response.usage.completion_tokens or 0)
+        return Completion(response.choices[0].message.content, usage)
+
+    def stream(self, kind: str, messages: List[Dict], temperature: float,
+               max_tokens: int) -> Iterator[Union[str, Usage]]:
+        stream = self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=True,
+            # Последний кусок потока придёт с расходом токенов
+            extra_body={"stream_options": {"include_usage": True}}
+        )
+
+        usage = None
+        chunks_count = 0
+        for chunk in stream:
+            usage = getattr(chunk, "usage", None) or usage
+            if not chunk.choices:
+                continue
+            text = chunk.choices[0].delta.content
+            if text:
+                chunks_count += 1
+                yield text
+
+        if usage is not None:
+            # Старые версии библиотеки отдают usage в потоке обычным словарём
+            if isinstance(usage, dict):
+                yield Usage(usage.get("prompt_tokens") or 0, usage.get("completion_tokens") or 0)
+            else:
+                yield Usage(usage.prompt_tokens or 0, usage.completion_tokens or 0)
+        elif chunks_count:
+            # Расход не пришёл - считаем по куску на токен
+            yield Usage(0, chunks_count)
+
+
+class LocalModelProvider(OpenAIProvider):
+    """Локальный сервер модели с OpenAI-совместимым API (llama.cpp, vLLM, Ollama и т.п.)"""
+
+    name = "local"
+
+    def __init__(self, base_url: str, model: str, timeout: float):
+        # Локальным серверам ключ не нужен, но клиенту OpenAI он обязателен
+        super().__init__(api_key="local", model=model, base_url=base_url, timeout=timeout)
+        self.available = self.available and bool(base_url)
+
+
+class StubProvider(AIProvider):
+    """
+    Детерминированная заглушка для нагрузочных тестов без сети
+
+    Ответ зависит только от текста запроса, задержка и ошибки настраиваются.
+    Потоковый ответ укладывается в ту же задержку, что и обычный: часть её -
+    до первого слова, остальное делится между словами.
+    """
+
+    name = "stub"
+    # Доля задержки до первого слова в потоковом ответе
+    first_token_share = 0.3
+
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0, error_rate: float = 0.0, seed: int = 0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def complete(self, kind: str, messages: List[Dict], temperature: float, max_tokens: int) -> Completion:
+        self._simulate()
+        prompt = messages[-1]["content"]
+        text = self._answer(kind, prompt)
+        return Completion(text, Usage(self._count_tokens(messages), self._count_tokens([{"content": text}])))
+
+    def stream(self, kind: str, messages: List[Dict], temperature: float,
+               max_tokens: int) -> Iterator[Union[str, Usage]]:
+        text = self._answer(kind, messages[-1]["content"])
+        words = text.split(" ")
+        share = self.first_token_share if len(words) > 1 else 1.0
+        delay = self._simulate(share)
+        word_delay = delay * (1 - share) / 1000 / max(1, len(words) - 1)
+        for i, word in enumerate(words):
+            if i:
+                time.sleep(word_delay)
+            yield word if i == 0 else " " + word
+        yield Usage(self._count_tokens(messages), self._count_tokens([{"content": text}]))
+
+    def _simulate(self, share: float = 1.0) -> float:
+        """
+        Задержка и случайная ошибка (последовательность зависит только от seed)
+
+        Args:
+            share: Какую долю задержки выждать сейчас (остальное выжидает потоковая выдача)
+
+        Returns:
+            Полная задержка запроса, мс
+        """
+        with self._lock:
+            delay = max(0.0, self.latency_ms + self._random.uniform(-self.jitter_ms, self.jitter_ms))
+            failed = self._random.random() < self.error_rate
+        if delay > 0:
+            time.sleep(delay * share / 1000)
+        if failed:
+            raise ProviderError("Заглушка: смоделированная ошибка провайдера")
+        return delay
+
+    @staticmethod
+    def _answer(kind: str, prompt: str) -> str:
+        """Правдоподобный ответ нужного формата"""
+        if kind == "parse_batch":
+            match = re.search(r'Доступные категории: (.*)', prompt)
+            categories = [c.strip() for c in match.group(1).split(",")] if match else ["Работа"]
+            tasks = re.findall(r'^\d+\. (.*)$', prompt.split("Задачи:", 1)[-1], re.MULTILINE)
+            return json.dumps([{
+                "title": task_text[:200],
+                "category": categories[zlib.crc32(task_text.encode("utf-8")) % len(categories)],
+                "current_progress": None,
+                "target_progress": None,
+                "deadline": None
+            } for task_text in tasks], ensure_ascii=False)
+
+        match = re.search(r'Задача: "(.*)"', prompt, re.DOTALL)
+        task_text = match.group(1) if match else prompt
+        checksum = zlib.crc32(task_text.encode("utf-8"))
+
+        if kind == "categorize":
+            match = re.search(r'Доступные категории: (.*)', prompt)
+            categories = [c.strip() for c in match.group(1).split(",")] if match else []
+            return categories[checksum % len(categories)] if categories else "Работа"
+
+        if kind == "parse":
+            return json.dumps({
+                "title": task_text[:200],
+                "current_progress": None,
+                "target_progress": None,
+                "deadline": None
+            }, ensure_ascii=False)
+
+        return f"Засчитано! Стаб-мотивация №{checksum % 100} 🤖"
+
+    @staticmethod
+    def _count_tokens(messages: List[Dict]) -> int:
+        """Грубая оценка числа токенов"""
+        return sum(len(m["content"]) for m in messages) // 4 + 1
+
+
+def create_provider(name: str) -> AIProvider:
+    """
+    Создаёт провайдер по имени
+
+    Args:
+        name: "openai", "local", "stub" или "rules"
+
+    Returns:
+        Провайдер
+    """
+    if name == "openai":
+        return OpenAIProvider(settings.OPENAI_API_KEY, settings.OPENAI_MODEL)
+    if name == "local":
+        return LocalModelProvider(settings.LOCAL_AI_URL, settings.LOCAL_AI_MODEL, settings.LOCAL_AI_TIMEOUT)
+    if name == "stub":
+        return StubProvider(
+            latency_ms=settings.STUB_AI_LATENCY_MS,
+            jitter_ms=settings.STUB_AI_JITTER_MS,
+            error_rate=settings.STUB_AI_ERROR_RATE,
+            seed=settings.STUB_AI_SEED
+        )
+    if name == "rules":
+        return RuleBasedProvider()
+    raise ValueError(f"Неизвестный провайдер ИИ: {name}")
+
+
+_provider: Optional[AIProvider] = None
+
+
+def get_provider() -> AIProvider:
+    """Текущий провайдер (создаётся при первом обращении по настройке AI_PROVIDER)"""
+    global _provider
+    if _provider is None:
+        name = settings.AI_PROVIDER or ("openai" if settings.OPENAI_API_KEY else "rules")
+        _provider = create_provider(name)
+    return _provider
+
+
+def set_provider(provider: Optional[AIProvider]):
+    """Подменяет провайдер (для бенчмарков и сравнения провайдеров); None - вернуть по настройкам"""
+    global _provider
+    _provider = provider
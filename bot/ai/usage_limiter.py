@@ -0,0 +1,166 @@
+"""
+Лимиты запросов к ИИ и учёт расхода токенов по пользователям
+"""
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, date
+from typing import Optional, Dict, Tuple
+from bot.database.db import SessionLocal, upsert
+from bot.database.models import AIUsage
+from config.settings import settings
+
+
+class TokenBucket:
+    """Ведро токенов: не больше capacity запросов подряд, дальше - по мере пополнения"""
+
+    def __init__(self, capacity: float, refill_per_second: float):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def consume(self, amount: float = 1.0) -> bool:
+        """
+        Забирает токены из ведра
+
+        Args:
+            amount: Сколько токенов нужно
+
+        Returns:
+            True, если токенов хватило
+        """
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.refill_per_second)
+        self.updated_at = now
+
+        if self.tokens >= amount:
+            self.tokens -= amount
+            return True
+        return False
+
+    def is_full(self, now: float) -> bool:
+        """Ведро уже пополнилось до capacity - оно ничем не отличается от нового"""
+        return self.tokens + (now - self.updated_at) * self.refill_per_second >= self.capacity
+
+
+class AIUsageLimiter:
+    """
+    Решает, можно ли пользователю обратиться к ИИ, и ведёт учёт токенов
+
+    Вёдра хранятся в порядке последнего обращения: полные вёдра (пользователь
+    давно не обращался) и самые старые сверх max_buckets удаляются - при
+    следующем запросе пользователь получит новое, такое же полное ведро.
+    """
+
+    def __init__(self, max_buckets: int = 100000):
+        self._lock = threading.Lock()
+        self.max_buckets = max_buckets
+        self._buckets: "OrderedDict[int, TokenBucket]" = OrderedDict()
+        # (user_id, день) -> потрачено токенов; подгружается из БД при первом обращении
+        self._daily_tokens: Dict[Tuple[int, date], int] = {}
+        self._day: Optional[date] = None
+
+    def allow(self, user_id: Optional[int]) -> bool:
+        """
+        Проверяет дневной бюджет и ограничение частоты запросов
+
+        Args:
+            user_id: ID пользователя в БД (None - без лимитов, например для служебных вызовов)
+
+        Returns:
+            True, если можно идти в API; иначе нужно использовать правила
+        """
+        if user_id is None:
+            return True
+
+        today = datetime.utcnow().date()
+        budget = settings.AI_DAILY_TOKEN_BUDGET
+        if budget > 0 and self._get_daily_tokens(user_id, today) >= budget:
+            return False
+
+        with self._lock:
+            self._prune_buckets(time.monotonic())
+            bucket = self._buckets.get(user_id)
+            if bucket is None:
+                bucket = TokenBucket(
+                    capacity=settings.AI_RATE_LIMIT_BURST,
+                    refill_per_second=settings.AI_RATE_LIMIT_PER_MINUTE / 60
+                )
+                self._buckets[user_id] = bucket
+            self._buckets.move_to_end(user_id)
+            return bucket.consume()
+
+    def _prune_buckets(self, now: float):
+        """Удаляет давно не использованные вёдра (вызывается под блокировкой)"""
+        while self._buckets:
+            user_id, bucket = next(iter(self._buckets.items()))
+            if not bucket.is_full(now) and len(self._buckets) <= self.max_buckets:
+                break
+            self._buckets.popitem(last=False)
+
+    def record(self, user_id: Optional[int], prompt_tokens: int, completion_tokens: int):
+        """
+        Записывает расход токенов за сегодня (в память и в БД)
+
+        Args:
+            user_id: ID пользователя в БД
+            prompt_tokens: Токены запроса
+            completion_tokens: Токены ответа
+        """
+        if user_id is None:
+            return
+
+        today = datetime.utcnow().date()
+        self._get_daily_tokens(user_id, today)
+        with self._lock:
+            self._daily_tokens[(user_id, today)] += prompt_tokens + completion_tokens
+
+        db = SessionLocal()
+        try:
+            # Один запрос без гонки между процессами; в ответ - итог за день
+            row = upsert(
+                db, AIUsage,
+                {"user_id": user_id, "day": today, "requests": 1,
+                 "prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens},
+                conflict=["user_id", "day"],
+                update={
+                    "requests": AIUsage.requests + 1,
+                    "prompt_tokens": lambda excluded: AIUsage.prompt_tokens + excluded.prompt_tokens,
+                    "completion_tokens": lambda excluded: AIUsage.completion_tokens + excluded.completion_tokens,
+                },
+                returning=[AIUsage.prompt_tokens, AIUsage.completion_tokens]
+            )
+            db.commit()
+            if row is not None:
+                # В БД могли писать и другие процессы - берём их итог
+                with self._lock:
+                    self._daily_tokens[(user_id, today)] = row.prompt_tokens + row.completion_tokens
+        except Exception as e:
+            db.rollback()
+            print(f"Ошибка при учёте токенов ИИ: {e}")
+        finally:
+            db.close()
+
+    def _get_daily_tokens(self, user_id: int, day: date) -> int:
+        """Расход токенов пользователя за день (кэшируется в памяти)"""
+        with self._lock:
+            if self._day != day:
+                # Наступил новый день - старые счётчики больше не нужны
+                self._daily_tokens.clear()
+                self._day = day
+            if (user_id, day) in self._daily_tokens:
+                return self._daily_tokens[(user_id, day)]
+
+        db = SessionLocal()
+        try:
+            usage = db.query(AIUsage).filter(AIUsage.user_id == user_id, AIUsage.day == day).first()
+            used = (usage.prompt_tokens + usage.completion_tokens) if usage else 0
+        finally:
+            db.close()
+
+        with self._lock:
+            return self._daily_tokens.setdefault((user_id, day), used)
+
+
+usage_limiter = AIUsageLimiter()
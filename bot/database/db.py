@@ -1,80 +1,403 @@
 """
 Инициализация и управление базой данных
 """
-from sqlalchemy import create_engine
+import hashlib
+import json
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy import create_engine, delete, event, func, inspect, select, text, update, insert as insert_statement, BigInteger, String
+from sqlalchemy.engine import Engine, make_url, URL
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.schema import CreateIndex, CreateTable
 from sqlalchemy.orm import sessionmaker, Session
 from pathlib import Path
 from config.settings import settings
-from bot.database.models import Base, Category, Achievement
+from bot.database.models import Base, Category, Achievement, User, UserAchievement, SchemaInfo, TaskLog
+from bot.utils.metrics import DB_QUERIES
+from bot.utils.request_context import get_update_context
+from bot.utils.sql_profiler import sql_profiler
 
-# Создаём директорию для БД, если её нет
-db_path = Path(settings.DATABASE_URL.replace("sqlite:///", ""))
-if db_path.parent != Path("."):
-    db_path.parent.mkdir(parents=True, exist_ok=True)
+database_url = make_url(settings.DATABASE_URL)
+IS_SQLITE = database_url.get_backend_name() == "sqlite"
+IS_POSTGRES = database_url.get_backend_name() == "postgresql"
 
-engine = create_engine(settings.DATABASE_URL, echo=False)
+
+def create_db_engine(url: URL) -> Engine:
+    """
+    Создаёт движок с настройками под бэкенд
+
+    SQLite: создаёт папку под файл БД и включает WAL (читатели не ждут писателя).
+    PostgreSQL: пул соединений, проверка соединения перед выдачей из пула
+    и ограничение времени выполнения запроса.
+    """
+    backend = url.get_backend_name()
+
+    if backend == "sqlite":
+        if url.database and url.database != ":memory:":
+            # Создаём директорию для БД, если её нет
+            Path(url.database).parent.mkdir(parents=True, exist_ok=True)
+        sqlite_engine = create_engine(url, echo=False, connect_args={"timeout": settings.DB_LOCK_TIMEOUT})
+
+        @event.listens_for(sqlite_engine, "connect")
+        def _set_sqlite_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=NORMAL")
+            cursor.close()
+
+        return sqlite_engine
+
+    options = {
+        "echo": False,
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        # Соединение, оборванное сервером или балансировщиком, заменяется до выдачи
+        "pool_pre_ping": True,
+    }
+    if backend == "postgresql" and settings.DB_STATEMENT_TIMEOUT_MS > 0:
+        options["connect_args"] = {"options": f"-c statement_timeout={settings.DB_STATEMENT_TIMEOUT_MS}"}
+    return create_engine(url, **options)
+
+
+engine = create_db_engine(database_url)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
-def init_db():
-    """Инициализация базы данных"""
+@event.listens_for(engine, "before_cursor_execute")
+def _start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+@event.listens_for(engine, "after_cursor_execute")
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_started"].pop()
+    DB_QUERIES.inc()
+    # Запросы относим к обновлению, внутри которого они выполнены
+    update_context = get_update_context()
+    if update_context is not None:
+        update_context.db_queries += 1
+        update_context.db_seconds += elapsed
+    if sql_profiler.enabled:
+        sql_profiler.record(update_context, statement, parameters, elapsed)
+
+
+@event.listens_for(engine, "handle_error")
+def _drop_query_timer(exception_context):
+    # Запрос упал - after_cursor_execute не будет, убираем его отметку времени
+    connection = exception_context.connection
+    if connection is not None and connection.info.get("query_started"):
+        connection.info["query_started"].pop()
+
+
+# Базовые ачивки (добавляются при инициализации БД, если их ещё нет)
+DEFAULT_ACHIEVEMENTS = [
+    {
+        "name": "Железный",
+        "description": "Серия 7 дней без пропусков",
+        "emoji": "🔥",
+        "condition_type": "streak",
+        "condition_value": "7",
+        "xp_reward": 50
+    },
+    {
+        "name": "Манимейкер",
+        "description": "10 закрытых задач по работе",
+        "emoji": "💰",
+        "condition_type": "category_tasks",
+        "condition_value": '{"category": "Работа", "count": 10}',
+        "xp_reward": 30
+    },
+    {
+        "name": "Боец",
+        "description": "5 тренировок подряд",
+        "emoji": "💪",
+        "condition_type": "category_streak",
+        "condition_value": '{"category": "Тренировки", "streak": 5}',
+        "xp_reward": 40
+    },
+    {
+        "name": "Гроссмейстер внимания",
+        "description": "Достиг цели по блогу",
+        "emoji": "👑",
+        "condition_type": "category_goal",
+        "condition_value": '{"category": "Блог"}',
+        "xp_reward": 60
+    }
+]
+
+SCHEMA_FINGERPRINT_KEY = "schema_fingerprint"
+
+
+def schema_fingerprint() -> str:
+    """
+    Отпечаток схемы и начальных данных
+
+    Меняется при изменении моделей (таблицы, колонки, индексы), категорий
+    по умолчанию или базовых ачивок - тогда init_db снова проверяет схему.
+    """
+    digest = hashlib.sha256()
+    for table in Base.metadata.sorted_tables:
+        digest.update(str(CreateTable(table).compile(dialect=engine.dialect)).encode("utf-8"))
+        for index in sorted(table.indexes, key=lambda index: index.name or ""):
+            digest.update(str(CreateIndex(index).compile(dialect=engine.dialect)).encode("utf-8"))
+    seeds = {"categories": settings.DEFAULT_CATEGORIES, "achievements": DEFAULT_ACHIEVEMENTS}
+    digest.update(json.dumps(seeds, ensure_ascii=False, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _stored_fingerprint() -> Optional[str]:
+    """Отпечаток, записанный при прошлой инициализации (None - БД новая или старая)"""
+    try:
+        with engine.connect() as connection:
+            return connection.execute(
+                select(SchemaInfo.value).where(SchemaInfo.key == SCHEMA_FINGERPRINT_KEY)
+            ).scalar()
+    except DBAPIError:
+        # Таблицы schema_info ещё нет
+        return None
+
+
+def init_db(fast: Optional[bool] = None) -> bool:
+    """
+    Инициализация базы данных
+
+    Args:
+        fast: Пропустить проверку схемы, если отпечаток схемы не изменился
+            (по умолчанию - настройка FAST_START)
+
+    Returns:
+        True, если схема и начальные данные проверялись; False - пропущено по отпечатку
+    """
+    fast = settings.FAST_START if fast is None else fast
+    fingerprint = schema_fingerprint()
+    if fast and _stored_fingerprint() == fingerprint:
+        return False
+
     Base.metadata.create_all(bind=engine)
+    add_missing_columns()
+    migrate_telegram_id_bigint()
+    migrate_task_log_status()
+    dedupe_achievement_names()
+    
+    # create_all не добавляет новые индексы в уже существующие таблицы
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
     
-    # Создаём категории по умолчанию
     db = SessionLocal()
     try:
-        for cat_name in settings.DEFAULT_CATEGORIES:
-            if not db.query(Category).filter(Category.name == cat_name).first():
-                category = Category(name=cat_name)
-                db.add(category)
-        
-        # Создаём базовые ачивки
-        achievements_data = [
-            {
-                "name": "Железный",
-                "description": "Серия 7 дней без пропусков",
-                "emoji": "🔥",
-                "condition_type": "streak",
-                "condition_value": "7",
-                "xp_reward": 50
-            },
-            {
-                "name": "Манимейкер",
-                "description": "10 закрытых задач по работе",
-                "emoji": "💰",
-                "condition_type": "category_tasks",
-                "condition_value": '{"category": "Работа", "count": 10}',
-                "xp_reward": 30
-            },
-            {
-                "name": "Боец",
-                "description": "5 тренировок подряд",
-                "emoji": "💪",
-                "condition_type": "category_streak",
-                "condition_value": '{"category": "Тренировки", "streak": 5}',
-                "xp_reward": 40
-            },
-            {
-                "name": "Гроссмейстер внимания",
-                "description": "Достиг цели по блогу",
-                "emoji": "👑",
-                "condition_type": "category_goal",
-                "condition_value": '{"category": "Блог"}',
-                "xp_reward": 60
-            }
-        ]
-        
-        for ach_data in achievements_data:
-            if not db.query(Achievement).filter(Achievement.name == ach_data["name"]).first():
-                achievement = Achievement(**ach_data)
-                db.add(achievement)
-        
+        # Категории по умолчанию и базовые ачивки - по одной вставке, существующие пропускаются
+        insert_missing(db, Category, [{"name": name} for name in settings.DEFAULT_CATEGORIES], ["name"])
+        insert_missing(db, Achievement, DEFAULT_ACHIEVEMENTS, ["name"])
+        upsert(
+            db, SchemaInfo,
+            {"key": SCHEMA_FINGERPRINT_KEY, "value": fingerprint, "updated_at": datetime.utcnow()},
+            conflict=["key"],
+            update={"value": fingerprint, "updated_at": datetime.utcnow()}
+        )
         db.commit()
     except Exception as e:
         db.rollback()
         print(f"Ошибка при инициализации БД: {e}")
     finally:
         db.close()
+    return True
+
+
+def add_missing_columns():
+    """
+    Добавляет в существующие таблицы новые колонки моделей (create_all их не добавляет)
+
+    Добавляются только колонки, допускающие NULL: старым строкам значение взять неоткуда.
+    """
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    quote = engine.dialect.identifier_preparer.quote
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            present = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in present:
+                    continue
+                if not column.nullable:
+                    print(f"Колонку {table.name}.{column.name} (NOT NULL) нужно добавить вручную")
+                    continue
+                ddl = f"ALTER TABLE {quote(table.name)} ADD COLUMN {quote(column.name)} {column.type.compile(dialect=engine.dialect)}"
+                for foreign_key in column.foreign_keys:
+                    ddl += f" REFERENCES {quote(foreign_key.column.table.name)} ({quote(foreign_key.column.name)})"
+                conn.execute(text(ddl))
+                print(f"Добавлена колонка {table.name}.{column.name}")
+
+
+def migrate_telegram_id_bigint():
+    """
+    Расширяет users.telegram_id до BIGINT, если база создана до этого
+
+    В SQLite INTEGER и так 64-битный; PostgreSQL меняет тип колонки на месте.
+    """
+    if IS_SQLITE:
+        return
+    columns = {column["name"]: column for column in inspect(engine).get_columns(User.__tablename__)}
+    if isinstance(columns["telegram_id"]["type"], BigInteger):
+        return
+    with engine.begin() as conn:
+        conn.execute(text("ALTER TABLE users ALTER COLUMN telegram_id TYPE BIGINT"))
+    print("Колонка users.telegram_id переведена в BIGINT")
+
+
+def dedupe_achievement_names():
+    """
+    Убирает ачивки с одинаковым именем перед созданием уникального индекса
+
+    Раньше базовые ачивки добавлялись проверкой и вставкой, и два процесса,
+    запущенные одновременно, могли вставить одну и ту же дважды. Остаётся копия
+    с наименьшим id: полученные пользователями копии переводятся на неё,
+    повторные записи одной ачивки у пользователя удаляются.
+    """
+    with engine.begin() as conn:
+        groups = conn.execute(
+            select(Achievement.name, func.min(Achievement.id)).group_by(Achievement.name).having(func.count() > 1)
+        ).all()
+        if not groups:
+            return
+        for name, keep_id in groups:
+            duplicate_ids = select(Achievement.id).where(Achievement.name == name, Achievement.id != keep_id)
+            conn.execute(
+                update(UserAchievement).where(UserAchievement.achievement_id.in_(duplicate_ids)).values(achievement_id=keep_id)
+            )
+            conn.execute(delete(Achievement).where(Achievement.id.in_(duplicate_ids)))
+        kept_ids = [keep_id for _, keep_id in groups]
+        first_unlocks = select(func.min(UserAchievement.id)).where(
+            UserAchievement.achievement_id.in_(kept_ids)
+        ).group_by(UserAchievement.user_id, UserAchievement.achievement_id)
+        conn.execute(delete(UserAchievement).where(
+            UserAchievement.achievement_id.in_(kept_ids),
+            UserAchievement.id.notin_(first_unlocks)
+        ))
+    print(f"Удалены повторы ачивок: {', '.join(name for name, _ in groups)}")
+
+
+def migrate_task_log_status():
+    """
+    Переводит task_logs.status из строки в число (TaskStatus), если база создана до этого
+
+    PostgreSQL меняет тип колонки на месте; SQLite так не умеет -
+    таблица пересоздаётся с переносом записей.
+    """
+    columns = {column["name"]: column for column in inspect(engine).get_columns(TaskLog.__tablename__)}
+    if not isinstance(columns["status"]["type"], String):
+        return
+    # Других статусов код не пишет; неизвестный считаем пропуском
+    status_code = "CASE status WHEN 'completed' THEN 1 ELSE 2 END"
+    with engine.begin() as conn:
+        if IS_SQLITE:
+            conn.execute(text("ALTER TABLE task_logs RENAME TO task_logs_old"))
+            # Имена индексов общие для базы - освобождаем их для новой таблицы
+            for index in inspect(conn).get_indexes("task_logs_old"):
+                conn.execute(text(f'DROP INDEX IF EXISTS "{index["name"]}"'))
+            TaskLog.__table__.create(conn)
+            conn.execute(text(
+                "INSERT INTO task_logs (id, user_id, task_id, status, xp_earned, points_earned, created_at) "
+                f"SELECT id, user_id, task_id, {status_code}, xp_earned, points_earned, created_at FROM task_logs_old"
+            ))
+            conn.execute(text("DROP TABLE task_logs_old"))
+        else:
+            conn.execute(text(f"ALTER TABLE task_logs ALTER COLUMN status TYPE SMALLINT USING {status_code}"))
+    print("Колонка task_logs.status переведена в числовые коды")
+
+
+def insert_missing(db: Session, model, rows: List[Dict[str, Any]], conflict: List[str]):
+    """
+    Вставляет строки одним запросом, пропуская те, что уже есть (по уникальному ключу conflict)
+
+    На бэкендах без ON CONFLICT - одна выборка существующих ключей и вставка остальных.
+    """
+    if not rows:
+        return
+    if IS_POSTGRES or IS_SQLITE:
+        if IS_POSTGRES:
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        db.execute(insert(model).values(rows).on_conflict_do_nothing(index_elements=conflict))
+        return
+
+    key_columns = [getattr(model, name) for name in conflict]
+    existing = set(tuple(row) for row in db.query(*key_columns).all())
+    missing = [row for row in rows if tuple(row[name] for name in conflict) not in existing]
+    if missing:
+        db.execute(insert_statement(model), missing)
+
+
+def upsert(db: Session, model, values: Dict[str, Any], conflict: List[str],
+           update: Optional[Dict[str, Any]] = None, returning: Optional[List] = None, where=None):
+    """
+    INSERT ... ON CONFLICT одним запросом (PostgreSQL и SQLite)
+
+    Args:
+        db: Сессия БД
+        model: Модель
+        values: Значения новой строки
+        conflict: Колонки уникального ключа
+        update: Что обновить при конфликте; значения - выражения над
+            колонками модели или функции от excluded (значений новой строки).
+            None - при конфликте ничего не делать
+        returning: Колонки для RETURNING
+        where: Условие обновления при конфликте (не выполнено - строка не меняется)
+
+    Returns:
+        Строка RETURNING (None, если строка не вставлена и не обновлена) или None без returning
+    """
+    if IS_POSTGRES:
+        from sqlalchemy.dialects.postgresql import insert
+    elif IS_SQLITE:
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise NotImplementedError(f"upsert не поддерживается для {database_url.get_backend_name()}")
+
+    statement = insert(model).values(**values)
+    if update:
+        set_ = {key: value(statement.excluded) if callable(value) else value for key, value in update.items()}
+        statement = statement.on_conflict_do_update(index_elements=conflict, set_=set_, where=where)
+    else:
+        statement = statement.on_conflict_do_nothing(index_elements=conflict)
+
+    if returning:
+        return db.execute(statement.returning(*returning)).first()
+    db.execute(statement)
+    return None
+
+
+def get_or_create_user(db: Session, telegram_id: int, username: Optional[str],
+                       first_name: Optional[str]) -> Tuple[User, bool]:
+    """
+    Находит пользователя по Telegram ID или создаёт его
+
+    Два одновременных /start (или воркера) не создадут дубликат и не упадут
+    на уникальном ключе: вставка идёт через ON CONFLICT DO NOTHING.
+
+    Returns:
+        (пользователь, создан ли он сейчас)
+    """
+    db_user = db.query(User).filter(User.telegram_id == telegram_id).first()
+    if db_user:
+        return db_user, False
+
+    row = upsert(
+        db, User,
+        {"telegram_id": telegram_id, "username": username, "first_name": first_name},
+        conflict=["telegram_id"],
+        returning=[User.id]
+    )
+    db.commit()
+    if row is not None:
+        return db.get(User, row.id), True
+    return db.query(User).filter(User.telegram_id == telegram_id).first(), False
 
 
 def get_db() -> Session:
@@ -0,0 +1,267 @@
+"""
+Выгрузка истории пользователей для аналитики
+
+Таблицы читаются одним запросом с потоковой выдачей строк порциями
+(yield_per: на PostgreSQL - серверный курсор, на SQLite - fetchmany),
+каждая порция сразу дописывается в файл - все строки в памяти не собираются.
+Форматы: Parquet и Arrow IPC (нужен pyarrow) или CSV.
+
+Выгрузка инкрементальная: для каждой таблицы запоминается наибольший
+выгруженный id (водяной знак), следующий запуск читает только строки после него.
+Задачи после создания меняются (выполнена, неактивна), но изменения
+видны в task_logs; полная копия tasks - с full=True.
+
+На SQLite запись идёт по одной транзакции, id фиксируются по порядку. На PostgreSQL
+id берутся из последовательности и строка с меньшим id может зафиксироваться
+позже: поэтому последние EXPORT_OVERLAP_IDS id перед водяным знаком читаются
+снова, а уже выгруженные из них (они запоминаются) пропускаются. Строка,
+опоздавшая больше чем на столько id, в инкрементальную выгрузку не попадёт.
+"""
+import csv
+import gzip
+import json
+import os
+import time
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Optional
+from sqlalchemy import Boolean, Date, DateTime, Float, Integer, select
+from sqlalchemy.orm import Session
+from bot.database.db import IS_SQLITE, SessionLocal
+from bot.database.models import Task, TaskLog, UserAchievement, TaskStatus
+from config.settings import settings
+
+EXPORT_TABLES = {model.__tablename__: model for model in (Task, TaskLog, UserAchievement)}
+
+FORMATS = ("parquet", "arrow", "csv")
+
+EXTENSIONS = {"parquet": "parquet", "arrow": "arrow", "csv": "csv.gz"}
+
+
+def load_pyarrow():
+    """
+    pyarrow - необязательная зависимость
+
+    Returns:
+        Модуль pyarrow или None, если он не установлен
+    """
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        return None
+    return pyarrow
+
+
+def default_format() -> str:
+    return "parquet" if load_pyarrow() is not None else "csv"
+
+
+class ExportState:
+    """
+    Водяные знаки выгрузки (JSON: таблица -> наибольший выгруженный id
+    и уже выгруженные id из перекрытия перед ним)
+
+    Args:
+        path: Путь к файлу состояния
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.watermarks: Dict[str, int] = {}
+        self.recent: Dict[str, List[int]] = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for table, value in json.load(f).items():
+                    # Старый формат: только число
+                    if isinstance(value, dict):
+                        self.watermarks[table] = int(value["last_id"])
+                        self.recent[table] = [int(row_id) for row_id in value.get("recent", [])]
+                    else:
+                        self.watermarks[table] = int(value)
+
+    def get(self, table: str) -> int:
+        return self.watermarks.get(table, 0)
+
+    def get_recent(self, table: str) -> List[int]:
+        return self.recent.get(table, [])
+
+    def set(self, table: str, last_id: int, recent: Iterable[int] = ()):
+        self.watermarks[table] = last_id
+        self.recent[table] = sorted(recent)
+        data = {name: {"last_id": value, "recent": self.recent.get(name, [])} for name, value in self.watermarks.items()}
+        # Через временный файл: оборванная запись не портит состояние
+        temporary = self.path + ".tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2, sort_keys=True)
+        os.replace(temporary, self.path)
+
+
+class CSVWriter:
+    """Запись порций в CSV (сжатый gzip)"""
+
+    def __init__(self, path: str, columns: List[str]):
+        self.file = gzip.open(path, "wt", encoding="utf-8", newline="")
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(columns)
+
+    def write(self, rows: List[tuple]):
+        self.writer.writerows(
+            [[value.isoformat() if isinstance(value, (date, datetime)) else value for value in row] for row in rows]
+        )
+
+    def close(self):
+        self.file.close()
+
+
+class ArrowWriter:
+    """Запись порций в Parquet (группа строк на порцию) или Arrow IPC (пакет на порцию)"""
+
+    def __init__(self, path: str, model, columns: List[str], file_format: str):
+        self.pa = load_pyarrow()
+        self.schema = self.pa.schema([(name, self._arrow_type(model.__table__.c[name].type)) for name in columns])
+        self.columns = columns
+        if file_format == "parquet":
+            self.writer = self.pa.parquet.ParquetWriter(path, self.schema, compression="zstd")
+        else:
+            self.writer = self.pa.ipc.new_file(path, self.schema)
+
+    def _arrow_type(self, column_type):
+        pa = self.pa
+        if isinstance(column_type, TaskStatus):
+            return pa.string()
+        if isinstance(column_type, Integer):
+            return pa.int64()
+        if isinstance(column_type, Float):
+            return pa.float64()
+        if isinstance(column_type, Boolean):
+            return pa.bool_()
+        if isinstance(column_type, DateTime):
+            return pa.timestamp("us")
+        if isinstance(column_type, Date):
+            return pa.date32()
+        return pa.string()
+
+    def write(self, rows: List[tuple]):
+        data = {name: [row[i] for row in rows] for i, name in enumerate(self.columns)}
+        self.writer.write_batch(self.pa.RecordBatch.from_pydict(data, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+def export_table(db: Session, table: str, out_dir: str, file_format: str, since_id: int = 0,
+                 chunk_size: int = 10000, overlap: int = 0, recent: Iterable[int] = ()) -> Dict:
+    """
+    Выгружает строки таблицы с id > since_id в новый файл
+
+    Args:
+        db: Сессия БД
+        table: Имя таблицы (ключ EXPORT_TABLES)
+        out_dir: Папка выгрузки
+        file_format: parquet, arrow или csv
+        since_id: Водяной знак: строки с id не больше него уже выгружены
+        chunk_size: Строк за порцию
+        overlap: Сколько id перед водяным знаком перечитать (строки, зафиксированные позже)
+        recent: Уже выгруженные id из перекрытия - они пропускаются
+
+    Returns:
+        Словарь: path (None, если новых строк нет), rows, last_id,
+        recent (выгруженные id из перекрытия перед новым водяным знаком)
+    """
+    model = EXPORT_TABLES[table]
+    columns = [column.name for column in model.__table__.columns]
+    statement = select(*[getattr(model, name) for name in columns]).where(
+        model.id > max(0, since_id - overlap)
+    ).order_by(model.id).execution_options(yield_per=chunk_size)
+
+    path = _new_path(out_dir, table, EXTENSIONS[file_format])
+    writer = None
+    rows_written, last_id = 0, since_id
+    seen = set(recent)
+    exported_ids: List[int] = []
+    try:
+        for partition in db.execute(statement).partitions():
+            rows = [tuple(row) for row in partition if row[0] > since_id or row[0] not in seen]
+            if not rows:
+                continue
+            if writer is None:
+                os.makedirs(out_dir, exist_ok=True)
+                if file_format == "csv":
+                    writer = CSVWriter(path, columns)
+                else:
+                    writer = ArrowWriter(path, model, columns, file_format)
+            writer.write(rows)
+            rows_written += len(rows)
+            last_id = max(last_id, rows[-1][0])
+            if overlap:
+                exported_ids.extend(row[0] for row in rows)
+    except Exception:
+        if writer is not None:
+            writer.close()
+            os.remove(path)
+        raise
+    recent = [row_id for row_id in seen.union(exported_ids) if row_id > last_id - overlap] if overlap else []
+    if writer is None:
+        return {"path": None, "rows": 0, "last_id": since_id, "recent": recent}
+    writer.close()
+    return {"path": path, "rows": rows_written, "last_id": last_id, "recent": recent}
+
+
+def _new_path(out_dir: str, table: str, extension: str) -> str:
+    """Имя нового файла: время и pid, при совпадении - с номером (запуски в одну секунду)"""
+    base = os.path.join(out_dir, f"{table}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}")
+    path, number = f"{base}.{extension}", 1
+    while os.path.exists(path):
+        path, number = f"{base}-{number}.{extension}", number + 1
+    return path
+
+
+def export_history(tables: Optional[List[str]] = None, out_dir: Optional[str] = None,
+                   file_format: Optional[str] = None, full: bool = False,
+                   chunk_size: Optional[int] = None) -> Dict[str, Dict]:
+    """
+    Выгружает таблицы истории, продвигая водяные знаки
+
+    Водяной знак таблицы записывается только после того, как её файл
+    полностью записан: при сбое следующий запуск повторит выгрузку.
+    На PostgreSQL последние EXPORT_OVERLAP_IDS id перечитываются (см. модуль).
+
+    Args:
+        tables: Какие таблицы (по умолчанию - все из EXPORT_TABLES)
+        out_dir: Папка выгрузки (по умолчанию - EXPORT_DIR)
+        file_format: parquet, arrow или csv (по умолчанию - parquet, без pyarrow - csv)
+        full: Выгрузить всё, не глядя на водяные знаки (знаки всё равно обновятся)
+        chunk_size: Строк за порцию (по умолчанию - EXPORT_CHUNK_SIZE)
+
+    Returns:
+        Отчёт по таблицам (см. export_table)
+    """
+    out_dir = out_dir or settings.EXPORT_DIR
+    file_format = file_format or default_format()
+    if file_format not in FORMATS:
+        raise ValueError(f"Неизвестный формат: {file_format}")
+    if file_format != "csv" and load_pyarrow() is None:
+        raise RuntimeError(f"Для формата {file_format} нужен pyarrow (pip install pyarrow) - или --format csv")
+    chunk_size = chunk_size or settings.EXPORT_CHUNK_SIZE
+    overlap = 0 if IS_SQLITE else max(0, settings.EXPORT_OVERLAP_IDS)
+
+    os.makedirs(out_dir, exist_ok=True)
+    state = ExportState(os.path.join(out_dir, "state.json"))
+    report = {}
+    db = SessionLocal()
+    try:
+        for table in tables or list(EXPORT_TABLES):
+            since_id = 0 if full else state.get(table)
+            recent = [] if full else state.get_recent(table)
+            # Состояние старого формата не знает, что выгружено в перекрытии - без него один раз
+            table_overlap = overlap if full or since_id == 0 or table in state.recent else 0
+            result = export_table(db, table, out_dir, file_format, since_id, chunk_size, table_overlap, recent)
+            # Короткие транзакции: долгий снимок на SQLite мешает контрольной точке WAL
+            db.rollback()
+            if result["rows"]:
+                state.set(table, max(result["last_id"], state.get(table)), result["recent"])
+            report[table] = result
+    finally:
+        db.close()
+    return report
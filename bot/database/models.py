@@ -1,7 +1,8 @@
 """
 Модели базы данных
 """
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Float, ForeignKey, Text
+from sqlalchemy import Column, Integer, BigInteger, SmallInteger, String, Boolean, DateTime, Date, Float, ForeignKey, Text, UniqueConstraint, Index
+from sqlalchemy.types import TypeDecorator
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -14,7 +15,7 @@ class User(Base):
     __tablename__ = "users"
     
     id = Column(Integer, primary_key=True)
-    telegram_id = Column(Integer, unique=True, nullable=False, index=True)
+    telegram_id = Column(BigInteger, unique=True, nullable=False, index=True)  # ID Telegram не влезают в 32 бита
     username = Column(String(255), nullable=True)
     first_name = Column(String(255), nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
@@ -31,6 +32,7 @@ class User(Base):
     achievements = relationship("UserAchievement", back_populates="user", cascade="all, delete-orphan")
     task_logs = relationship("TaskLog", back_populates="user", cascade="all, delete-orphan")
     reminders = relationship("Reminder", back_populates="user", cascade="all, delete-orphan")
+    ai_usage = relationship("AIUsage", back_populates="user", cascade="all, delete-orphan")
 
 
 class Category(Base):
@@ -49,11 +51,21 @@ class Category(Base):
 class Task(Base):
     """Модель задачи"""
     __tablename__ = "tasks"
+    # Постраничный /tasks идёт по (user_id, id)
+    __table_args__ = (
+        Index("ix_tasks_user_id_id", "user_id", "id"),
+        # Один экземпляр привычки на день (повторное создание пропускается)
+        Index("uq_tasks_habit_day", "habit_id", "habit_date", unique=True),
+    )
     
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     category_id = Column(Integer, ForeignKey("categories.id"), nullable=True)
     
+    # Задача - экземпляр привычки на день habit_date (см. bot/gamification/habits.py)
+    habit_id = Column(Integer, ForeignKey("habits.id"), nullable=True)
+    habit_date = Column(Date, nullable=True)
+    
     title = Column(String(500), nullable=False)
     description = Column(Text, nullable=True)
     
@@ -73,18 +85,67 @@ class Task(Base):
     # Связи
     user = relationship("User", back_populates="tasks")
     category = relationship("Category", back_populates="tasks")
+    habit = relationship("HabitTemplate", back_populates="tasks")
     logs = relationship("TaskLog", back_populates="task", cascade="all, delete-orphan")
 
 
+class HabitTemplate(Base):
+    """Привычка: повторяющаяся задача, экземпляры на день создаются по мере надобности"""
+    __tablename__ = "habits"
+    
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    category_id = Column(Integer, ForeignKey("categories.id"), nullable=True)
+    
+    title = Column(String(500), nullable=False)
+    
+    # Расписание: "daily", "weekdays" или "every" (каждые interval_days дней от starts_on)
+    schedule = Column(String(20), nullable=False, default="daily")
+    interval_days = Column(Integer, default=1)
+    starts_on = Column(Date, nullable=False)
+    is_active = Column(Boolean, default=True)
+    
+    # Серия по этой привычке
+    current_streak = Column(Integer, default=0)
+    best_streak = Column(Integer, default=0)
+    last_done_on = Column(Date, nullable=True)
+    
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    # Связи
+    category = relationship("Category")
+    tasks = relationship("Task", back_populates="habit")
+
+
+class TaskStatus(TypeDecorator):
+    """Статус записи лога: в коде - строка ("completed", "missed"), в БД - маленькое число"""
+    
+    impl = SmallInteger
+    cache_ok = True
+    
+    CODES = {"completed": 1, "missed": 2}
+    NAMES = {code: name for name, code in CODES.items()}
+    
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return self.CODES[value]
+    
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return self.NAMES[int(value)]
+
+
 class TaskLog(Base):
-    """Лог выполнения задач"""
+    """Лог выполнения задач (старые записи сворачиваются в TaskLogMonthly, см. bot/database/retention.py)"""
     __tablename__ = "task_logs"
     
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     task_id = Column(Integer, ForeignKey("tasks.id"), nullable=False)
     
-    status = Column(String(20), nullable=False)  # "completed" или "missed"
+    status = Column(TaskStatus, nullable=False)  # "completed" или "missed"
     xp_earned = Column(Integer, default=0)
     points_earned = Column(Integer, default=0)
     
@@ -93,11 +154,34 @@ class TaskLog(Base):
     # Связи
     user = relationship("User", back_populates="task_logs")
     task = relationship("Task", back_populates="logs")
+    
+    __table_args__ = (
+        # Выборка старых записей для свёртки
+        Index("ix_task_logs_created_at", "created_at"),
+    )
+
+
+class TaskLogMonthly(Base):
+    """Итоги свёрнутых записей лога: пользователь, месяц, категория задачи"""
+    __tablename__ = "task_log_monthly"
+    __table_args__ = (UniqueConstraint("user_id", "month", "category_id", name="uq_task_log_monthly"),)
+    
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    month = Column(Date, nullable=False)  # Первое число месяца
+    category_id = Column(Integer, nullable=False, default=0)  # 0 - задача без категории
+    
+    completed = Column(Integer, default=0)
+    missed = Column(Integer, default=0)
+    xp_earned = Column(Integer, default=0)
+    points_earned = Column(Integer, default=0)
 
 
 class Achievement(Base):
     """Модель ачивки"""
     __tablename__ = "achievements"
+    # Уникальное имя: базовые ачивки добавляются одной вставкой с пропуском существующих
+    __table_args__ = (Index("uq_achievements_name", "name", unique=True),)
     
     id = Column(Integer, primary_key=True)
     name = Column(String(200), nullable=False)
@@ -147,3 +231,39 @@ class Reminder(Base):
     # Связи
     user = relationship("User", back_populates="reminders")
 
+
+
+class AIUsage(Base):
+    """Расход токенов ИИ пользователем за день"""
+    __tablename__ = "ai_usage"
+    __table_args__ = (UniqueConstraint("user_id", "day", name="uq_ai_usage_user_day"),)
+    
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    day = Column(Date, nullable=False)
+    
+    requests = Column(Integer, default=0)
+    prompt_tokens = Column(Integer, default=0)
+    completion_tokens = Column(Integer, default=0)
+    
+    # Связи
+    user = relationship("User", back_populates="ai_usage")
+
+
+class SchedulerLease(Base):
+    """Аренда роли ведущего: задачи планировщика выполняет только её держатель"""
+    __tablename__ = "scheduler_leases"
+    
+    name = Column(String(50), primary_key=True)
+    holder = Column(String(255), nullable=False)  # ID реплики
+    expires_at = Column(DateTime, nullable=False)
+    renewed_at = Column(DateTime, nullable=False)
+
+
+class SchemaInfo(Base):
+    """Служебные значения схемы БД (отпечаток схемы для быстрого старта)"""
+    __tablename__ = "schema_info"
+    
+    key = Column(String(50), primary_key=True)
+    value = Column(String(255), nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
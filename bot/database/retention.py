@@ -0,0 +1,146 @@
+"""
+Хранение лога задач: свёртка старых записей
+
+task_logs растёт на каждое нажатие "выполнено"/"пропущено", но отдельные
+записи нужны только за последние недели (/stats, серии, недельный рейтинг).
+Записи старше TASK_LOG_RETENTION_DAYS сворачиваются в помесячные итоги
+(TaskLogMonthly: пользователь, месяц, категория), сами записи дописываются
+в сжатый архив (JSON Lines в .gz) и удаляются из таблицы.
+"""
+import gzip
+import json
+import os
+import time
+from datetime import date, datetime, timedelta
+from typing import Dict, Optional, Tuple
+from sqlalchemy import delete, text
+from sqlalchemy.orm import Session
+from bot.database.db import IS_SQLITE, SessionLocal, engine, upsert
+from bot.database.models import Task, TaskLog, TaskLogMonthly
+from config.settings import settings
+
+# /stats считает записи за 30 дней - их сворачивать нельзя
+MIN_RETENTION_DAYS = 35
+
+
+def retention_cutoff(now: Optional[datetime] = None) -> Optional[datetime]:
+    """
+    Граница свёртки: записи старше неё сворачиваются
+
+    Returns:
+        None, если свёртка выключена (TASK_LOG_RETENTION_DAYS = 0)
+    """
+    days = settings.TASK_LOG_RETENTION_DAYS
+    if days <= 0:
+        return None
+    now = now or datetime.utcnow()
+    return now - timedelta(days=max(days, MIN_RETENTION_DAYS))
+
+
+def compact_task_logs(db: Optional[Session] = None, before: Optional[datetime] = None,
+                      archive_dir: Optional[str] = None, batch_size: Optional[int] = None,
+                      dry_run: bool = False) -> Dict[str, int]:
+    """
+    Сворачивает записи лога старше before в помесячные итоги
+
+    Записи читаются порциями по возрастанию id; каждая порция - одна транзакция:
+    итоги прибавляются к уже свёрнутым (upsert), записи удаляются. В архив порция
+    пишется до удаления, поэтому при сбое запись может попасть в архив дважды,
+    но не потеряется.
+
+    Args:
+        db: Сессия БД (по умолчанию - новая)
+        before: Граница (по умолчанию - retention_cutoff())
+        archive_dir: Папка архива (по умолчанию - TASK_LOG_ARCHIVE_DIR; "" - без архива)
+        batch_size: Записей за порцию (по умолчанию - TASK_LOG_COMPACT_BATCH)
+        dry_run: Только посчитать, ничего не менять
+
+    Returns:
+        Словарь: logs (свёрнуто записей), summaries (затронуто итоговых строк), batches
+    """
+    report = {"logs": 0, "summaries": 0, "batches": 0}
+    before = before or retention_cutoff()
+    if before is None:
+        return report
+    archive_dir = settings.TASK_LOG_ARCHIVE_DIR if archive_dir is None else archive_dir
+    batch_size = batch_size or settings.TASK_LOG_COMPACT_BATCH
+
+    own_session = db is None
+    if own_session:
+        db = SessionLocal()
+
+    archive = None
+    last_id = 0
+    try:
+        while True:
+            rows = db.query(
+                TaskLog.id, TaskLog.user_id, TaskLog.task_id, TaskLog.status,
+                TaskLog.xp_earned, TaskLog.points_earned, TaskLog.created_at, Task.category_id
+            ).outerjoin(Task, TaskLog.task_id == Task.id).filter(
+                TaskLog.id > last_id,
+                TaskLog.created_at < before
+            ).order_by(TaskLog.id).limit(batch_size).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+
+            totals: Dict[Tuple[int, date, int], Dict[str, int]] = {}
+            for row in rows:
+                key = (row.user_id, row.created_at.date().replace(day=1), row.category_id or 0)
+                bucket = totals.setdefault(key, {"completed": 0, "missed": 0, "xp_earned": 0, "points_earned": 0})
+                bucket[row.status] += 1
+                bucket["xp_earned"] += row.xp_earned or 0
+                bucket["points_earned"] += row.points_earned or 0
+
+            report["logs"] += len(rows)
+            report["summaries"] += len(totals)
+            report["batches"] += 1
+            if dry_run:
+                continue
+
+            if archive_dir:
+                if archive is None:
+                    archive = _open_archive(archive_dir)
+                for row in rows:
+                    archive.write(json.dumps({
+                        "id": row.id, "user_id": row.user_id, "task_id": row.task_id, "status": row.status,
+                        "xp_earned": row.xp_earned, "points_earned": row.points_earned,
+                        "created_at": row.created_at.isoformat(),
+                    }, ensure_ascii=False).encode("utf-8") + b"\n")
+                # Порция должна быть в файле до удаления из БД
+                archive.flush()
+
+            for (user_id, month, category_id), bucket in totals.items():
+                upsert(
+                    db, TaskLogMonthly,
+                    {"user_id": user_id, "month": month, "category_id": category_id, **bucket},
+                    conflict=["user_id", "month", "category_id"],
+                    update={
+                        field: (lambda excluded, field=field: getattr(TaskLogMonthly, field) + getattr(excluded, field))
+                        for field in bucket
+                    }
+                )
+            db.execute(delete(TaskLog).where(TaskLog.id.in_([row.id for row in rows])))
+            db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        if archive is not None:
+            archive.close()
+        if own_session:
+            db.close()
+    return report
+
+
+def _open_archive(archive_dir: str):
+    """Новый файл архива на каждый запуск свёртки"""
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, f"task_logs-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.jsonl.gz")
+    return gzip.open(path, "ab")
+
+
+def vacuum():
+    """Возвращает освободившееся место файлу БД (SQLite) или обновляет статистику планировщика (PostgreSQL)"""
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("VACUUM" if IS_SQLITE else "VACUUM ANALYZE task_logs"))
@@ -3,8 +3,10 @@
 """
 import json
 from typing import List, Optional
+from sqlalchemy import func
 from sqlalchemy.orm import Session
-from bot.database.models import User, Achievement, UserAchievement, Task, TaskLog
+from bot.database.models import User, Achievement, UserAchievement, Task, TaskLog, TaskLogMonthly, Category
+from bot.gamification.leaderboard import leaderboards
 
 
 class AchievementSystem:
@@ -56,6 +58,7 @@ class AchievementSystem:
         
         if new_achievements:
             db.commit()
+            leaderboards.record_total_xp(user_id, user.xp)
         
         return new_achievements
     
@@ -92,6 +95,14 @@ class AchievementSystem:
                     TaskLog.status == "completed"
                 ).count()
                 
+                # Плюс записи, уже свёрнутые в помесячные итоги
+                completed_tasks += db.query(func.coalesce(func.sum(TaskLogMonthly.completed), 0)).join(
+                    Category, TaskLogMonthly.category_id == Category.id
+                ).filter(
+                    TaskLogMonthly.user_id == user.id,
+                    Category.name == category_name
+                ).scalar()
+                
                 return completed_tasks >= required_count
             except:
                 return False
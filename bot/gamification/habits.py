@@ -0,0 +1,207 @@
+"""
+Привычки: повторяющиеся задачи
+
+Привычка хранится одной строкой (HabitTemplate), а задача на конкретный день
+создаётся только когда она нужна: пользователь открывает /tasks, нажимает
+кнопку или получает утреннюю рассылку. Ночной задачи, создающей строки всем
+пользователям, нет. Невыполненные экземпляры прошлых дней при этом
+снимаются из списка, а серия привычки считается по дням, когда она выполнена.
+"""
+import re
+from datetime import date, datetime, timedelta
+from typing import Optional, Set, Tuple
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+from bot.database.db import insert_missing
+from bot.database.models import HabitTemplate, Task
+from bot.utils.render_cache import render_cache
+
+SCHEDULE_PATTERNS = [
+    (re.compile(r'^(?:ежедневно|каждый\s+день|daily)\s+', re.IGNORECASE), "daily"),
+    (re.compile(r'^(?:по\s+будням|будни|weekdays)\s+', re.IGNORECASE), "weekdays"),
+    (re.compile(r'^(?:каждые|every)\s+(\d{1,3})\s*(?:дн[а-я]*|days?)?\s+', re.IGNORECASE), "every"),
+]
+
+
+class HabitTracker:
+    """Расписание и серии привычек"""
+
+    @staticmethod
+    def parse(text: str) -> Tuple[str, int, str]:
+        """
+        Разбирает "расписание название" из аргументов /habit
+
+        Args:
+            text: Например "будни сторис", "каждые 3 дня бассейн" или просто "тренировка" (каждый день)
+
+        Returns:
+            (schedule, interval_days, название)
+        """
+        text = text.strip()
+        for pattern, schedule in SCHEDULE_PATTERNS:
+            match = pattern.match(text)
+            if not match:
+                continue
+            interval = int(match.group(1)) if schedule == "every" else 1
+            if schedule == "every" and interval <= 1:
+                schedule, interval = "daily", 1
+            return schedule, interval, text[match.end():].strip()
+        return "daily", 1, text
+
+    @staticmethod
+    def describe(habit: HabitTemplate) -> str:
+        """Расписание словами"""
+        if habit.schedule == "weekdays":
+            return "по будням"
+        if habit.schedule == "every":
+            return f"каждые {habit.interval_days} дн."
+        return "каждый день"
+
+    @staticmethod
+    def is_due(habit: HabitTemplate, day: date) -> bool:
+        """Нужно ли выполнять привычку в этот день"""
+        if day < habit.starts_on:
+            return False
+        if habit.schedule == "weekdays":
+            return day.weekday() < 5
+        if habit.schedule == "every":
+            return (day - habit.starts_on).days % max(1, habit.interval_days) == 0
+        return True
+
+    @staticmethod
+    def latest_due(habit: HabitTemplate, day: date) -> Optional[date]:
+        """Последний день привычки не позже day (None - дней ещё не было)"""
+        if day < habit.starts_on:
+            return None
+        if habit.schedule == "every":
+            day -= timedelta(days=(day - habit.starts_on).days % max(1, habit.interval_days))
+        elif habit.schedule == "weekdays":
+            # Суббота и воскресенье - к пятнице
+            day -= timedelta(days=max(0, day.weekday() - 4))
+        return day if day >= habit.starts_on else None
+
+    @staticmethod
+    def previous_due(habit: HabitTemplate, day: date) -> Optional[date]:
+        """Предыдущий день привычки до day (None - раньше дней не было)"""
+        return HabitTracker.latest_due(habit, day - timedelta(days=1))
+
+    @staticmethod
+    def current_streak(habit: HabitTemplate, today: Optional[date] = None) -> int:
+        """
+        Серия на сегодня: сохранённая серия обнуляется, если прошлый день привычки пропущен
+
+        Пропуск не записывается отдельно (экземпляр за прошлый день просто снимается),
+        поэтому серия проверяется при чтении: последний день привычки (сегодня или
+        раньше) должен быть выполнен, а если это сегодня - можно ещё не выполнить
+        сегодня, но выполнить предыдущий.
+        """
+        today = today or datetime.utcnow().date()
+        if habit.last_done_on is None:
+            return 0
+        latest = HabitTracker.latest_due(habit, today)
+        if habit.last_done_on == today or habit.last_done_on == latest:
+            return habit.current_streak or 0
+        if latest == today and habit.last_done_on == HabitTracker.previous_due(habit, today):
+            return habit.current_streak or 0
+        return 0
+
+    @staticmethod
+    def record_done(habit: HabitTemplate, day: date) -> int:
+        """
+        Отмечает выполнение привычки за день
+
+        Returns:
+            Серия после выполнения
+        """
+        if habit.last_done_on == day:
+            return habit.current_streak
+        if habit.last_done_on is not None and habit.last_done_on == HabitTracker.previous_due(habit, day):
+            habit.current_streak = (habit.current_streak or 0) + 1
+        else:
+            habit.current_streak = 1
+        habit.last_done_on = day
+        habit.best_streak = max(habit.best_streak or 0, habit.current_streak)
+        return habit.current_streak
+
+    @staticmethod
+    def record_missed(habit: HabitTemplate):
+        """Пропуск обнуляет серию привычки"""
+        habit.current_streak = 0
+
+
+class HabitMaterializer:
+    """
+    Создаёт экземпляры привычек на текущий день
+
+    Помнит, каким пользователям задачи на сегодня уже созданы: повторные
+    /tasks и нажатия кнопок в этот день не делают лишних запросов.
+    """
+
+    def __init__(self):
+        self._day: Optional[date] = None
+        self._done: Set[int] = set()
+
+    def forget(self, user_id: int):
+        """Привычки пользователя изменились - проверить их заново"""
+        self._done.discard(user_id)
+
+    def materialize(self, db: Session, user_id: Optional[int] = None, day: Optional[date] = None) -> int:
+        """
+        Создаёт задачи привычек на день и снимает невыполненные задачи привычек прошлых дней
+
+        Args:
+            db: Сессия БД (изменения фиксируются здесь же)
+            user_id: ID пользователя в БД; None - все пользователи (утренняя рассылка)
+            day: День (по умолчанию - сегодня по UTC, как и серии дней)
+
+        Returns:
+            Сколько привычек было на этот день (созданных задач - не больше)
+        """
+        day = day or datetime.utcnow().date()
+        if self._day != day:
+            self._day = day
+            self._done.clear()
+        if user_id is not None and user_id in self._done:
+            return 0
+
+        query = db.query(HabitTemplate).filter(HabitTemplate.is_active == True, HabitTemplate.starts_on <= day)
+        expire = update(Task).where(
+            Task.habit_id.isnot(None),
+            Task.habit_date < day,
+            Task.is_completed == False,
+            Task.is_active == True
+        )
+        if user_id is not None:
+            query = query.filter(HabitTemplate.user_id == user_id)
+            expire = expire.where(Task.user_id == user_id)
+        habits = query.all()
+
+        now = datetime.utcnow()
+        rows = [{
+            "user_id": habit.user_id,
+            "category_id": habit.category_id,
+            "habit_id": habit.id,
+            "habit_date": day,
+            "title": habit.title,
+            "current_progress": 0.0,
+            "is_active": True,
+            "is_completed": False,
+            "created_at": now,
+        } for habit in habits if HabitTracker.is_due(habit, day)]
+
+        # Задачи вставляются и меняются мимо сессии - сброс кэша сообщений вручную
+        changed = {row["user_id"] for row in rows}
+        changed.update(user for (user,) in db.execute(expire.values(is_active=False).returning(Task.user_id)))
+        insert_missing(db, Task, rows, ["habit_id", "habit_date"])
+        db.commit()
+        for changed_user in changed:
+            render_cache.bump(changed_user)
+
+        if user_id is not None:
+            self._done.add(user_id)
+        else:
+            self._done.update(habit.user_id for habit in habits)
+        return len(rows)
+
+
+habit_materializer = HabitMaterializer()
@@ -0,0 +1,316 @@
+"""
+Рейтинги пользователей (общий, недельный, по категориям)
+
+Рейтинги живут в памяти и обновляются по мере начисления XP,
+поэтому место пользователя ищется бинарным поиском, без сортировки на каждый запрос.
+"""
+import asyncio
+import json
+import os
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+import pytz
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from bot.database.db import SessionLocal
+from bot.database.models import User, Task, TaskLog, TaskLogMonthly, Category
+from config.settings import settings
+
+GLOBAL_BOARD = "global"
+WEEKLY_BOARD = "weekly"
+CATEGORY_PREFIX = "category:"
+
+
+class RankedBoard:
+    """Рейтинг: отсортированный список (-очки, user_id) и словарь очков"""
+
+    def __init__(self):
+        self._keys: List[Tuple[int, int]] = []
+        self._scores: Dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def set(self, user_id: int, score: int):
+        """Устанавливает очки пользователя"""
+        old_score = self._scores.get(user_id)
+        if old_score == score:
+            return
+        if old_score is not None:
+            index = bisect_left(self._keys, (-old_score, user_id))
+            del self._keys[index]
+        self._scores[user_id] = score
+        insort(self._keys, (-score, user_id))
+
+    def add(self, user_id: int, delta: int):
+        """Добавляет очки пользователю"""
+        self.set(user_id, self._scores.get(user_id, 0) + delta)
+
+    def score(self, user_id: int) -> Optional[int]:
+        """Очки пользователя (None, если его нет в рейтинге)"""
+        return self._scores.get(user_id)
+
+    def rank(self, user_id: int) -> Optional[int]:
+        """
+        Место пользователя (с 1; при равных очках место общее)
+
+        Returns:
+            Место или None, если пользователя нет в рейтинге
+        """
+        score = self._scores.get(user_id)
+        if score is None:
+            return None
+        # Сколько пользователей с очками строго больше
+        return bisect_left(self._keys, (-score,)) + 1
+
+    def top(self, limit: int) -> List[Tuple[int, int]]:
+        """Первые limit пользователей: список (user_id, очки)"""
+        return [(user_id, -neg_score) for neg_score, user_id in self._keys[:limit]]
+
+    def items(self) -> List[Tuple[int, int]]:
+        """Все пары (user_id, очки) в порядке рейтинга"""
+        return [(user_id, -neg_score) for neg_score, user_id in self._keys]
+
+    def load(self, items: List[Tuple[int, int]]):
+        """Заполняет рейтинг целиком (быстрее, чем по одному)"""
+        self._scores = {user_id: score for user_id, score in items}
+        self._keys = sorted((-score, user_id) for user_id, score in self._scores.items())
+
+
+class Leaderboards:
+    """Набор рейтингов бота"""
+
+    def __init__(self):
+        self.boards: Dict[str, RankedBoard] = {GLOBAL_BOARD: RankedBoard(), WEEKLY_BOARD: RankedBoard()}
+        self.week_start = self._current_week_start()
+        self.last_log_id = 0
+
+    def get(self, name: str) -> Optional[RankedBoard]:
+        """Рейтинг по имени ("global", "weekly", "category:<название>")"""
+        if name == WEEKLY_BOARD:
+            self._roll_week()
+        return self.boards.get(name)
+
+    def category_names(self) -> List[str]:
+        """Категории, по которым есть рейтинг"""
+        return [name[len(CATEGORY_PREFIX):] for name in self.boards if name.startswith(CATEGORY_PREFIX)]
+
+    def record_task_xp(self, user_id: int, total_xp: int, xp_earned: int, category: Optional[str], log_id: int = 0):
+        """
+        Учитывает XP за выполненную задачу
+
+        Args:
+            user_id: ID пользователя
+            total_xp: Новый общий XP пользователя
+            xp_earned: XP за задачу
+            category: Название категории задачи
+            log_id: ID записи TaskLog (для догонки после снимка)
+        """
+        self._roll_week()
+        self.boards[GLOBAL_BOARD].set(user_id, total_xp)
+        self.boards[WEEKLY_BOARD].add(user_id, xp_earned)
+        if category:
+            self._category_board(category).add(user_id, xp_earned)
+        self.last_log_id = max(self.last_log_id, log_id)
+
+    def record_total_xp(self, user_id: int, total_xp: int):
+        """Учитывает изменение общего XP не за задачу (например, награда за ачивку)"""
+        self.boards[GLOBAL_BOARD].set(user_id, total_xp)
+
+    def rebuild(self, db: Session):
+        """
+        Полностью пересобирает рейтинги из БД
+
+        Бот может начислять XP, пока идёт пересборка (FAST_START), поэтому суммы
+        считаются только по записям до last_log_id: более новые добавит catch_up,
+        и ни одна запись не будет учтена дважды.
+        """
+        self.week_start = self._current_week_start()
+        self.boards = {GLOBAL_BOARD: RankedBoard(), WEEKLY_BOARD: RankedBoard()}
+        self.last_log_id = db.query(func.max(TaskLog.id)).scalar() or 0
+
+        self.boards[GLOBAL_BOARD].load(db.query(User.id, User.xp).all())
+
+        self._load_weekly(db)
+
+        by_category: Dict[str, List[Tuple[int, int]]] = {}
+        rows = db.query(Category.name, TaskLog.user_id, func.sum(TaskLog.xp_earned)).join(
+            Task, Task.category_id == Category.id
+        ).join(TaskLog, TaskLog.task_id == Task.id).filter(
+            TaskLog.status == "completed",
+            TaskLog.id <= self.last_log_id
+        ).group_by(Category.name, TaskLog.user_id).all()
+        # Записи, свёрнутые в помесячные итоги (у пропусков XP = 0)
+        rows += db.query(Category.name, TaskLogMonthly.user_id, func.sum(TaskLogMonthly.xp_earned)).join(
+            Category, TaskLogMonthly.category_id == Category.id
+        ).group_by(Category.name, TaskLogMonthly.user_id).all()
+        totals: Dict[Tuple[str, int], int] = {}
+        for category_name, user_id, xp in rows:
+            totals[(category_name, user_id)] = totals.get((category_name, user_id), 0) + int(xp or 0)
+        for (category_name, user_id), xp in totals.items():
+            by_category.setdefault(category_name, []).append((user_id, xp))
+        for category_name, items in by_category.items():
+            self._category_board(category_name).load(items)
+
+    def warm_start(self, db: Session, path: str = None) -> bool:
+        """
+        Загружает рейтинги из снимка и догоняет их по новым записям TaskLog
+
+        Общий рейтинг всегда берётся из users.xp (один простой запрос),
+        недельный и по категориям - из снимка плюс логи после него.
+
+        Returns:
+            True, если снимок использован; False - рейтинги пересобраны с нуля
+        """
+        path = path or settings.LEADERBOARD_SNAPSHOT_PATH
+        snapshot = None
+        if path and os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    snapshot = json.load(f)
+            except Exception as e:
+                print(f"Не удалось прочитать снимок рейтингов: {e}")
+
+        if not snapshot:
+            self.rebuild(db)
+            return False
+
+        self.last_log_id = snapshot["last_log_id"]
+        self.boards = {GLOBAL_BOARD: RankedBoard(), WEEKLY_BOARD: RankedBoard()}
+        for name, items in snapshot["boards"].items():
+            board = RankedBoard()
+            board.load([(user_id, score) for user_id, score in items])
+            self.boards[name] = board
+        self.week_start = self._current_week_start()
+        if datetime.fromisoformat(snapshot["week_start"]) != self.week_start:
+            # Снимок прошлой недели (или граница недели сдвинулась) - неделя заново из БД
+            self.boards[WEEKLY_BOARD] = RankedBoard()
+            self._load_weekly(db)
+
+        self.boards[GLOBAL_BOARD].load(db.query(User.id, User.xp).all())
+        self.catch_up(db)
+        return True
+
+    def catch_up(self, db: Session):
+        """Догоняет рейтинги по записям TaskLog после last_log_id"""
+        new_logs = db.query(
+            TaskLog.id, TaskLog.user_id, TaskLog.xp_earned, TaskLog.created_at, Category.name, User.xp
+        ).join(
+            Task, TaskLog.task_id == Task.id
+        ).join(User, TaskLog.user_id == User.id).outerjoin(Category, Task.category_id == Category.id).filter(
+            TaskLog.id > self.last_log_id,
+            TaskLog.status == "completed"
+        ).order_by(TaskLog.id).all()
+        for log_id, user_id, xp, created_at, category_name, total_xp in new_logs:
+            self.boards[GLOBAL_BOARD].set(user_id, total_xp)
+            if created_at >= self.week_start:
+                self.boards[WEEKLY_BOARD].add(user_id, xp)
+            if category_name:
+                self._category_board(category_name).add(user_id, xp)
+            self.last_log_id = log_id
+
+    def replace_with(self, other: "Leaderboards"):
+        """Подменяет рейтинги целиком (other собран в другом потоке; вызывать в event loop)"""
+        self.boards = other.boards
+        self.week_start = other.week_start
+        self.last_log_id = other.last_log_id
+
+    def snapshot(self) -> Dict:
+        """Снимок рейтингов (без общего: он восстанавливается из users.xp)"""
+        return {
+            "week_start": self.week_start.isoformat(),
+            "last_log_id": self.last_log_id,
+            "boards": {name: board.items() for name, board in self.boards.items() if name != GLOBAL_BOARD}
+        }
+
+    @staticmethod
+    def save_snapshot(snapshot: Dict, path: str = None):
+        """Атомарно записывает снимок на диск"""
+        path = path or settings.LEADERBOARD_SNAPSHOT_PATH
+        if not path:
+            return
+        tmp_path = f"{path}.tmp"
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+    def _load_weekly(self, db: Session):
+        """Недельный рейтинг из БД по записям до last_log_id (более новые добавит catch_up)"""
+        weekly = db.query(TaskLog.user_id, func.sum(TaskLog.xp_earned)).filter(
+            TaskLog.status == "completed",
+            TaskLog.created_at >= self.week_start,
+            TaskLog.id <= self.last_log_id
+        ).group_by(TaskLog.user_id).all()
+        self.boards[WEEKLY_BOARD].load([(user_id, int(xp)) for user_id, xp in weekly])
+
+    def _category_board(self, category: str) -> RankedBoard:
+        name = CATEGORY_PREFIX + category
+        board = self.boards.get(name)
+        if board is None:
+            board = self.boards[name] = RankedBoard()
+        return board
+
+    def _roll_week(self):
+        """С началом новой недели недельный рейтинг обнуляется"""
+        week_start = self._current_week_start()
+        if week_start != self.week_start:
+            self.week_start = week_start
+            self.boards[WEEKLY_BOARD] = RankedBoard()
+
+    @staticmethod
+    def _current_week_start() -> datetime:
+        """
+        Понедельник текущей недели, 00:00 по TIMEZONE (как у напоминаний)
+
+        Returns:
+            Момент начала недели в UTC без часового пояса - как TaskLog.created_at
+        """
+        zone = pytz.timezone(settings.TIMEZONE)
+        now = datetime.now(zone)
+        monday = (now - timedelta(days=now.weekday())).date()
+        start = zone.localize(datetime(monday.year, monday.month, monday.day))
+        return start.astimezone(pytz.utc).replace(tzinfo=None)
+
+
+leaderboards = Leaderboards()
+
+
+def warm_start_leaderboards(target: Optional[Leaderboards] = None) -> bool:
+    """
+    Загружает рейтинги при запуске бота
+
+    Args:
+        target: Куда загружать (по умолчанию - общие рейтинги бота)
+
+    Returns:
+        True, если использован снимок
+    """
+    target = target or leaderboards
+    db = SessionLocal()
+    try:
+        return target.warm_start(db)
+    finally:
+        db.close()
+
+
+async def warm_start_leaderboards_in_background() -> bool:
+    """
+    Загружает рейтинги в отдельном потоке, не останавливая обработку обновлений
+
+    Рейтинги собираются в новом объекте и подменяются в event loop целиком;
+    XP, начисленный за время загрузки, догоняется по TaskLog.
+
+    Returns:
+        True, если использован снимок
+    """
+    fresh = Leaderboards()
+    from_snapshot = await asyncio.to_thread(warm_start_leaderboards, fresh)
+    leaderboards.replace_with(fresh)
+    db = SessionLocal()
+    try:
+        leaderboards.catch_up(db)
+    finally:
+        db.close()
+    return from_snapshot
@@ -0,0 +1,97 @@
+"""
+Массовый пересчёт уровней после изменения формулы XP
+"""
+import math
+from array import array
+from typing import Dict, Optional
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+from bot.database.db import SessionLocal
+from bot.database.models import User
+from bot.utils.render_cache import render_cache
+from config.settings import settings
+
+
+def compute_levels(xp_values: array, base_xp: int) -> array:
+    """
+    Считает уровни для массива XP целиком
+
+    Формула та же, что в XPSystem.calculate_level, но без float:
+    level = isqrt(xp // base_xp) + 1
+
+    Args:
+        xp_values: Массив XP
+        base_xp: LEVEL_UP_BASE_XP
+
+    Returns:
+        Массив уровней той же длины
+    """
+    isqrt = math.isqrt
+    return array("q", [isqrt(xp // base_xp) + 1 if xp > 0 else 1 for xp in xp_values])
+
+
+def relevel_all_users(db: Optional[Session] = None, chunk_size: int = 5000, dry_run: bool = False) -> Dict[str, int]:
+    """
+    Пересчитывает сохранённые уровни всех пользователей
+
+    Пользователи читаются порциями по возрастанию id, изменившиеся уровни
+    записываются одним пакетным UPDATE на порцию. Пакетный UPDATE идёт мимо
+    сессии, поэтому кэш сообщений этого процесса сбрасывается вручную.
+
+    Args:
+        db: Сессия БД (по умолчанию - новая)
+        chunk_size: Размер порции
+        dry_run: Только посчитать, ничего не записывать
+
+    Returns:
+        Словарь: total, moved_up, moved_down, unchanged
+    """
+    own_session = db is None
+    if own_session:
+        db = SessionLocal()
+
+    base_xp = settings.LEVEL_UP_BASE_XP
+    report = {"total": 0, "moved_up": 0, "moved_down": 0, "unchanged": 0}
+    last_id = 0
+
+    try:
+        while True:
+            rows = db.query(User.id, User.xp, User.level).filter(
+                User.id > last_id
+            ).order_by(User.id).limit(chunk_size).all()
+            if not rows:
+                break
+
+            ids = array("q", [row[0] for row in rows])
+            xp_values = array("q", [row[1] or 0 for row in rows])
+            old_levels = array("q", [row[2] or 1 for row in rows])
+            new_levels = compute_levels(xp_values, base_xp)
+
+            changes = []
+            for user_id, old_level, new_level in zip(ids, old_levels, new_levels):
+                if new_level > old_level:
+                    report["moved_up"] += 1
+                elif new_level < old_level:
+                    report["moved_down"] += 1
+                else:
+                    continue
+                changes.append({"id": user_id, "level": new_level})
+
+            report["total"] += len(rows)
+            report["unchanged"] += len(rows) - len(changes)
+            last_id = ids[-1]
+
+            if changes and not dry_run:
+                # Пакетное обновление по первичному ключу (executemany)
+                db.execute(update(User), changes)
+                db.commit()
+                for change in changes:
+                    render_cache.bump(change["id"])
+
+        return report
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        if own_session:
+            db.close()
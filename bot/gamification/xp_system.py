@@ -1,13 +1,18 @@
 """
 Система опыта и уровней
 """
-from typing import Tuple
+import math
+from typing import Tuple, List
 from config.settings import settings
 
 
 class XPSystem:
     """Система начисления XP и уровней"""
     
+    # Предрассчитанные пороги уровней: _thresholds[level] - минимальный XP уровня
+    _thresholds: List[int] = []
+    _thresholds_base: int = 0
+    
     @staticmethod
     def calculate_xp_for_task(base_xp: int = None, multiplier: float = None) -> int:
         """
@@ -33,6 +38,7 @@ class XPSystem:
         Рассчитывает уровень на основе XP
         
         Формула: level = floor(sqrt(xp / BASE_XP)) + 1
+        Считается в целых числах: floor(sqrt(xp / B)) == isqrt(xp // B)
         
         Args:
             xp: Текущий опыт
@@ -40,12 +46,10 @@ class XPSystem:
         Returns:
             Уровень
         """
-        import math
         if xp <= 0:
             return 1
         
-        level = int(math.sqrt(xp / settings.LEVEL_UP_BASE_XP)) + 1
-        return max(1, level)
+        return math.isqrt(xp // settings.LEVEL_UP_BASE_XP) + 1
     
     @staticmethod
     def get_xp_for_level(level: int) -> int:
@@ -58,11 +62,37 @@ class XPSystem:
         Returns:
             Минимальный XP
         """
-        import math
         if level <= 1:
             return 0
         
-        return int((level - 1) ** 2 * settings.LEVEL_UP_BASE_XP)
+        return XPSystem.get_level_thresholds(level)[level]
+    
+    @staticmethod
+    def get_level_thresholds(max_level: int = 100) -> List[int]:
+        """
+        Таблица порогов уровней: thresholds[level] - минимальный XP уровня
+        
+        Таблица строится один раз и дорастает по мере надобности;
+        при смене LEVEL_UP_BASE_XP пересчитывается.
+        
+        Args:
+            max_level: До какого уровня нужна таблица
+            
+        Returns:
+            Список порогов (индексы 0 и 1 - нулевой XP)
+        """
+        base = settings.LEVEL_UP_BASE_XP
+        if XPSystem._thresholds_base != base:
+            XPSystem._thresholds = [0, 0]
+            XPSystem._thresholds_base = base
+        
+        thresholds = XPSystem._thresholds
+        if len(thresholds) <= max_level:
+            # Растим с запасом, чтобы не достраивать на каждом новом уровне
+            target = max(max_level, 2 * len(thresholds))
+            thresholds.extend((level - 1) ** 2 * base for level in range(len(thresholds), target + 1))
+        
+        return thresholds
     
     @staticmethod
     def get_xp_for_next_level(level: int) -> int:
@@ -89,8 +119,9 @@ class XPSystem:
         Returns:
             Кортеж (текущий XP в уровне, XP до следующего уровня, процент)
         """
-        xp_for_current = XPSystem.get_xp_for_level(current_level)
-        xp_for_next = XPSystem.get_xp_for_level(current_level + 1)
+        thresholds = XPSystem.get_level_thresholds(current_level + 1)
+        xp_for_current = thresholds[max(current_level, 1)]
+        xp_for_next = thresholds[max(current_level, 1) + 1]
         
         xp_in_level = current_xp - xp_for_current
         xp_needed = xp_for_next - xp_for_current
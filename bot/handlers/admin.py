@@ -0,0 +1,94 @@
+"""
+Служебные команды для администраторов (ADMIN_IDS)
+"""
+import asyncio
+from telegram import Update
+from telegram.ext import ContextTypes
+from bot.utils.sampling_profiler import sampling_profiler, ProfileResult
+from bot.utils.sql_profiler import sql_profiler
+from config.settings import settings
+
+# Длительность /profile без аргументов, секунд
+DEFAULT_PROFILE_SECONDS = 30
+
+# Лимит длины сообщения Telegram - 4096 символов, оставляем запас
+MAX_REPLY_LENGTH = 3500
+
+
+def admin_ids() -> set:
+    """Telegram ID администраторов из ADMIN_IDS"""
+    return {int(part) for part in settings.ADMIN_IDS.replace(" ", "").split(",") if part}
+
+
+def is_admin(update: Update) -> bool:
+    return update.effective_user is not None and update.effective_user.id in admin_ids()
+
+
+def truncate_report(text: str) -> str:
+    if len(text) <= MAX_REPLY_LENGTH:
+        return text
+    return text[:MAX_REPLY_LENGTH].rsplit("\n", 1)[0] + "\n…"
+
+
+async def sqlprofile_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик команды /sqlprofile [on|off|report|reset]"""
+    # Для остальных пользователей команды нет
+    if not is_admin(update):
+        return
+
+    action = context.args[0].lower() if context.args else "report"
+
+    if action == "on":
+        sql_profiler.enable()
+        await update.message.reply_text("🔎 Профилировщик SQL включён. Сводка: /sqlprofile report")
+    elif action == "off":
+        sql_profiler.disable()
+        path = await asyncio.to_thread(sql_profiler.write_report)
+        await update.message.reply_text(f"Профилировщик SQL выключен, сводка сохранена в {path}")
+    elif action == "reset":
+        sql_profiler.reset()
+        await update.message.reply_text("Статистика профилировщика SQL очищена")
+    elif action == "report":
+        path = await asyncio.to_thread(sql_profiler.write_report)
+        await update.message.reply_text(f"{truncate_report(sql_profiler.report())}\n\nПолная сводка: {path}")
+    else:
+        await update.message.reply_text("Использование: /sqlprofile on|off|report|reset")
+
+
+async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик команды /profile [секунд] | /profile обновлений N | /profile stop"""
+    if not is_admin(update):
+        return
+
+    args = [arg.lower() for arg in context.args or []]
+    if args and args[0] == "stop":
+        if sampling_profiler.active:
+            sampling_profiler.stop()
+        else:
+            await update.message.reply_text("Профилировщик не запущен")
+        return
+
+    seconds, max_updates = DEFAULT_PROFILE_SECONDS, 0
+    try:
+        if len(args) == 2 and args[0] in ("обновлений", "updates"):
+            # Ограничение по времени остаётся - на случай, если обновлений нет
+            seconds, max_updates = settings.PROFILE_MAX_SECONDS, int(args[1])
+        elif len(args) == 1:
+            seconds = float(args[0])
+        elif args:
+            raise ValueError
+    except ValueError:
+        await update.message.reply_text("Использование: /profile [секунд] | /profile обновлений N | /profile stop")
+        return
+
+    chat_id = update.effective_chat.id
+    bot = context.bot
+
+    def on_done(result: ProfileResult):
+        asyncio.create_task(bot.send_message(chat_id=chat_id, text=truncate_report(result.summary())))
+
+    if not sampling_profiler.start(seconds, max_updates, on_done):
+        await update.message.reply_text("Профилировщик уже запущен (/profile stop - остановить)")
+        return
+    limit = f"{max_updates} обновлений" if max_updates else f"{min(seconds, settings.PROFILE_MAX_SECONDS):g} с"
+    await update.message.reply_text(f"⏱ Профилирую {limit}, пришлю сводку по окончании")
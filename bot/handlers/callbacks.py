@@ -1,25 +1,40 @@
 """
 Обработчики callback-запросов (кнопки)
 """
+import asyncio
+import time
+from typing import Iterator
 from telegram import Update
 from telegram.ext import ContextTypes
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
 from bot.database.db import get_db
-from bot.database.models import User, Task, TaskLog
+from bot.database.models import User, Task, TaskLog, HabitTemplate
 from bot.ai.openai_client import AIClient
 from bot.gamification.xp_system import XPSystem
 from bot.gamification.achievements import AchievementSystem
+from bot.gamification.leaderboard import leaderboards
+from bot.gamification.habits import HabitTracker, habit_materializer
+from bot.utils.views import render_tasks_view, render_habits_view, parse_tasks_callback
+from bot.utils.dedup import callback_deduplicator
+from config.settings import settings
 
 
 async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик callback-запросов"""
     query = update.callback_query
-    await query.answer()
-    
     user = update.effective_user
     data = query.data
     
+    # Повторное нажатие или повторная доставка - отвечаем, не трогая БД
+    dedup_key = _dedup_key(user.id, data)
+    if not callback_deduplicator.begin(query.id, dedup_key):
+        if dedup_key is not None:
+            await query.answer("⏳ Уже обработано")
+        return
+    
+    await query.answer()
+    
     db = next(get_db())
     
     try:
@@ -28,6 +43,10 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await query.edit_message_text("❌ Пользователь не найден. Используй /start")
             return
         
+        if data.startswith(("complete_", "miss_", "tasks:")):
+            # Задачи привычек на сегодня создаются при первом обращении за день
+            habit_materializer.materialize(db, db_user.id)
+        
         if data.startswith("complete_"):
             task_id = int(data.split("_")[1])
             await _handle_task_complete(db, db_user, task_id, query)
@@ -36,10 +55,38 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             task_id = int(data.split("_")[1])
             await _handle_task_miss(db, db_user, task_id, query)
         
+        elif data.startswith("tasks:"):
+            # Листание списка задач - редактируем то же сообщение
+            task_filter, cursor, backwards = parse_tasks_callback(data)
+            message, reply_markup = render_tasks_view(db, db_user.id, task_filter, cursor, backwards)
+            if message != query.message.text:
+                await query.edit_message_text(message, reply_markup=reply_markup)
+        
+        elif data.startswith("habit_stop_"):
+            habit_id = int(data.split("_")[2])
+            habit = db.query(HabitTemplate).filter(
+                HabitTemplate.id == habit_id, HabitTemplate.user_id == db_user.id
+            ).first()
+            if habit and habit.is_active:
+                habit.is_active = False
+                db.commit()
+                habit_materializer.forget(db_user.id)
+            message, reply_markup = render_habits_view(db, db_user.id)
+            await query.edit_message_text(message, reply_markup=reply_markup)
+        
     except Exception as e:
         await query.edit_message_text(f"❌ Ошибка: {e}")
     finally:
         db.close()
+        callback_deduplicator.finish(dedup_key)
+
+
+def _dedup_key(telegram_id: int, data: str):
+    """Ключ действия для подавления дубликатов (только для действий, меняющих данные)"""
+    if data.startswith(("complete_", "miss_")):
+        action, task_id = data.split("_", 1)
+        return telegram_id, action, task_id
+    return None
 
 
 async def _handle_task_complete(db: Session, user: User, task_id: int, query):
@@ -53,6 +100,10 @@ async def _handle_task_complete(db: Session, user: User, task_id: int, query):
         await query.edit_message_text("✅ Эта задача уже выполнена!")
         return
     
+    if task.habit_id and not task.is_active:
+        await query.edit_message_text("⏰ Этот день привычки уже прошёл - отметь сегодняшний в /tasks")
+        return
+    
     # Отмечаем задачу как выполненную
     task.is_completed = True
     task.completed_at = datetime.utcnow()
@@ -74,6 +125,9 @@ async def _handle_task_complete(db: Session, user: User, task_id: int, query):
     # Обновляем серию дней
     _update_streak(db, user, True)
     
+    # Серия по привычке
+    habit_streak = HabitTracker.record_done(task.habit, task.habit_date) if task.habit_id else None
+    
     # Создаём лог
     task_log = TaskLog(
         user_id=user.id,
@@ -89,17 +143,40 @@ async def _handle_task_complete(db: Session, user: User, task_id: int, query):
     
     db.commit()
     
+    # Обновляем рейтинги
+    category_name = task.category.name if task.category else None
+    leaderboards.record_task_xp(user.id, user.xp, xp_earned, category_name, task_log.id)
+    
+    if settings.AI_STREAMING:
+        # Сразу показываем результат, мотивацию дописываем по мере генерации
+        confirmation = _format_completion(user, xp_earned, level_up, new_achievements, habit_streak=habit_streak)
+        await query.edit_message_text(confirmation)
+        chunks = AIClient.stream_motivation_message(True, task.title, user.level, user_id=user.id)
+        await _stream_into_message(query, confirmation + "\n\n", chunks)
+        return
+    
     # Генерируем мотивационное сообщение
-    motivation = AIClient.generate_motivation_message(True, task.title, user.level)
+    motivation = AIClient.generate_motivation_message(True, task.title, user.level, user_id=user.id)
     
-    # Формируем ответ
+    await query.edit_message_text(
+        _format_completion(user, xp_earned, level_up, new_achievements, motivation, habit_streak)
+    )
+
+
+def _format_completion(user: User, xp_earned: int, level_up: bool, new_achievements: list,
+                       motivation: str = None, habit_streak: int = None) -> str:
+    """Текст подтверждения выполнения задачи"""
     response = f"✅ Задача выполнена!\n\n"
     response += f"💎 +{xp_earned} XP\n"
     
+    if habit_streak:
+        response += f"🔁 Серия привычки: {habit_streak}\n"
+    
     if level_up:
         response += f"🎉 УРОВЕНЬ ПОВЫШЕН! Теперь ты уровня {user.level}!\n\n"
     
-    response += f"{motivation}\n\n"
+    if motivation:
+        response += f"{motivation}\n\n"
     
     if new_achievements:
         response += "🏆 Новая ачивка:\n"
@@ -112,7 +189,36 @@ async def _handle_task_complete(db: Session, user: User, task_id: int, query):
     progress_bar = XPSystem.format_progress_bar(percentage)
     response += f"📊 Прогресс: {progress_bar} {percentage:.1f}%"
     
-    await query.edit_message_text(response)
+    return response
+
+
+async def _stream_into_message(query, prefix: str, chunks: Iterator[str]):
+    """
+    Дописывает потоковый текст в сообщение, редактируя его не чаще STREAM_EDIT_INTERVAL
+    
+    Args:
+        query: Callback-запрос, чьё сообщение редактируем
+        prefix: Уже показанный текст
+        chunks: Блокирующий итератор кусков текста
+    """
+    text = ""
+    shown = ""
+    last_edit = time.monotonic()
+    
+    while True:
+        # Итератор ходит в сеть синхронно - читаем его в потоке, чтобы не блокировать цикл событий
+        chunk = await asyncio.to_thread(next, chunks, None)
+        if chunk is None:
+            break
+        text += chunk
+        
+        if time.monotonic() - last_edit >= settings.STREAM_EDIT_INTERVAL and text.strip() != shown:
+            shown = text.strip()
+            await query.edit_message_text(prefix + shown + " ✍️")
+            last_edit = time.monotonic()
+    
+    if text.strip():
+        await query.edit_message_text(prefix + text.strip())
 
 
 async def _handle_task_miss(db: Session, user: User, task_id: int, query):
@@ -122,8 +228,25 @@ async def _handle_task_miss(db: Session, user: User, task_id: int, query):
         await query.edit_message_text("❌ Задача не найдена")
         return
     
+    if task.is_completed:
+        await query.edit_message_text("✅ Эта задача уже выполнена!")
+        return
+    
+    # Пропуск засчитывается один раз в день
+    today_start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    already_missed = db.query(TaskLog.id).filter(
+        TaskLog.task_id == task.id,
+        TaskLog.status == "missed",
+        TaskLog.created_at >= today_start
+    ).first()
+    if already_missed:
+        await query.edit_message_text("❌ Задача уже отмечена как невыполненная сегодня")
+        return
+    
     # Обновляем серию дней
     _update_streak(db, user, False)
+    if task.habit_id:
+        HabitTracker.record_missed(task.habit)
     
     # Создаём лог
     task_log = TaskLog(
@@ -138,7 +261,7 @@ async def _handle_task_miss(db: Session, user: User, task_id: int, query):
     db.commit()
     
     # Генерируем мотивационное сообщение
-    motivation = AIClient.generate_motivation_message(False, task.title, user.level)
+    motivation = AIClient.generate_motivation_message(False, task.title, user.level, user_id=user.id)
     
     response = f"❌ Задача отмечена как невыполненная\n\n"
     response += f"{motivation}\n\n"
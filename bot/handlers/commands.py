@@ -5,12 +5,15 @@ from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
-from bot.database.db import get_db
-from bot.database.models import User, Task, Category, TaskLog
+from bot.database.db import get_db, get_or_create_user
+from bot.database.models import User, Task, Category, TaskLog, HabitTemplate
 from bot.ai.openai_client import AIClient
 from bot.gamification.xp_system import XPSystem
 from bot.gamification.achievements import AchievementSystem
+from bot.gamification.habits import HabitTracker, habit_materializer
+from bot.gamification.leaderboard import leaderboards, GLOBAL_BOARD, WEEKLY_BOARD, CATEGORY_PREFIX
 from bot.utils.formatters import MessageFormatter
+from bot.utils.views import render_tasks_view, render_progress_view, render_habits_view, TaskFilter
 from config.settings import settings
 
 
@@ -20,20 +23,10 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     db = next(get_db())
     
     try:
-        # Проверяем, есть ли пользователь в БД
-        db_user = db.query(User).filter(User.telegram_id == user.id).first()
+        # Находим пользователя или создаём нового
+        db_user, created = get_or_create_user(db, user.id, user.username, user.first_name)
         
-        if not db_user:
-            # Создаём нового пользователя
-            db_user = User(
-                telegram_id=user.id,
-                username=user.username,
-                first_name=user.first_name
-            )
-            db.add(db_user)
-            db.commit()
-            db.refresh(db_user)
-            
+        if created:
             welcome_message = f"""
 👋 Привет, {user.first_name}!
 
@@ -78,12 +71,13 @@ async def add_task_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "📝 Напиши задачу или цель, например:\n\n"
         "• Хочу цель: 500 подписчиков, я на 480\n"
         "• Добавь тренировку: 45 минут кардио\n"
-        "• Записать сторис для блога"
+        "• Записать сторис для блога\n\n"
+        "Можно прислать сразу список - по задаче на строку"
     )
 
 
 async def tasks_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Обработчик команды /tasks"""
+    """Обработчик команды /tasks [категория] [сегодня|неделя|просрочено|бессрочные]"""
     user = update.effective_user
     db = next(get_db())
     
@@ -93,30 +87,86 @@ async def tasks_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text("❌ Пользователь не найден. Используй /start")
             return
         
-        # Получаем активные задачи
-        active_tasks = db.query(Task).filter(
-            Task.user_id == db_user.id,
-            Task.is_active == True,
-            Task.is_completed == False
-        ).all()
-        
-        message = MessageFormatter.format_task_list(active_tasks)
-        
-        # Добавляем кнопки для каждой задачи
-        keyboard = []
-        for task in active_tasks:
-            keyboard.append([
-                InlineKeyboardButton(
-                    f"✅ {task.title[:30]}...",
-                    callback_data=f"complete_{task.id}"
-                ),
-                InlineKeyboardButton(
-                    f"❌ {task.title[:30]}...",
-                    callback_data=f"miss_{task.id}"
-                )
-            ])
+        task_filter, error = TaskFilter.from_args(db, context.args or [])
+        if error:
+            await update.message.reply_text(error)
+            return
         
-        reply_markup = InlineKeyboardMarkup(keyboard) if keyboard else None
+        # Задачи привычек на сегодня создаются при первом открытии списка за день
+        habit_materializer.materialize(db, db_user.id)
+        
+        message, reply_markup = render_tasks_view(db, db_user.id, task_filter)
+        
+        await update.message.reply_text(message, reply_markup=reply_markup)
+        
+    except Exception as e:
+        await update.message.reply_text(f"❌ Ошибка: {e}")
+    finally:
+        db.close()
+
+
+async def habit_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик команды /habit [каждый день|будни|каждые N дней] <название>"""
+    user = update.effective_user
+    schedule, interval, title = HabitTracker.parse(" ".join(context.args or []))
+    if not title:
+        await update.message.reply_text(
+            "🔁 Привычка - задача, которая сама появляется в /tasks по расписанию:\n\n"
+            "• /habit тренировка - каждый день\n"
+            "• /habit будни сторис для блога\n"
+            "• /habit каждые 3 дня бассейн"
+        )
+        return
+    
+    db = next(get_db())
+    
+    try:
+        db_user, _ = get_or_create_user(db, user.id, user.username, user.first_name)
+        
+        # Категория определяется один раз при создании привычки, а не каждый день
+        categories = {category.name: category for category in db.query(Category).all()}
+        category_name = AIClient.categorize_task(title, list(categories), user_id=db_user.id)
+        category = categories.get(category_name)
+        if category is None:
+            category = Category(name=category_name)
+            db.add(category)
+        
+        habit = HabitTemplate(
+            user_id=db_user.id,
+            category=category,
+            title=title,
+            schedule=schedule,
+            interval_days=interval,
+            starts_on=datetime.utcnow().date()
+        )
+        db.add(habit)
+        db.commit()
+        habit_materializer.forget(db_user.id)
+        
+        await update.message.reply_text(
+            f"🔁 Привычка добавлена: {habit.title}\n"
+            f"📅 {HabitTracker.describe(habit)} · 🏷 {category.name}\n\n"
+            f"Задача на день появится в /tasks, все привычки - /habits"
+        )
+        
+    except Exception as e:
+        await update.message.reply_text(f"❌ Ошибка: {e}")
+    finally:
+        db.close()
+
+
+async def habits_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик команды /habits"""
+    user = update.effective_user
+    db = next(get_db())
+    
+    try:
+        db_user = db.query(User).filter(User.telegram_id == user.id).first()
+        if not db_user:
+            await update.message.reply_text("❌ Пользователь не найден. Используй /start")
+            return
+        
+        message, reply_markup = render_habits_view(db, db_user.id)
         
         await update.message.reply_text(message, reply_markup=reply_markup)
         
@@ -137,12 +187,7 @@ async def progress_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text("❌ Пользователь не найден. Используй /start")
             return
         
-        message = MessageFormatter.format_progress(db_user)
-        
-        # Получаем ачивки
-        achievements = db_user.achievements
-        if achievements:
-            message += "\n\n" + MessageFormatter.format_achievements(achievements)
+        message = render_progress_view(db, db_user)
         
         await update.message.reply_text(message)
         
@@ -252,15 +297,71 @@ async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         db.close()
 
 
+async def top_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик команды /top [неделя | категория]"""
+    user = update.effective_user
+    db = next(get_db())
+    
+    try:
+        db_user = db.query(User).filter(User.telegram_id == user.id).first()
+        if not db_user:
+            await update.message.reply_text("❌ Пользователь не найден. Используй /start")
+            return
+        
+        argument = " ".join(context.args).strip() if context.args else ""
+        if not argument:
+            board_name, title = GLOBAL_BOARD, "🏆 Топ по XP"
+        elif argument.lower() in ("неделя", "week"):
+            board_name, title = WEEKLY_BOARD, "📅 Топ недели"
+        else:
+            category = next(
+                (name for name in leaderboards.category_names() if name.lower() == argument.lower()),
+                None
+            )
+            if not category:
+                categories = ", ".join(sorted(leaderboards.category_names())) or "пока нет"
+                await update.message.reply_text(
+                    f"❌ Нет рейтинга «{argument}».\n\n"
+                    f"Используй /top, /top неделя или /top <категория>.\nКатегории: {categories}"
+                )
+                return
+            board_name, title = CATEGORY_PREFIX + category, f"🏷 Топ: {category}"
+        
+        board = leaderboards.get(board_name)
+        top = board.top(settings.LEADERBOARD_SIZE)
+        
+        # Имена только для тех, кто попал в топ
+        names = {
+            row.id: row.first_name or row.username or f"Игрок {row.id}"
+            for row in db.query(User.id, User.first_name, User.username).filter(
+                User.id.in_([user_id for user_id, _ in top])
+            )
+        }
+        rows = [(board.rank(user_id), names.get(user_id, f"Игрок {user_id}"), score) for user_id, score in top]
+        
+        message = MessageFormatter.format_leaderboard(
+            title, rows, board.rank(db_user.id), board.score(db_user.id), len(board)
+        )
+        await update.message.reply_text(message)
+        
+    except Exception as e:
+        await update.message.reply_text(f"❌ Ошибка: {e}")
+    finally:
+        db.close()
+
+
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик команды /help"""
     help_text = """
 📚 Доступные команды:
 
 /add - Добавить новую задачу
-/tasks - Показать активные задачи
+/tasks - Показать активные задачи (/tasks <категория> сегодня|неделя|просрочено)
+/habit - Добавить привычку (/habit будни сторис, /habit каждые 3 дня бассейн)
+/habits - Привычки и их серии
 /progress - Показать прогресс (XP, уровень, ачивки)
 /stats - Статистика выполнения
+/top - Рейтинг игроков (/top неделя, /top <категория>)
 /categories - Управление категориями
 /help - Показать эту справку
 
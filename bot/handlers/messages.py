@@ -1,14 +1,40 @@
 """
 Обработчики текстовых сообщений
 """
+import re
+from typing import Dict, List, Optional
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 from sqlalchemy.orm import Session
 from datetime import datetime
-from bot.database.db import get_db
+from bot.database.db import get_db, get_or_create_user
 from bot.database.models import User, Task, Category
 from bot.ai.openai_client import AIClient
 from bot.utils.formatters import MessageFormatter
+from bot.utils.views import compact_task_keyboard
+from config.settings import settings
+
+# Маркеры списка в начале строки: "-", "•", "*", "1.", "2)", "[ ]", "☐"
+LIST_MARKER = re.compile(r'^\s*(?:(?:[-–—•*·▪☐]|\[[ xх]?\])\s*|\d{1,2}[.)]\s+)', re.IGNORECASE)
+
+
+def split_task_lines(text: str) -> List[str]:
+    """Строки сообщения без маркеров списка, пустых строк и заголовков ("План на день:") - по задаче на строку"""
+    items = []
+    for line in text.splitlines():
+        item = LIST_MARKER.sub("", line, count=1).strip()
+        if item and not item.endswith(":"):
+            items.append(item)
+    return items
+
+
+def _parse_deadline(value) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, "%Y-%m-%d")
+    except (TypeError, ValueError):
+        return None
 
 
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -16,27 +42,31 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     message_text = update.message.text
     
+    # Несколько строк - несколько задач
+    items = split_task_lines(message_text)
+    if len(items) > settings.MAX_BATCH_TASKS:
+        await update.message.reply_text(
+            f"❌ Слишком много строк: за раз можно добавить не больше {settings.MAX_BATCH_TASKS} задач"
+        )
+        return
+    
     db = next(get_db())
     
     try:
         # Получаем или создаём пользователя
-        db_user = db.query(User).filter(User.telegram_id == user.id).first()
-        if not db_user:
-            db_user = User(
-                telegram_id=user.id,
-                username=user.username,
-                first_name=user.first_name
-            )
-            db.add(db_user)
-            db.commit()
-            db.refresh(db_user)
+        db_user, _ = get_or_create_user(db, user.id, user.username, user.first_name)
+        
+        if len(items) > 1:
+            await _create_tasks_batch(update, db, db_user, items)
+            return
         
         # Парсим задачу с помощью ИИ
-        parsed = AIClient.parse_task(message_text)
+        task_text = items[0] if len(items) == 1 else message_text
+        parsed = AIClient.parse_task(task_text, user_id=db_user.id)
         
         # Определяем категорию
         categories = [cat.name for cat in db.query(Category).all()]
-        category_name = AIClient.categorize_task(parsed["title"], categories)
+        category_name = AIClient.categorize_task(parsed["title"], categories, user_id=db_user.id)
         
         category = db.query(Category).filter(Category.name == category_name).first()
         if not category:
@@ -94,3 +124,40 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     finally:
         db.close()
 
+
+async def _create_tasks_batch(update: Update, db: Session, db_user: User, items: List[str]):
+    """
+    Создаёт задачи из строк одного сообщения
+
+    Разбор и категоризация - один запрос к модели (или один проход простого парсера),
+    все задачи - одна транзакция, ответ - одно сообщение с компактными кнопками.
+    """
+    categories: Dict[str, Category] = {category.name: category for category in db.query(Category).all()}
+    parsed_items = AIClient.parse_tasks_batch(items, list(categories), user_id=db_user.id)
+
+    tasks = []
+    for parsed in parsed_items:
+        category = categories.get(parsed["category"])
+        if category is None:
+            category = Category(name=parsed["category"])
+            db.add(category)
+            categories[category.name] = category
+        tasks.append(Task(
+            user_id=db_user.id,
+            category=category,
+            title=parsed["title"],
+            current_progress=parsed.get("current_progress") or 0.0,
+            target_progress=parsed.get("target_progress"),
+            deadline=_parse_deadline(parsed.get("deadline")),
+            is_active=True,
+            is_completed=False
+        ))
+    db.add_all(tasks)
+    db.flush()
+
+    # Текст и кнопки - до commit: после него объекты пришлось бы перечитывать
+    response = MessageFormatter.format_created_tasks(tasks)
+    reply_markup = InlineKeyboardMarkup(compact_task_keyboard([task.id for task in tasks]))
+    db.commit()
+
+    await update.message.reply_text(response, reply_markup=reply_markup)
@@ -1,64 +1,245 @@
 """
 Главный файл бота
 """
+# Момент начала запуска (до импорта модулей бота) - для отчёта о времени старта
+import time
+PROCESS_STARTED = time.perf_counter()
+
 import asyncio
 import logging
 from telegram import Bot, Update
 from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, filters
 from bot.database.db import init_db
-from bot.handlers import commands, messages, callbacks
+from bot.handlers import commands, messages, callbacks, admin
 from bot.scheduler.reminder_scheduler import ReminderScheduler
+from bot.gamification.leaderboard import leaderboards, warm_start_leaderboards, warm_start_leaderboards_in_background
+from bot.ai.providers import get_provider
+from bot.transport.webhook import run_webhook
+from bot.transport.update_processor import PerUserUpdateProcessor
+from bot.transport.workers import WorkerPool, attach_router, monitor_workers
+from bot.transport.request import InstrumentedRequest
+from bot.utils.update_recorder import attach_recorder
+from bot.utils.logging_setup import setup_logging
+from bot.utils.metrics import registry, start_metrics_server
+from bot.utils.loop_watchdog import start_loop_watchdog
+from bot.utils.sampling_profiler import sampling_profiler, install_profile_signal
+from bot.utils.request_context import KNOWN_COMMANDS
+from bot.utils.startup import StartupTimer
 from config.settings import settings
 
-# Настройка логирования
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO,
-    handlers=[
-        logging.FileHandler('bot.log', encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger(__name__)
 
+startup = StartupTimer(PROCESS_STARTED)
+startup.mark("импорт", PROCESS_STARTED)
 
-def main():
-    """Главная функция запуска бота"""
-    # Инициализация БД
-    logger.info("Инициализация базы данных...")
-    init_db()
-    
-    # Создание приложения
-    application = Application.builder().token(settings.TELEGRAM_BOT_TOKEN).build()
-    
+
+def register_handlers(application: Application):
+    """Регистрирует обработчики команд, сообщений и кнопок"""
     # Регистрация обработчиков команд
     application.add_handler(CommandHandler("start", commands.start_command))
     application.add_handler(CommandHandler("add", commands.add_task_command))
     application.add_handler(CommandHandler("tasks", commands.tasks_command))
+    application.add_handler(CommandHandler("habit", commands.habit_command))
+    application.add_handler(CommandHandler("habits", commands.habits_command))
     application.add_handler(CommandHandler("progress", commands.progress_command))
     application.add_handler(CommandHandler("stats", commands.stats_command))
+    application.add_handler(CommandHandler("top", commands.top_command))
     application.add_handler(CommandHandler("help", commands.help_command))
     
+    # Служебные команды (только для ADMIN_IDS)
+    application.add_handler(CommandHandler("sqlprofile", admin.sqlprofile_command))
+    application.add_handler(CommandHandler("profile", admin.profile_command))
+    
     # Обработчик текстовых сообщений (создание задач)
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, messages.handle_message))
     
     # Обработчик callback-запросов (кнопки)
     application.add_handler(CallbackQueryHandler(callbacks.handle_callback))
     
+    # Команды, которые получат свою метку в метриках
+    for handler in application.handlers.get(0, []):
+        if isinstance(handler, CommandHandler):
+            KNOWN_COMMANDS.update(handler.commands)
+
+
+async def start_monitoring(app: Application, port: int):
+    """
+    Поднимает /metrics (если метрики включены), сторож event loop и профилирование
+    по SIGUSR2; остановка - в stop_monitoring
+    """
+    app.bot_data['loop_watchdog'] = start_loop_watchdog()
+    install_profile_signal(asyncio.get_running_loop())
+    if port:
+        server = await start_metrics_server(settings.METRICS_HOST, port)
+        app.bot_data['metrics_server'] = server
+        logger.info(f"Метрики: http://{settings.METRICS_HOST}:{server.port}/metrics")
+
+
+async def stop_monitoring(app: Application):
+    sampling_profiler.stop()
+    watchdog = app.bot_data.get('loop_watchdog')
+    if watchdog:
+        watchdog.stop()
+    server = app.bot_data.get('metrics_server')
+    if server:
+        await server.stop()
+
+
+async def warm_up(app: Application, scheduler: ReminderScheduler, with_leaderboards: bool):
+    """Фоновый прогрев при FAST_START: рейтинги, напоминания и клиент ИИ (чтение БД и импорт - в потоках)"""
+    timer = StartupTimer()
+    try:
+        if with_leaderboards:
+            with timer.step("рейтинги"):
+                from_snapshot = await warm_start_leaderboards_in_background()
+            app.bot_data['leaderboards_ready'] = True
+            logger.info(f"Рейтинги загружены {'из снимка' if from_snapshot else 'из БД'}")
+        with timer.step("напоминания"):
+            reminders = await scheduler.load_reminders_in_background()
+        with timer.step("клиент ИИ"):
+            await asyncio.to_thread(get_provider)
+        logger.info(f"{timer.report('Фоновый прогрев')} (напоминаний: {reminders})")
+    except asyncio.CancelledError:
+        raise
+    except Exception:
+        logger.exception("Ошибка фонового прогрева")
+
+
+def build_application() -> Application:
+    """Создаёт приложение с обработчиками, планировщиком и рейтингами"""
+    update_processor = PerUserUpdateProcessor(settings.CONCURRENT_UPDATES, settings.MAX_PENDING_UPDATES)
+    application = Application.builder().token(settings.TELEGRAM_BOT_TOKEN).request(
+        InstrumentedRequest()
+    ).concurrent_updates(update_processor).build()
+    register_handlers(application)
+    recorder = attach_recorder(application)
+    registry.gauge("toxa_update_queue_size", "Обновлений в очереди приложения",
+                   function=application.update_queue.qsize)
+    
     # Запуск планировщика напоминаний
     async def post_init(app: Application):
+        await start_monitoring(app, settings.METRICS_PORT)
+        
         bot = app.bot
         scheduler = ReminderScheduler(bot)
-        scheduler.start()
         app.bot_data['scheduler'] = scheduler
+        
+        if settings.FAST_START:
+            # Рейтинги, напоминания и клиент ИИ догружаются, пока бот уже отвечает
+            scheduler.start(load_reminders=False)
+            app.bot_data['warm_up'] = asyncio.create_task(warm_up(app, scheduler, with_leaderboards=True))
+        else:
+            with startup.step("рейтинги"):
+                from_snapshot = warm_start_leaderboards()
+            logger.info(f"Рейтинги загружены {'из снимка' if from_snapshot else 'из БД'}")
+            app.bot_data['leaderboards_ready'] = True
+            with startup.step("напоминания"):
+                scheduler.start()
+        logger.info(startup.report("Бот принимает обновления"))
+    
+    # Сохранение рейтингов и освобождение аренды планировщика при остановке
+    async def post_shutdown(app: Application):
+        warm_up_task = app.bot_data.get('warm_up')
+        if warm_up_task:
+            warm_up_task.cancel()
+        # Недогруженные рейтинги не сохраняем - иначе затрём хороший снимок
+        if app.bot_data.get('leaderboards_ready'):
+            leaderboards.save_snapshot(leaderboards.snapshot())
+        if recorder:
+            recorder.close()
+        scheduler = app.bot_data.get('scheduler')
+        if scheduler:
+            scheduler.stop()
+        await stop_monitoring(app)
     
     application.post_init = post_init
+    application.post_shutdown = post_shutdown
+    
+    return application
+
+
+def build_front_application(workers: int) -> Application:
+    """
+    Создаёт фронт для режима воркеров: он только получает обновления
+    и раскладывает их по процессам-воркерам, планировщик тоже работает здесь
+    """
+    application = Application.builder().token(settings.TELEGRAM_BOT_TOKEN).request(InstrumentedRequest()).build()
+    pool = WorkerPool(workers)
+    attach_router(application, pool)
+    recorder = attach_recorder(application)
+    
+    async def post_init(app: Application):
+        await start_monitoring(app, settings.METRICS_PORT)
+        pool.start()
+        app.bot_data['workers_monitor'] = asyncio.create_task(monitor_workers(pool))
+        logger.info(f"Запущено воркеров: {workers}")
+        
+        # Рейтинги живут в воркерах, снимок сохраняет воркер 0
+        scheduler = ReminderScheduler(app.bot, leaderboard_snapshots=False)
+        app.bot_data['scheduler'] = scheduler
+        if settings.FAST_START:
+            scheduler.start(load_reminders=False)
+            app.bot_data['warm_up'] = asyncio.create_task(warm_up(app, scheduler, with_leaderboards=False))
+        else:
+            with startup.step("напоминания"):
+                scheduler.start()
+        logger.info(startup.report("Бот принимает обновления"))
+    
+    async def post_shutdown(app: Application):
+        warm_up_task = app.bot_data.get('warm_up')
+        if warm_up_task:
+            warm_up_task.cancel()
+        monitor = app.bot_data.get('workers_monitor')
+        if monitor:
+            monitor.cancel()
+        await asyncio.to_thread(pool.stop)
+        if recorder:
+            recorder.close()
+        scheduler = app.bot_data.get('scheduler')
+        if scheduler:
+            scheduler.stop()
+        await stop_monitoring(app)
+    
+    application.post_init = post_init
+    application.post_shutdown = post_shutdown
+    
+    return application
+
+
+def main():
+    """Главная функция запуска бота"""
+    # Логи пишет фоновый поток; при остановке дописываем очередь
+    log_listener = setup_logging()
+    try:
+        run_bot()
+    finally:
+        log_listener.stop()
+
+
+def run_bot():
+    """Инициализирует БД и запускает бота в выбранном режиме"""
+    # Инициализация БД
+    logger.info("Инициализация базы данных...")
+    with startup.step("БД"):
+        schema_checked = init_db()
+    if not schema_checked:
+        logger.info("Схема БД не менялась, проверка пропущена")
+    
+    # Создание приложения
+    with startup.step("приложение"):
+        if settings.WORKERS > 1:
+            application = build_front_application(settings.WORKERS)
+        else:
+            application = build_application()
     
     # Запуск бота
-    logger.info("Запуск бота...")
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    if settings.BOT_MODE == "webhook":
+        logger.info("Запуск бота (вебхук)...")
+        asyncio.run(run_webhook(application))
+    else:
+        logger.info("Запуск бота...")
+        application.run_polling(allowed_updates=Update.ALL_TYPES)
 
 
 if __name__ == "__main__":
     main()
-
@@ -0,0 +1,110 @@
+"""
+Выбор ведущей реплики для планировщика через аренду в БД
+
+Реплика, держащая аренду, продлевает её каждые SCHEDULER_HEARTBEAT секунд.
+Если ведущая реплика пропала, аренда истекает через SCHEDULER_LEASE_TTL секунд
+и её забирает другая реплика.
+"""
+import os
+import socket
+import threading
+from datetime import datetime, timedelta
+from typing import Optional
+from sqlalchemy import or_
+from bot.database.db import SessionLocal, upsert
+from bot.database.models import SchedulerLease
+from config.settings import settings
+
+SCHEDULER_LEASE = "scheduler"
+
+
+def default_replica_id() -> str:
+    """ID реплики: REPLICA_ID или хост и PID"""
+    return settings.REPLICA_ID or f"{socket.gethostname()}:{os.getpid()}"
+
+
+class LeaderLease:
+    """
+    Аренда роли ведущего
+
+    Захват и продление - один атомарный INSERT ... ON CONFLICT DO UPDATE
+    с условием "аренда наша или уже истекла", поэтому две реплики
+    не могут держать её одновременно.
+
+    Args:
+        name: Имя аренды
+        holder: ID этой реплики
+        ttl: Срок аренды в секундах
+    """
+
+    def __init__(self, name: str = SCHEDULER_LEASE, holder: Optional[str] = None, ttl: Optional[float] = None):
+        self.name = name
+        self.holder = holder or default_replica_id()
+        self.ttl = ttl or settings.SCHEDULER_LEASE_TTL
+        self._lock = threading.Lock()
+        self._expires_at: Optional[datetime] = None
+
+    @property
+    def is_leader(self) -> bool:
+        """Держим ли аренду (по последнему успешному продлению, без запроса к БД)"""
+        with self._lock:
+            return self._expires_at is not None and datetime.utcnow() < self._expires_at
+
+    def try_acquire(self) -> bool:
+        """
+        Захватывает или продлевает аренду
+
+        Returns:
+            True, если эта реплика - ведущая
+        """
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=self.ttl)
+
+        db = SessionLocal()
+        try:
+            row = upsert(
+                db, SchedulerLease,
+                {"name": self.name, "holder": self.holder, "expires_at": expires_at, "renewed_at": now},
+                conflict=["name"],
+                update={
+                    "holder": lambda excluded: excluded.holder,
+                    "expires_at": lambda excluded: excluded.expires_at,
+                    "renewed_at": lambda excluded: excluded.renewed_at,
+                },
+                where=or_(SchedulerLease.holder == self.holder, SchedulerLease.expires_at < now),
+                returning=[SchedulerLease.holder]
+            )
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            print(f"Ошибка при продлении аренды {self.name}: {e}")
+            row = None
+        finally:
+            db.close()
+
+        acquired = row is not None and row.holder == self.holder
+        with self._lock:
+            if acquired:
+                self._expires_at = expires_at
+            elif self._expires_at is not None and datetime.utcnow() >= self._expires_at:
+                # Продлить не удалось, а срок вышел - роль потеряна
+                self._expires_at = None
+        return acquired
+
+    def release(self):
+        """Отдаёт аренду (при остановке), чтобы другая реплика не ждала истечения срока"""
+        with self._lock:
+            self._expires_at = None
+
+        db = SessionLocal()
+        try:
+            db.query(SchedulerLease).filter(
+                SchedulerLease.name == self.name,
+                SchedulerLease.holder == self.holder
+            ).delete()
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            print(f"Ошибка при освобождении аренды {self.name}: {e}")
+        finally:
+            db.close()
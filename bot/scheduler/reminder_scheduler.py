@@ -1,13 +1,24 @@
 """
 Планировщик напоминаний
 """
+import asyncio
+from typing import List
+from apscheduler.events import EVENT_JOB_SUBMITTED
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 from datetime import datetime
 from sqlalchemy.orm import Session
 from bot.database.db import get_db
 from bot.database.models import Reminder, User, Task
+from bot.database.retention import compact_task_logs
 from bot.ai.openai_client import AIClient
+from bot.gamification.habits import habit_materializer
+from bot.gamification.leaderboard import leaderboards
+from bot.scheduler.leader import LeaderLease
+from bot.transport.workers import worker_index
+from bot.utils.metrics import SCHEDULER_JOB_LAG
+from bot.utils.request_context import in_job_context
+from bot.utils.views import render_tasks_view
 from telegram import Bot
 from config.settings import settings
 import pytz
@@ -16,14 +27,36 @@ import pytz
 class ReminderScheduler:
     """Планировщик напоминаний"""
     
-    def __init__(self, bot: Bot):
+    def __init__(self, bot: Bot, leaderboard_snapshots: bool = True):
         self.bot = bot
+        # В режиме воркеров рейтинги живут в воркерах, фронту сохранять нечего
+        self.leaderboard_snapshots = leaderboard_snapshots
         self.scheduler = AsyncIOScheduler(timezone=pytz.timezone(settings.TIMEZONE))
+        # В режиме "leader" задачи есть у всех реплик, но выполняет их только держатель аренды
+        self.lease = LeaderLease() if settings.SCHEDULER_MODE == "leader" else None
     
-    def start(self):
-        """Запускает планировщик"""
+    def start(self, load_reminders: bool = True):
+        """
+        Запускает планировщик
+
+        Args:
+            load_reminders: Загрузить напоминания сразу; False - позже, через load_reminders_in_background
+        """
+        if self.lease:
+            self.lease.try_acquire()
+            self.scheduler.add_job(
+                self._renew_lease,
+                "interval",
+                seconds=settings.SCHEDULER_HEARTBEAT,
+                id="scheduler_lease"
+            )
+        
+        # Задержка запуска задач относительно расписания
+        self.scheduler.add_listener(self._observe_job_lag, EVENT_JOB_SUBMITTED)
+        
         # Загружаем напоминания из БД
-        self._load_reminders()
+        if load_reminders:
+            self._load_reminders()
         
         # Запускаем ежедневную проверку задач
         self.scheduler.add_job(
@@ -32,20 +65,84 @@ class ReminderScheduler:
             id="daily_tasks"
         )
         
+        # Периодически сохраняем снимок рейтингов для быстрого старта
+        if self.leaderboard_snapshots:
+            self.scheduler.add_job(
+                self._save_leaderboard_snapshot,
+                "interval",
+                minutes=settings.LEADERBOARD_SNAPSHOT_MINUTES,
+                id="leaderboard_snapshot"
+            )
+        
+        # Сворачиваем старые записи лога задач в помесячные итоги
+        if settings.TASK_LOG_RETENTION_DAYS > 0:
+            self.scheduler.add_job(
+                self._compact_task_logs,
+                CronTrigger(hour=settings.TASK_LOG_COMPACT_HOUR, minute=30),
+                id="compact_task_logs"
+            )
+        
         self.scheduler.start()
     
     def stop(self):
         """Останавливает планировщик"""
         self.scheduler.shutdown()
+        if self.lease:
+            self.lease.release()
+    
+    @staticmethod
+    def _observe_job_lag(event):
+        """Записывает, насколько позже расписания запущена задача"""
+        job = "reminder" if event.job_id.startswith("reminder_") else event.job_id
+        now = datetime.now(pytz.utc)
+        for scheduled_at in event.scheduled_run_times:
+            SCHEDULER_JOB_LAG.observe(max(0.0, (now - scheduled_at).total_seconds()), job=job)
+    
+    def _is_active(self) -> bool:
+        """Выполняет ли эта реплика задачи планировщика"""
+        return self.lease is None or self.lease.is_leader
+    
+    @staticmethod
+    def _owns_user(telegram_id: int) -> bool:
+        """Относится ли пользователь к этой реплике (режим "partition")"""
+        if settings.SCHEDULER_MODE != "partition" or settings.REPLICA_COUNT <= 1:
+            return True
+        return worker_index(telegram_id, settings.REPLICA_COUNT) == settings.REPLICA_INDEX
     
-    def _load_reminders(self):
+    async def _renew_lease(self):
+        """Продлевает аренду ведущего (или забирает истёкшую)"""
+        was_leader = self.lease.is_leader
+        is_leader = await asyncio.to_thread(self.lease.try_acquire)
+        if is_leader != was_leader:
+            print(f"Планировщик: реплика {self.lease.holder} {'стала ведущей' if is_leader else 'больше не ведущая'}")
+    
+    def _load_reminders(self) -> int:
         """Загружает напоминания из БД и добавляет их в планировщик"""
+        reminders = self._fetch_reminders()
+        for reminder in reminders:
+            self._schedule_reminder(reminder)
+        return len(reminders)
+    
+    async def load_reminders_in_background(self) -> int:
+        """
+        Загружает напоминания, читая БД в отдельном потоке
+
+        Returns:
+            Сколько напоминаний запланировано
+        """
+        reminders = await asyncio.to_thread(self._fetch_reminders)
+        for reminder in reminders:
+            self._schedule_reminder(reminder)
+        return len(reminders)
+    
+    def _fetch_reminders(self) -> List[Reminder]:
+        """Активные напоминания пользователей этой реплики"""
         db = next(get_db())
         try:
-            reminders = db.query(Reminder).filter(Reminder.is_active == True).all()
-            
-            for reminder in reminders:
-                self._schedule_reminder(reminder)
+            reminders = db.query(Reminder, User.telegram_id).join(User, Reminder.user_id == User.id).filter(
+                Reminder.is_active == True
+            ).all()
+            return [reminder for reminder, telegram_id in reminders if self._owns_user(telegram_id)]
         finally:
             db.close()
     
@@ -71,8 +168,12 @@ class ReminderScheduler:
             replace_existing=True
         )
     
+    @in_job_context("job:reminder")
     async def _send_reminder(self, reminder_id: int):
         """Отправляет напоминание"""
+        if not self._is_active():
+            return
+        
         db = next(get_db())
         try:
             reminder = db.query(Reminder).filter(Reminder.id == reminder_id).first()
@@ -90,7 +191,7 @@ class ReminderScheduler:
                     message += f"\n📅 Дедлайн: {task.deadline.strftime('%d.%m.%Y')}"
             
             # Генерируем мотивационное сообщение
-            motivation = AIClient.generate_motivation_message(True, "напоминание", user.level)
+            motivation = AIClient.generate_motivation_message(True, "напоминание", user.level, user_id=user.id)
             message += f"\n\n{motivation}"
             
             await self.bot.send_message(
@@ -107,29 +208,56 @@ class ReminderScheduler:
         finally:
             db.close()
     
+    async def _save_leaderboard_snapshot(self):
+        """Сохраняет снимок рейтингов (запись на диск - в отдельном потоке)"""
+        try:
+            snapshot = leaderboards.snapshot()
+            await asyncio.to_thread(leaderboards.save_snapshot, snapshot)
+        except Exception as e:
+            print(f"Ошибка при сохранении рейтингов: {e}")
+    
+    @in_job_context("job:compact_task_logs")
+    async def _compact_task_logs(self):
+        """Сворачивает старые записи лога задач (в отдельном потоке)"""
+        # Таблица общая - в режиме "partition" сворачивает только первая реплика
+        if not self._is_active() or (settings.SCHEDULER_MODE == "partition" and settings.REPLICA_INDEX != 0):
+            return
+        try:
+            report = await asyncio.to_thread(compact_task_logs)
+            if report["logs"]:
+                print(f"Лог задач: свёрнуто {report['logs']} записей в {report['summaries']} итоговых строк")
+        except Exception as e:
+            print(f"Ошибка при свёртке лога задач: {e}")
+    
+    @in_job_context("job:daily_tasks")
     async def _send_daily_tasks(self):
         """Отправляет ежедневный список задач"""
+        if not self._is_active():
+            return
+        
         db = next(get_db())
         try:
-            users = db.query(User).all()
+            # Задачи привычек на сегодня - всем разом, до чтения пользователей
+            habit_materializer.materialize(db)
             
-            for user in users:
-                # Получаем активные задачи
-                active_tasks = db.query(Task).filter(
-                    Task.user_id == user.id,
-                    Task.is_active == True,
-                    Task.is_completed == False
-                ).all()
-                
-                if not active_tasks:
+            # Пользователей читаем порциями (в PostgreSQL - серверным курсором), а не всех сразу
+            users = db.query(User.id, User.telegram_id).order_by(User.id).yield_per(settings.DIGEST_BATCH_SIZE)
+            
+            for user_id, telegram_id in users:
+                if not self._owns_user(telegram_id):
                     continue
                 
-                from bot.utils.formatters import MessageFormatter
-                message = MessageFormatter.format_task_list(active_tasks)
+                # Тот же текст, что и в /tasks (из кэша, если задачи не менялись)
+                message, reply_markup = render_tasks_view(db, user_id)
+                
+                if not reply_markup:
+                    # Нет активных задач
+                    continue
                 
                 await self.bot.send_message(
-                    chat_id=user.telegram_id,
-                    text=message
+                    chat_id=telegram_id,
+                    text=message,
+                    reply_markup=reply_markup
                 )
                 
         except Exception as e:
@@ -0,0 +1,50 @@
+"""
+Свёртка старых записей лога задач в помесячные итоги (то же делает планировщик раз в сутки)
+
+Запуск:
+    python -m bot.tools.compact_logs [--days 90] [--batch-size 5000] [--dry-run] [--vacuum]
+"""
+import argparse
+import time
+from datetime import datetime, timedelta
+from bot.database.db import init_db
+from bot.database.retention import MIN_RETENTION_DAYS, compact_task_logs, vacuum
+from config.settings import settings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Свёртка старых записей лога задач")
+    parser.add_argument("--days", type=int, default=settings.TASK_LOG_RETENTION_DAYS,
+                        help=f"Сворачивать записи старше стольких дней (не меньше {MIN_RETENTION_DAYS})")
+    parser.add_argument("--batch-size", type=int, default=settings.TASK_LOG_COMPACT_BATCH, help="Записей за транзакцию")
+    parser.add_argument("--dry-run", action="store_true", help="Только показать, что будет свёрнуто")
+    parser.add_argument("--vacuum", action="store_true", help="После свёртки вернуть место файлу БД (VACUUM)")
+    args = parser.parse_args()
+
+    if args.days <= 0:
+        print("Свёртка выключена (TASK_LOG_RETENTION_DAYS = 0)")
+        return
+
+    # Схема должна быть актуальной (числовой статус, таблица итогов)
+    init_db(fast=False)
+
+    days = max(args.days, MIN_RETENTION_DAYS)
+    before = datetime.utcnow() - timedelta(days=days)
+    started = time.perf_counter()
+    report = compact_task_logs(before=before, batch_size=args.batch_size, dry_run=args.dry_run)
+    elapsed = time.perf_counter() - started
+
+    print(f"Записи старше {days} дней (до {before:%Y-%m-%d}){' - пробный прогон' if args.dry_run else ''}")
+    print(f"Свёрнуто записей: {report['logs']} за {elapsed:.2f} с ({report['batches']} порций)")
+    print(f"Итоговых строк затронуто: {report['summaries']}")
+    if report["logs"] and not args.dry_run and settings.TASK_LOG_ARCHIVE_DIR:
+        print(f"Архив: {settings.TASK_LOG_ARCHIVE_DIR}")
+
+    if args.vacuum and not args.dry_run:
+        started = time.perf_counter()
+        vacuum()
+        print(f"VACUUM за {time.perf_counter() - started:.2f} с")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""
+Выгрузка задач, лога задач и полученных ачивок для аналитики
+
+Вместо копирования bot.db: строки читаются порциями и пишутся в Parquet
+(или Arrow IPC, или CSV), каждый запуск выгружает только новые строки.
+
+Запуск:
+    python -m bot.tools.export [--format parquet|arrow|csv] [--tables tasks,task_logs] [--full] [--out data/export]
+"""
+import argparse
+import time
+from bot.database.export import EXPORT_TABLES, FORMATS, default_format, export_history, load_pyarrow
+from config.settings import settings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Инкрементальная выгрузка истории пользователей")
+    parser.add_argument("--format", choices=FORMATS, default=None,
+                        help="Формат файлов (по умолчанию parquet, без pyarrow - csv)")
+    parser.add_argument("--tables", default=",".join(EXPORT_TABLES), help="Таблицы через запятую")
+    parser.add_argument("--out", default=settings.EXPORT_DIR, help="Папка выгрузки (там же state.json)")
+    parser.add_argument("--chunk-size", type=int, default=settings.EXPORT_CHUNK_SIZE, help="Строк за порцию")
+    parser.add_argument("--full", action="store_true", help="Выгрузить всё заново, не глядя на водяные знаки")
+    args = parser.parse_args()
+
+    tables = [table.strip() for table in args.tables.split(",") if table.strip()]
+    unknown = [table for table in tables if table not in EXPORT_TABLES]
+    if unknown:
+        parser.error(f"Неизвестные таблицы: {', '.join(unknown)} (есть: {', '.join(EXPORT_TABLES)})")
+
+    file_format = args.format or default_format()
+    if file_format != "csv" and load_pyarrow() is None:
+        parser.error(f"Для формата {file_format} нужен pyarrow (pip install pyarrow) - или --format csv")
+    started = time.perf_counter()
+    report = export_history(tables, args.out, file_format, args.full, args.chunk_size)
+    elapsed = time.perf_counter() - started
+
+    print(f"Выгрузка в {args.out} ({file_format}{', полная' if args.full else ''}) за {elapsed:.2f} с")
+    for table, result in report.items():
+        if result["path"]:
+            print(f"{table}: {result['rows']} строк, до id {result['last_id']} -> {result['path']}")
+        else:
+            print(f"{table}: новых строк нет (id до {result['last_id']})")
+
+
+if __name__ == "__main__":
+    main()
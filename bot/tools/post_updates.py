@@ -0,0 +1,61 @@
+"""
+Отправка записанных обновлений Telegram на локальный вебхук
+
+Файл - JSON-объект обновления, JSON-массив обновлений или JSON по строке.
+
+Запуск:
+    python -m bot.tools.post_updates updates.jsonl [--url http://127.0.0.1:8443/telegram]
+"""
+import argparse
+import json
+import time
+import urllib.error
+import urllib.request
+from config.settings import settings
+
+
+def load_updates(path: str) -> list:
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read().strip()
+    if text.startswith("["):
+        return json.loads(text)
+    if text.startswith("{") and "\n" not in text:
+        return [json.loads(text)]
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Отправка записанных обновлений на вебхук")
+    parser.add_argument("path", help="Файл с обновлениями")
+    parser.add_argument("--url", default=f"http://127.0.0.1:{settings.WEBHOOK_PORT}{settings.WEBHOOK_PATH}")
+    parser.add_argument("--secret", default=settings.WEBHOOK_SECRET_TOKEN)
+    args = parser.parse_args()
+
+    headers = {"Content-Type": "application/json"}
+    if args.secret:
+        headers["X-Telegram-Bot-Api-Secret-Token"] = args.secret
+
+    updates = load_updates(args.path)
+    started = time.perf_counter()
+    failed = 0
+    for update in updates:
+        request = urllib.request.Request(
+            args.url, data=json.dumps(update).encode("utf-8"), headers=headers, method="POST"
+        )
+        # urlopen бросает исключение на любой ответ не 2xx (403 - неверный секрет)
+        try:
+            with urllib.request.urlopen(request):
+                pass
+        except urllib.error.HTTPError as e:
+            failed += 1
+            print(f"update_id={update.get('update_id')}: HTTP {e.code}")
+        except urllib.error.URLError as e:
+            failed += 1
+            print(f"update_id={update.get('update_id')}: нет соединения ({e.reason})")
+
+    elapsed = time.perf_counter() - started
+    print(f"Отправлено обновлений: {len(updates) - failed} из {len(updates)} за {elapsed:.2f} с")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+"""
+Пересчёт уровней всех пользователей после изменения LEVEL_UP_BASE_XP или формулы
+
+Запуск:
+    python -m bot.tools.relevel [--chunk-size 5000] [--dry-run]
+"""
+import argparse
+import time
+from bot.gamification.releveling import relevel_all_users
+from config.settings import settings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Массовый пересчёт уровней пользователей")
+    parser.add_argument("--chunk-size", type=int, default=5000, help="Пользователей за один UPDATE")
+    parser.add_argument("--dry-run", action="store_true", help="Только показать, что изменится")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    report = relevel_all_users(chunk_size=args.chunk_size, dry_run=args.dry_run)
+    elapsed = time.perf_counter() - started
+
+    print(f"LEVEL_UP_BASE_XP = {settings.LEVEL_UP_BASE_XP}{' (пробный прогон)' if args.dry_run else ''}")
+    print(f"Пользователей: {report['total']} за {elapsed:.2f} с")
+    print(f"⬆️ Уровень вырос: {report['moved_up']}")
+    print(f"⬇️ Уровень снизился: {report['moved_down']}")
+    print(f"➖ Без изменений: {report['unchanged']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""
+Воспроизведение записанных обновлений на временной БД
+
+Лог пишет UpdateRecorder (UPDATE_LOG_PATH). Обновления проходят через те же
+обработчики и ту же параллельную обработку, что и в боте; бот - OfflineBot,
+ИИ по умолчанию - заглушка. В конце выводятся задержки по типам обновлений
+(от запланированного момента до конца обработки, т.е. с ожиданием в очереди)
+и контрольные суммы таблиц - по ним видно, что два прогона пришли в одно состояние.
+
+Запуск:
+    python -m bot.tools.replay data/updates.jsonl.gz [--speed 1] [--concurrency 16]
+
+    --speed 1 - в исходном темпе, 10 - в десять раз быстрее, 0 - без пауз
+"""
+import argparse
+import asyncio
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import time
+from typing import Dict, Iterator, List, Tuple
+
+
+def read_log(path: str) -> Iterator[Tuple[float, dict]]:
+    """
+    Записи лога: (секунды от начала, данные обновления)
+
+    Если лог дописывался несколькими запусками бота, время каждого
+    следующего запуска продолжает предыдущий.
+
+    Лог бота, который упал или был убит, обрывается: у gzip нет конца потока,
+    последняя строка может быть неполной. Такой хвост пропускается с предупреждением,
+    все записи до него (сброшенные на диск) воспроизводятся.
+    """
+    opener = gzip.open if path.endswith(".gz") else open
+    offset = 0.0
+    last = 0.0
+    with opener(path, "rt", encoding="utf-8") as f:
+        lines = iter(f)
+        while True:
+            try:
+                line = next(lines)
+            except StopIteration:
+                break
+            except (EOFError, gzip.BadGzipFile) as e:
+                print(f"Лог {path} оборван ({e}) - воспроизводятся записи до обрыва")
+                break
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                print(f"Лог {path} оборван на неполной записи - воспроизводятся записи до неё")
+                break
+            t = record["t"]
+            if t < last - offset:
+                offset = last
+            last = offset + t
+            yield last, record["u"]
+
+
+def update_kind(data: dict) -> str:
+    """Тип обновления для сводки: команда, сообщение или действие кнопки"""
+    if "message" in data:
+        text = data["message"].get("text") or ""
+        if text.startswith("/"):
+            return text.split()[0].split("@")[0]
+        return "сообщение"
+    if "callback_query" in data:
+        action = (data["callback_query"].get("data") or "").split(":")[0].split("_")[0]
+        return f"кнопка {action}"
+    return next((key for key in data if key != "update_id"), "другое")
+
+
+def state_checksums() -> Dict[str, Tuple[int, str]]:
+    """
+    Число строк и контрольная сумма каждой таблицы
+
+    Дата и время не учитываются: они зависят от момента воспроизведения.
+    """
+    from sqlalchemy import Date, DateTime, select
+    from bot.database.db import engine
+    from bot.database.models import Base
+
+    checksums = {}
+    with engine.connect() as connection:
+        for table in Base.metadata.sorted_tables:
+            columns = [c for c in table.columns if not isinstance(c.type, (Date, DateTime))]
+            digest = hashlib.sha256()
+            count = 0
+            for row in connection.execute(select(*columns).order_by(*table.primary_key.columns)):
+                digest.update(repr(tuple(row)).encode("utf-8"))
+                count += 1
+            checksums[table.name] = (count, digest.hexdigest()[:16])
+    return checksums
+
+
+async def replay(path: str, speed: float, concurrency: int) -> Tuple[Dict[str, List[float]], float]:
+    from telegram import Update
+    from telegram.ext import Application
+    from bot.database.db import init_db
+    from bot.main import register_handlers
+    from bot.transport.update_processor import PerUserUpdateProcessor
+    from bot.utils.offline_bot import OfflineBot
+
+    init_db()
+    processor = PerUserUpdateProcessor(concurrency)
+    application = Application.builder().bot(OfflineBot()).concurrent_updates(processor).build()
+    register_handlers(application)
+
+    latencies: Dict[str, List[float]] = {}
+    tasks = set()
+
+    async def process(update, kind: str, scheduled_at: float):
+        await processor.process_update(update, application.process_update(update))
+        latencies.setdefault(kind, []).append(time.perf_counter() - scheduled_at)
+
+    async with application:
+        started = time.perf_counter()
+        for t, data in read_log(path):
+            if speed > 0:
+                scheduled_at = started + t / speed
+                delay = scheduled_at - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            else:
+                scheduled_at = time.perf_counter()
+            update = Update.de_json(data, application.bot)
+            if concurrency <= 1:
+                # Строго по порядку записи: состояние БД воспроизводится точно
+                await process(update, update_kind(data), scheduled_at)
+                continue
+            task = asyncio.create_task(process(update, update_kind(data), scheduled_at))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            if speed <= 0:
+                # Без пауз: даём обработке идти, а не только набивать очередь
+                await asyncio.sleep(0)
+        if tasks:
+            await asyncio.wait(list(tasks))
+        elapsed = time.perf_counter() - started
+
+    return latencies, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Воспроизведение записанных обновлений")
+    parser.add_argument("path", help="Лог обновлений (.jsonl или .jsonl.gz)")
+    parser.add_argument("--speed", type=float, default=1.0, help="Ускорение; 0 - без пауз")
+    parser.add_argument("--concurrency", type=int, default=16, help="Обновлений одновременно (1 - строго по порядку, контрольные суммы повторяются)")
+    parser.add_argument("--database", default="", help="URL БД (по умолчанию - новая временная SQLite)")
+    parser.add_argument("--ai-provider", default="stub", help="stub, rules, local или openai")
+    args = parser.parse_args()
+
+    # Настройки читаются при импорте модулей бота - задаём их до импорта
+    os.environ["DATABASE_URL"] = args.database or f"sqlite:///{tempfile.mkdtemp(prefix='toxa-replay-')}/bot.db"
+    os.environ["AI_PROVIDER"] = args.ai_provider
+    os.environ["LEADERBOARD_SNAPSHOT_PATH"] = ""
+    os.environ["UPDATE_LOG_PATH"] = ""
+
+    from benchmarks.common import latency_row, print_table
+
+    latencies, elapsed = asyncio.run(replay(args.path, args.speed, args.concurrency))
+
+    rows = [latency_row(kind, samples) for kind, samples in sorted(latencies.items())]
+    total = [s for samples in latencies.values() for s in samples]
+    rows.append(latency_row("всего", total, elapsed))
+    print(f"БД: {os.environ['DATABASE_URL']}")
+    print(f"Обновлений: {len(total)} за {elapsed:.2f} с")
+    print_table(rows, ["name", "count", "p50", "p95", "p99", "max", "rps"])
+
+    print("\nСостояние БД:")
+    for table, (count, checksum) in state_checksums().items():
+        print(f"  {table}: {count} строк, {checksum}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+"""
+HTTP-клиент Bot API с метриками: сколько запросов в полёте и сколько они длятся
+"""
+import time
+from typing import Tuple
+from telegram.request import HTTPXRequest
+from bot.utils.metrics import BOT_API_IN_FLIGHT, BOT_API_LATENCY
+
+# Как у ApplicationBuilder по умолчанию
+DEFAULT_POOL_SIZE = 256
+
+
+class InstrumentedRequest(HTTPXRequest):
+    """HTTPXRequest, который учитывает запросы к Bot API в метриках"""
+
+    def __init__(self, connection_pool_size: int = DEFAULT_POOL_SIZE, **kwargs):
+        super().__init__(connection_pool_size=connection_pool_size, **kwargs)
+
+    async def do_request(self, url: str, method: str, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None) -> Tuple[int, bytes]:
+        # Метод Bot API - последний сегмент адреса (sendMessage, editMessageText, ...)
+        api_method = url.rsplit("/", 1)[-1]
+        BOT_API_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            return await super().do_request(
+                url, method, request_data, read_timeout, write_timeout, connect_timeout, pool_timeout
+            )
+        finally:
+            BOT_API_IN_FLIGHT.dec()
+            BOT_API_LATENCY.observe(time.perf_counter() - started, method=api_method)
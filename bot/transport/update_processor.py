@@ -0,0 +1,104 @@
+"""
+Параллельная обработка обновлений с сохранением порядка для каждого пользователя
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Dict, Hashable, Optional
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+from bot.utils.metrics import UPDATE_LATENCY, UPDATE_WAIT, UPDATES_PENDING, DB_QUERIES_PER_UPDATE, DB_TIME_PER_UPDATE
+from bot.utils.request_context import UpdateContext, update_label, update_scope
+
+logger = logging.getLogger(__name__)
+
+
+def update_key(update: object) -> Optional[Hashable]:
+    """Ключ упорядочивания: Telegram ID пользователя (или чата), None - без упорядочивания"""
+    if not isinstance(update, Update):
+        return None
+    if update.effective_user:
+        return update.effective_user.id
+    if update.effective_chat:
+        return update.effective_chat.id
+    return None
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """
+    Обновления разных пользователей обрабатываются параллельно,
+    обновления одного пользователя - строго по очереди.
+
+    Сначала берётся блокировка пользователя, потом общий слот: иначе один
+    пользователь с пачкой сообщений занял бы ожиданием все слоты и остановил остальных.
+
+    Args:
+        max_concurrent_updates: Сколько обновлений обрабатывается одновременно
+        max_pending_updates: Сколько обновлений может ждать и обрабатываться в сумме
+    """
+
+    def __init__(self, max_concurrent_updates: int, max_pending_updates: int = 1000):
+        super().__init__(max(max_pending_updates, max_concurrent_updates))
+        self.max_running_updates = max_concurrent_updates
+        self._running = asyncio.BoundedSemaphore(max_concurrent_updates)
+        self._locks: Dict[Hashable, asyncio.Lock] = {}
+        self._waiters: Dict[Hashable, int] = {}
+
+    @property
+    def pending_users(self) -> int:
+        """Пользователей, у которых есть обновления в работе или в очереди"""
+        return len(self._locks)
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        key = update_key(update)
+        context = UpdateContext(update_label(update), key, getattr(update, "update_id", None))
+        UPDATES_PENDING.inc()
+        try:
+            if key is None:
+                async with self._running:
+                    await self._run(context, coroutine)
+                return
+
+            lock = self._locks.get(key)
+            if lock is None:
+                lock = self._locks[key] = asyncio.Lock()
+            self._waiters[key] = self._waiters.get(key, 0) + 1
+
+            try:
+                # asyncio.Lock отдаёт блокировку ожидающим в порядке очереди
+                async with lock:
+                    async with self._running:
+                        await self._run(context, coroutine)
+            finally:
+                self._waiters[key] -= 1
+                if not self._waiters[key]:
+                    del self._waiters[key]
+                    del self._locks[key]
+        finally:
+            UPDATES_PENDING.dec()
+
+    @staticmethod
+    async def _run(context: UpdateContext, coroutine: Awaitable[Any]):
+        """Обрабатывает обновление с контекстом и метриками"""
+        started = time.perf_counter()
+        UPDATE_WAIT.observe(started - context.started, handler=context.handler)
+        try:
+            with update_scope(context):
+                try:
+                    await coroutine
+                finally:
+                    # Итоговая запись обновления (обработчик, пользователь и время добавит фильтр логов)
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug("Обновление обработано", extra={
+                            "latency_ms": round((time.perf_counter() - started) * 1000, 1)
+                        })
+        finally:
+            UPDATE_LATENCY.observe(time.perf_counter() - started, handler=context.handler)
+            DB_QUERIES_PER_UPDATE.observe(context.db_queries, handler=context.handler)
+            DB_TIME_PER_UPDATE.observe(context.db_seconds, handler=context.handler)
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
@@ -0,0 +1,106 @@
+"""
+Приём обновлений Telegram через вебхук на встроенном HTTP-сервере
+"""
+import asyncio
+import hmac
+import logging
+import signal
+from telegram import Update
+from telegram.ext import Application
+from bot.utils.http_server import HTTPServer, Request, Response
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "x-telegram-bot-api-secret-token"
+
+
+class WebhookServer:
+    """HTTP-сервер, который кладёт входящие обновления в очередь приложения"""
+
+    def __init__(self, application: Application, listen: str, port: int, path: str,
+                 secret_token: str = "", max_connections: int = 40):
+        self.application = application
+        self.path = path
+        self.secret_token = secret_token
+        self.http = HTTPServer(listen, port, max_connections=max_connections)
+        self.http.route("POST", path, self._handle_update)
+        self.http.route("GET", "/healthz", self._handle_health)
+
+    async def start(self):
+        await self.http.start()
+
+    async def stop(self):
+        await self.http.stop()
+
+    async def _handle_update(self, request: Request) -> Response:
+        if self.secret_token:
+            received = request.headers.get(SECRET_HEADER, "")
+            if not hmac.compare_digest(received, self.secret_token):
+                return Response(403, b"bad secret token")
+
+        try:
+            update = Update.de_json(request.json(), self.application.bot)
+        except Exception as e:
+            logger.warning(f"Некорректное обновление во вебхуке: {e}")
+            return Response(400, b"bad update")
+
+        # Отвечаем сразу: обработка идёт из очереди приложения
+        await self.application.update_queue.put(update)
+        return Response(200, b"ok")
+
+    async def _handle_health(self, request: Request) -> Response:
+        return Response(200, b"ok")
+
+
+async def run_webhook(application: Application):
+    """
+    Запускает бота в режиме вебхука и работает до SIGINT/SIGTERM
+
+    Если задан WEBHOOK_URL, регистрирует вебхук в Telegram; без него сервер
+    просто принимает обновления (удобно для локальной проверки записанными
+    обновлениями, см. python -m bot.tools.post_updates).
+    """
+    server = WebhookServer(
+        application,
+        listen=settings.WEBHOOK_LISTEN,
+        port=settings.WEBHOOK_PORT,
+        path=settings.WEBHOOK_PATH,
+        secret_token=settings.WEBHOOK_SECRET_TOKEN,
+        max_connections=settings.WEBHOOK_MAX_CONNECTIONS
+    )
+
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except NotImplementedError:
+            pass
+
+    async with application:
+        if application.post_init:
+            await application.post_init(application)
+        await application.start()
+
+        if settings.WEBHOOK_URL:
+            await application.bot.set_webhook(
+                url=settings.WEBHOOK_URL.rstrip("/") + settings.WEBHOOK_PATH,
+                secret_token=settings.WEBHOOK_SECRET_TOKEN or None,
+                max_connections=settings.WEBHOOK_MAX_CONNECTIONS,
+                allowed_updates=Update.ALL_TYPES
+            )
+
+        await server.start()
+        logger.info(f"Вебхук слушает {settings.WEBHOOK_LISTEN}:{server.http.port}{settings.WEBHOOK_PATH}")
+
+        await stop_event.wait()
+
+        logger.info("Остановка вебхука...")
+        await server.stop()
+        await application.stop()
+        if application.post_stop:
+            await application.post_stop(application)
+
+    if application.post_shutdown:
+        await application.post_shutdown(application)
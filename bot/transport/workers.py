@@ -0,0 +1,246 @@
+"""
+Режим воркеров: обновления обрабатываются в нескольких процессах
+
+Фронтовой процесс получает обновления (polling или вебхук) и раскладывает их
+по воркерам по хэшу Telegram ID пользователя. Все обновления одного пользователя
+попадают в один и тот же воркер, поэтому порядок для пользователя сохраняется,
+а общая пропускная способность растёт с числом ядер.
+
+У каждого воркера свой event loop, свои соединения с БД, свой кэш сообщений
+и свои рейтинги в памяти (рейтинги периодически пересобираются из БД, так как
+XP других пользователей начисляют другие воркеры).
+"""
+import asyncio
+import logging
+import multiprocessing
+import signal
+import time
+import zlib
+from typing import Callable, List, Optional
+from telegram import Bot, Update
+from telegram.ext import Application, ApplicationHandlerStop, TypeHandler
+from bot.transport.update_processor import PerUserUpdateProcessor, update_key
+from bot.utils.logging_setup import setup_logging
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Как часто фронт проверяет, живы ли воркеры (секунд)
+MONITOR_INTERVAL = 5
+
+BotFactory = Callable[[], Bot]
+
+
+def worker_index(key, workers: int) -> int:
+    """Номер воркера для ключа упорядочивания (стабилен между перезапусками)"""
+    if key is None or workers <= 1:
+        return 0
+    return zlib.crc32(str(key).encode("utf-8")) % workers
+
+
+class WorkerPool:
+    """
+    Процессы-воркеры и очереди к ним
+
+    Процессы запускаются через spawn: воркер не наследует соединения с БД
+    и состояние event loop фронта.
+
+    Args:
+        workers: Число воркеров
+        bot_factory: Функция уровня модуля, создающая бота в воркере
+            (по умолчанию - Bot с TELEGRAM_BOT_TOKEN)
+        processed: Общий счётчик обработанных обновлений (для бенчмарков)
+    """
+
+    def __init__(self, workers: int, bot_factory: Optional[BotFactory] = None, processed=None):
+        self.workers = workers
+        self.bot_factory = bot_factory
+        self._context = multiprocessing.get_context("spawn")
+        # Очереди создаёт фронт: при перезапуске воркер продолжит с того же места
+        self.queues = [self._context.Queue() for _ in range(workers)]
+        self.processes: List[Optional[multiprocessing.Process]] = [None] * workers
+        self.processed = processed
+        self.restarts = 0
+
+    def start(self):
+        """Запускает все воркеры"""
+        for index in range(self.workers):
+            self._start_worker(index)
+
+    def dispatch(self, update: Update):
+        """Отправляет обновление воркеру его пользователя"""
+        index = worker_index(update_key(update), self.workers)
+        self.queues[index].put(update.to_dict())
+
+    def ensure_alive(self) -> int:
+        """
+        Перезапускает упавшие воркеры
+
+        Returns:
+            Сколько воркеров перезапущено
+        """
+        restarted = 0
+        for index, process in enumerate(self.processes):
+            if process is not None and not process.is_alive():
+                logger.warning(f"Воркер {index} завершился с кодом {process.exitcode}, перезапуск")
+                self._start_worker(index)
+                restarted += 1
+        self.restarts += restarted
+        return restarted
+
+    def stop(self, timeout: float = 30):
+        """Просит воркеры доработать очередь и завершиться"""
+        for queue in self.queues:
+            queue.put(None)
+        deadline = time.monotonic() + timeout
+        for index, process in enumerate(self.processes):
+            if process is None:
+                continue
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                logger.warning(f"Воркер {index} не завершился вовремя, останавливаем принудительно")
+                process.terminate()
+                process.join()
+            self.processes[index] = None
+
+    def _start_worker(self, index: int):
+        process = self._context.Process(
+            target=run_worker,
+            args=(index, self.workers, self.queues[index], self.bot_factory, self.processed),
+            name=f"toxa-worker-{index}",
+            daemon=True
+        )
+        process.start()
+        self.processes[index] = process
+
+
+def run_worker(index: int, workers: int, queue, bot_factory: Optional[BotFactory] = None, processed=None):
+    """Точка входа процесса-воркера"""
+    # Ctrl+C приходит всей группе процессов; воркеры останавливает фронт, дав доработать очередь
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    log_listener = setup_logging(worker=index)
+    try:
+        asyncio.run(_serve_worker(index, workers, queue, bot_factory, processed))
+    finally:
+        log_listener.stop()
+
+
+async def _serve_worker(index: int, workers: int, queue, bot_factory: Optional[BotFactory], processed):
+    # Импорт здесь: bot.main импортирует этот модуль
+    from bot.main import register_handlers, start_monitoring, stop_monitoring
+    from bot.gamification.leaderboard import leaderboards, warm_start_leaderboards
+    from bot.transport.request import InstrumentedRequest
+
+    builder = Application.builder().concurrent_updates(
+        PerUserUpdateProcessor(settings.CONCURRENT_UPDATES, settings.MAX_PENDING_UPDATES)
+    )
+    if bot_factory:
+        builder = builder.bot(bot_factory())
+    else:
+        builder = builder.token(settings.TELEGRAM_BOT_TOKEN).request(InstrumentedRequest())
+    application = builder.build()
+    register_handlers(application)
+
+    await asyncio.to_thread(warm_start_leaderboards)
+    refresher = asyncio.create_task(_refresh_leaderboards_periodically(save_snapshots=index == 0))
+
+    pending = set()
+
+    def on_done(task: asyncio.Task):
+        pending.discard(task)
+        if processed is not None:
+            with processed.get_lock():
+                processed.value += 1
+
+    async with application:
+        await application.start()
+        await start_monitoring(application, settings.METRICS_PORT + 1 + index if settings.METRICS_PORT else 0)
+        logger.info(f"Воркер {index}/{workers} запущен")
+
+        while True:
+            data = await asyncio.to_thread(queue.get)
+            if data is None:
+                break
+            try:
+                update = Update.de_json(data, application.bot)
+            except Exception as e:
+                logger.warning(f"Воркер {index}: некорректное обновление: {e}")
+                continue
+            # Как в Application: каждое обновление - отдельная задача, порядок держит PerUserUpdateProcessor
+            task = asyncio.create_task(
+                application.update_processor.process_update(update, application.process_update(update))
+            )
+            pending.add(task)
+            task.add_done_callback(on_done)
+
+        if pending:
+            await asyncio.wait(list(pending))
+        refresher.cancel()
+        await stop_monitoring(application)
+        await application.stop()
+
+    if index == 0:
+        # Снимок рейтингов пишет один воркер: после пересборки рейтинги у всех одинаковые
+        leaderboards.save_snapshot(leaderboards.snapshot())
+    logger.info(f"Воркер {index} остановлен")
+
+
+async def _refresh_leaderboards_periodically(save_snapshots: bool = False):
+    """
+    Пересобирает рейтинги из БД (в отдельном потоке) и подменяет их целиком
+
+    Args:
+        save_snapshots: Записывать снимок рейтингов раз в LEADERBOARD_SNAPSHOT_MINUTES
+            (у фронта снимки выключены; без этого после падения рейтинги собирались бы с нуля)
+    """
+    from bot.database.db import SessionLocal
+    from bot.gamification.leaderboard import Leaderboards, leaderboards
+
+    def rebuild() -> Leaderboards:
+        fresh = Leaderboards()
+        db = SessionLocal()
+        try:
+            fresh.rebuild(db)
+        finally:
+            db.close()
+        return fresh
+
+    snapshot_interval = settings.LEADERBOARD_SNAPSHOT_MINUTES * 60
+    last_snapshot = time.monotonic()
+    while True:
+        await asyncio.sleep(settings.WORKER_LEADERBOARD_REFRESH)
+        try:
+            fresh = await asyncio.to_thread(rebuild)
+        except Exception as e:
+            logger.warning(f"Не удалось пересобрать рейтинги: {e}")
+            continue
+        # Подмена на event loop: обработчики не увидят наполовину собранные рейтинги
+        leaderboards.replace_with(fresh)
+
+        if save_snapshots and snapshot_interval > 0 and time.monotonic() - last_snapshot >= snapshot_interval:
+            last_snapshot = time.monotonic()
+            try:
+                await asyncio.to_thread(leaderboards.save_snapshot, leaderboards.snapshot())
+            except Exception as e:
+                logger.warning(f"Не удалось сохранить снимок рейтингов: {e}")
+
+
+def attach_router(application: Application, pool: WorkerPool):
+    """
+    Превращает приложение во фронт: все обновления уходят в воркеры
+
+    Маршрутизатор стоит в группе с наименьшим номером и останавливает
+    дальнейшую обработку, так что обработчики команд во фронте не вызываются.
+    """
+    async def route(update: Update, context):
+        pool.dispatch(update)
+        raise ApplicationHandlerStop
+
+    application.add_handler(TypeHandler(Update, route), group=-100)
+
+
+async def monitor_workers(pool: WorkerPool):
+    """Следит за воркерами и перезапускает упавшие (работает до отмены задачи)"""
+    while True:
+        await asyncio.sleep(MONITOR_INTERVAL)
+        pool.ensure_alive()
@@ -0,0 +1,84 @@
+"""
+Подавление повторных нажатий кнопок и повторных доставок callback-запросов
+"""
+import time
+from collections import OrderedDict
+from typing import Hashable, Optional
+from bot.utils.metrics import registry
+from config.settings import settings
+
+
+class CallbackDeduplicator:
+    """
+    Пропускает каждый callback-запрос один раз
+
+    Дубликаты определяются по ID callback-запроса (повторная доставка)
+    и по ключу действия (пользователь, действие, задача): пока действие
+    выполняется и ещё window секунд после, такое же действие отбрасывается
+    без обращения к БД.
+    """
+
+    def __init__(self, window: float, max_entries: int = 100000):
+        self.window = window
+        self.max_entries = max_entries
+        self._seen_ids: "OrderedDict[str, float]" = OrderedDict()
+        self._recent_keys: "OrderedDict[Hashable, float]" = OrderedDict()
+        self._in_flight = set()
+        # Счётчики подавленных дубликатов
+        self.suppressed_by_id = 0
+        self.suppressed_by_key = 0
+
+    def begin(self, query_id: str, key: Optional[Hashable]) -> bool:
+        """
+        Регистрирует начало обработки
+
+        Args:
+            query_id: ID callback-запроса
+            key: Ключ действия (None - только проверка по ID)
+
+        Returns:
+            True, если запрос нужно обработать; False - это дубликат
+        """
+        now = time.monotonic()
+        self._prune(now)
+
+        if query_id in self._seen_ids:
+            self.suppressed_by_id += 1
+            return False
+        self._seen_ids[query_id] = now + self.window
+
+        if key is None:
+            return True
+        if key in self._in_flight or key in self._recent_keys:
+            self.suppressed_by_key += 1
+            return False
+
+        self._in_flight.add(key)
+        return True
+
+    def finish(self, key: Optional[Hashable]):
+        """Отмечает окончание обработки: ключ ещё window секунд считается дубликатом"""
+        if key is None:
+            return
+        self._in_flight.discard(key)
+        self._recent_keys[key] = time.monotonic() + self.window
+        self._recent_keys.move_to_end(key)
+
+    def _prune(self, now: float):
+        """Удаляет истёкшие записи (они упорядочены по времени истечения)"""
+        for entries in (self._seen_ids, self._recent_keys):
+            while entries:
+                key, expires_at = next(iter(entries.items()))
+                if expires_at > now and len(entries) <= self.max_entries:
+                    break
+                entries.popitem(last=False)
+
+
+callback_deduplicator = CallbackDeduplicator(settings.CALLBACK_DEDUP_WINDOW)
+
+registry.counter(
+    "toxa_callback_duplicates_by_id_total", "Подавлено повторных доставок callback-запросов",
+    function=lambda: callback_deduplicator.suppressed_by_id)
+registry.counter(
+    "toxa_callback_duplicates_by_key_total", "Подавлено повторных нажатий кнопок",
+    function=lambda: callback_deduplicator.suppressed_by_key)
@@ -5,59 +5,108 @@ from datetime import datetime
 from typing import List, Optional
 from bot.database.models import Task, User
 from bot.gamification.xp_system import XPSystem
+from config.settings import settings
 
 
 class MessageFormatter:
     """Форматирование сообщений для бота"""
     
     @staticmethod
-    def format_task_list(tasks: List[Task]) -> str:
+    def format_task_page(tasks: List[Task], filter_title: str = "") -> str:
         """
-        Форматирует список задач
+        Форматирует страницу списка задач (нумерация - для компактных кнопок)
         
         Args:
-            tasks: Список задач
+            tasks: Задачи страницы
+            filter_title: Подпись фильтра ("" - без фильтра)
             
         Returns:
             Отформатированная строка
         """
         if not tasks:
+            if filter_title:
+                return f"📋 Нет активных задач ({filter_title})"
             return "📋 У тебя пока нет активных задач. Добавь новую командой /add"
         
-        # Группируем по категориям
-        tasks_by_category = {}
-        for task in tasks:
-            category_name = task.category.name if task.category else "Без категории"
-            if category_name not in tasks_by_category:
-                tasks_by_category[category_name] = []
-            tasks_by_category[category_name].append(task)
+        message = "🔥 Твои задачи на сегодня"
+        if filter_title:
+            message += f" ({filter_title})"
+        message += ":\n\n"
         
-        # Формируем сообщение
-        message = "🔥 Твои задачи на сегодня:\n\n"
-        
-        for category_name, category_tasks in tasks_by_category.items():
-            emoji = category_tasks[0].category.emoji if category_tasks[0].category and category_tasks[0].category.emoji else "📌"
-            message += f"{emoji} {category_name}:\n"
+        for number, task in enumerate(tasks, 1):
+            emoji = task.category.emoji if task.category and task.category.emoji else "📌"
+            title = task.title
+            if len(title) > settings.TASK_TITLE_PREVIEW:
+                title = title[:settings.TASK_TITLE_PREVIEW].rstrip() + "…"
+            message += f"{number}. {emoji} {title}"
+            
+            # Добавляем прогресс, если есть
+            if task.target_progress is not None:
+                progress_pct = (task.current_progress / task.target_progress * 100) if task.target_progress > 0 else 0
+                message += f" ({task.current_progress:.0f}/{task.target_progress:.0f} - {progress_pct:.0f}%)"
+            
+            # Добавляем дедлайн, если есть
+            if task.deadline:
+                message += f" [до {task.deadline.strftime('%d.%m.%Y')}]"
             
-            for i, task in enumerate(category_tasks, 1):
-                message += f"  {i}. {task.title}"
-                
-                # Добавляем прогресс, если есть
-                if task.target_progress is not None:
-                    progress_pct = (task.current_progress / task.target_progress * 100) if task.target_progress > 0 else 0
-                    message += f" ({task.current_progress:.0f}/{task.target_progress:.0f} - {progress_pct:.0f}%)"
-                
-                # Добавляем дедлайн, если есть
-                if task.deadline:
-                    deadline_str = task.deadline.strftime("%d.%m.%Y")
-                    message += f" [до {deadline_str}]"
-                
-                message += "\n"
+            if task.category:
+                message += f" · {task.category.name}"
             
             message += "\n"
         
         return message.strip()
     
+    @staticmethod
+    def format_created_tasks(tasks: List[Task]) -> str:
+        """
+        Форматирует итог добавления нескольких задач (нумерация - для компактных кнопок)
+        
+        Args:
+            tasks: Добавленные задачи (с категориями)
+            
+        Returns:
+            Отформатированная строка
+        """
+        message = f"✅ Добавлено задач: {len(tasks)}\n\n"
+        for number, task in enumerate(tasks, 1):
+            emoji = task.category.emoji if task.category and task.category.emoji else "📌"
+            title = task.title
+            if len(title) > settings.TASK_TITLE_PREVIEW:
+                title = title[:settings.TASK_TITLE_PREVIEW].rstrip() + "…"
+            message += f"{number}. {emoji} {title}"
+            if task.target_progress:
+                message += f" ({task.current_progress:.0f}/{task.target_progress:.0f})"
+            if task.deadline:
+                message += f" [до {task.deadline.strftime('%d.%m.%Y')}]"
+            if task.category:
+                message += f" · {task.category.name}"
+            message += "\n"
+        return message.strip()
+    
+    @staticmethod
+    def format_habits(habits: List, streaks: List[int], schedules: List[str]) -> str:
+        """
+        Форматирует список привычек (нумерация - для компактных кнопок)
+        
+        Args:
+            habits: Активные привычки
+            streaks: Текущая серия каждой привычки
+            schedules: Расписание каждой привычки словами
+            
+        Returns:
+            Отформатированная строка
+        """
+        if not habits:
+            return "🔁 Привычек пока нет. Добавь: /habit будни сторис или /habit каждые 2 дня бассейн"
+        
+        message = "🔁 Твои привычки:\n\n"
+        for number, (habit, streak, schedule) in enumerate(zip(habits, streaks, schedules), 1):
+            emoji = habit.category.emoji if habit.category and habit.category.emoji else "📌"
+            message += f"{number}. {emoji} {habit.title} - {schedule}"
+            message += f" · серия {streak} (лучшая {habit.best_streak or 0})\n"
+        message += "\nЗадачи привычек на сегодня - в /tasks. Кнопки 🗑 - больше не повторять"
+        return message.strip()
+    
     @staticmethod
     def format_progress(user: User) -> str:
         """
@@ -108,6 +157,37 @@ class MessageFormatter:
         
         return message.strip()
     
+    @staticmethod
+    def format_leaderboard(title: str, rows: List, user_place: Optional[int], user_score: Optional[int],
+                           total: int) -> str:
+        """
+        Форматирует рейтинг
+        
+        Args:
+            title: Заголовок рейтинга
+            rows: Список (место, имя, XP)
+            user_place: Место пользователя (None - его нет в рейтинге)
+            user_score: XP пользователя в рейтинге
+            total: Всего участников
+            
+        Returns:
+            Отформатированная строка
+        """
+        if not rows:
+            return f"{title}\n\nПока никого нет. Выполни задачу и стань первым! 🚀"
+        
+        medals = {1: "🥇", 2: "🥈", 3: "🥉"}
+        message = f"{title}:\n\n"
+        for place, name, score in rows:
+            message += f"{medals.get(place, f'{place}.')} {name} - {score} XP\n"
+        
+        if user_place:
+            message += f"\n📍 Твоё место: {user_place} из {total} ({user_score} XP)"
+        else:
+            message += "\n📍 Тебя пока нет в этом рейтинге"
+        
+        return message
+    
     @staticmethod
     def format_stats(stats: dict) -> str:
         """
@@ -0,0 +1,161 @@
+"""
+Минимальный асинхронный HTTP/1.1 сервер на asyncio (без внешних зависимостей)
+
+Нужен для вебхука Telegram и служебных эндпоинтов; умеет keep-alive,
+Content-Length и ограничение числа одновременных соединений.
+"""
+import asyncio
+import json
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+MAX_HEADER_SIZE = 16 * 1024
+MAX_BODY_SIZE = 4 * 1024 * 1024
+KEEP_ALIVE_TIMEOUT = 30
+
+STATUS_TEXT = {
+    200: "OK",
+    400: "Bad Request",
+    403: "Forbidden",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    503: "Service Unavailable",
+}
+
+
+class Request:
+    """HTTP-запрос"""
+
+    def __init__(self, method: str, path: str, headers: Dict[str, str], body: bytes):
+        self.method = method
+        self.path = path
+        self.headers = headers  # Имена заголовков в нижнем регистре
+        self.body = body
+
+    def json(self):
+        return json.loads(self.body.decode("utf-8"))
+
+
+class Response:
+    """HTTP-ответ"""
+
+    def __init__(self, status: int = 200, body: bytes = b"", content_type: str = "text/plain; charset=utf-8"):
+        self.status = status
+        self.body = body
+        self.content_type = content_type
+
+
+Handler = Callable[[Request], Awaitable[Response]]
+
+
+class HTTPServer:
+    """HTTP-сервер с таблицей маршрутов (method, path) -> обработчик"""
+
+    def __init__(self, host: str, port: int, max_connections: int = 100):
+        self.host = host
+        self.port = port
+        self.max_connections = max_connections
+        self._routes: Dict[Tuple[str, str], Handler] = {}
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._connections = 0
+
+    def route(self, method: str, path: str, handler: Handler):
+        """Регистрирует обработчик"""
+        self._routes[(method.upper(), path)] = handler
+
+    async def start(self):
+        """Начинает принимать соединения"""
+        self._server = await asyncio.start_server(self._serve_connection, self.host, self.port)
+        if self.port == 0:
+            # Порт выбран системой (удобно для локальных проверок)
+            self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        """Перестаёт принимать соединения"""
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        if self._connections >= self.max_connections:
+            await self._write(writer, Response(503, b"too many connections"), keep_alive=False)
+            writer.close()
+            return
+
+        self._connections += 1
+        try:
+            keep_alive = True
+            while keep_alive:
+                try:
+                    request = await asyncio.wait_for(self._read_request(reader), KEEP_ALIVE_TIMEOUT)
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except ValueError as e:
+                    await self._write(writer, Response(400, str(e).encode("utf-8")), keep_alive=False)
+                    break
+                if request is None:
+                    break
+
+                keep_alive = request.headers.get("connection", "").lower() != "close"
+                response = await self._dispatch(request)
+                await self._write(writer, response, keep_alive)
+        finally:
+            self._connections -= 1
+            writer.close()
+
+    async def _dispatch(self, request: Request) -> Response:
+        handler = self._routes.get((request.method, request.path))
+        if handler is None:
+            if any(path == request.path for _, path in self._routes):
+                return Response(405, b"method not allowed")
+            return Response(404, b"not found")
+        try:
+            return await handler(request)
+        except Exception as e:
+            print(f"Ошибка обработки HTTP-запроса {request.method} {request.path}: {e}")
+            return Response(503, b"internal error")
+
+    @staticmethod
+    async def _read_request(reader: asyncio.StreamReader) -> Optional[Request]:
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except asyncio.IncompleteReadError as e:
+            if not e.partial:
+                return None
+            raise
+        except asyncio.LimitOverrunError:
+            raise ValueError("headers too large")
+        if len(head) > MAX_HEADER_SIZE:
+            raise ValueError("headers too large")
+
+        lines = head.decode("latin-1").split("\r\n")
+        try:
+            method, target, _ = lines[0].split(" ", 2)
+        except ValueError:
+            raise ValueError("bad request line")
+
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                name, value = line.split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+
+        length = int(headers.get("content-length", "0") or 0)
+        if length > MAX_BODY_SIZE:
+            raise ValueError("body too large")
+        body = await reader.readexactly(length) if length else b""
+
+        return Request(method.upper(), target.split("?", 1)[0], headers, body)
+
+    @staticmethod
+    async def _write(writer: asyncio.StreamWriter, response: Response, keep_alive: bool):
+        head = (
+            f"HTTP/1.1 {response.status} {STATUS_TEXT.get(response.status, 'Unknown')}\r\n"
+            f"Content-Type: {response.content_type}\r\n"
+            f"Content-Length: {len(response.body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+            "\r\n"
+        )
+        writer.write(head.encode("latin-1") + response.body)
+        await writer.drain()
@@ -0,0 +1,181 @@
+"""
+Настройка логирования бота
+
+Обработчики только кладут записи в очередь; в файл и консоль их пишет
+фоновый поток (QueueListener), поэтому запись лога не останавливает
+event loop. Файл ротируется по размеру и по времени, старые части сжимаются
+в .gz. При LOG_FORMAT=json каждая запись - одна строка JSON с пользователем,
+обработчиком, update_id и временем обработки текущего обновления.
+"""
+import copy
+import gzip
+import json
+import logging
+import os
+import queue
+import shutil
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Optional
+from bot.utils.metrics import registry
+from bot.utils.request_context import get_update_context
+from config.settings import settings
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+LOG_DROPPED = registry.counter(
+    "toxa_log_records_dropped_total", "Записей лога, отброшенных из-за переполненной очереди")
+
+
+class UpdateContextFilter(logging.Filter):
+    """
+    Добавляет к записи данные текущего обновления
+
+    Работает в потоке, который пишет в лог (до очереди): только там виден контекст обновления.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        context = get_update_context()
+        if context is not None:
+            record.handler = context.handler
+            record.user_id = context.user_key
+            record.update_id = context.update_id
+            if not hasattr(record, "latency_ms"):
+                record.latency_ms = round((time.perf_counter() - context.started) * 1000, 1)
+        return True
+
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler, который при переполненной очереди отбрасывает запись, а не ждёт"""
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_DROPPED.inc()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Сообщение и трейсбек готовим здесь (аргументы могут измениться после вызова),
+        # а оформление оставляем форматтеру потока записи
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class TextFormatter(logging.Formatter):
+    """Обычный текстовый формат; у записей из обработки обновления - обработчик и пользователь в конце"""
+
+    def formatMessage(self, record: logging.LogRecord) -> str:
+        text = super().formatMessage(record)
+        handler = getattr(record, "handler", None)
+        if handler is None:
+            return text
+        return f"{text} [{handler} user={record.user_id} update={record.update_id} {record.latency_ms} мс]"
+
+
+class JSONFormatter(logging.Formatter):
+    """Одна запись - одна строка JSON"""
+
+    CONTEXT_FIELDS = ("handler", "user_id", "update_id", "latency_ms")
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S") + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for field in self.CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                data[field] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data["exc"] = record.exc_text
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class CompressingRotatingFileHandler(RotatingFileHandler):
+    """
+    Ротация по размеру и по времени, старые части сжимаются в .gz
+
+    Args:
+        filename: Путь к файлу лога
+        max_bytes: Размер, после которого файл ротируется (0 - без ограничения)
+        backup_count: Сколько старых частей хранить
+        rotate_hours: Ротировать не реже чем раз в столько часов (0 - только по размеру)
+    """
+
+    def __init__(self, filename: str, max_bytes: int, backup_count: int, rotate_hours: float):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8", delay=True)
+        self.rotate_seconds = rotate_hours * 3600
+        self.rollover_at = time.time() + self.rotate_seconds if self.rotate_seconds else None
+        self.namer = lambda name: name + ".gz"
+        self.rotator = self._compress
+
+    def shouldRollover(self, record: logging.LogRecord) -> bool:
+        if self.rollover_at is not None and time.time() >= self.rollover_at:
+            return True
+        return bool(super().shouldRollover(record))
+
+    def doRollover(self):
+        super().doRollover()
+        if self.rollover_at is not None:
+            self.rollover_at = time.time() + self.rotate_seconds
+
+    @staticmethod
+    def _compress(source: str, dest: str):
+        with open(source, "rb") as f_in, gzip.open(dest, "wb") as f_out:
+            shutil.copyfileobj(f_in, f_out)
+        os.remove(source)
+
+
+def log_file_for_worker(path: str, worker: Optional[int]) -> str:
+    """Свой файл для каждого воркера: несколько процессов не могут ротировать один файл"""
+    if worker is None or not path:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.worker{worker}{ext}"
+
+
+def setup_logging(worker: Optional[int] = None) -> QueueListener:
+    """
+    Настраивает корневой логгер: очередь и фоновый поток записи
+
+    Args:
+        worker: Номер процесса-воркера (у него свой файл лога)
+
+    Returns:
+        Запущенный QueueListener; при остановке бота - listener.stop(), чтобы дописать очередь
+    """
+    formatter = JSONFormatter() if settings.LOG_FORMAT == "json" else TextFormatter(TEXT_FORMAT)
+
+    handlers = [logging.StreamHandler()]
+    log_file = log_file_for_worker(settings.LOG_FILE, worker)
+    if log_file:
+        directory = os.path.dirname(os.path.abspath(log_file))
+        os.makedirs(directory, exist_ok=True)
+        handlers.append(CompressingRotatingFileHandler(
+            log_file, settings.LOG_MAX_BYTES, settings.LOG_BACKUP_COUNT, settings.LOG_ROTATE_HOURS
+        ))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.Queue(maxsize=settings.LOG_QUEUE_SIZE)
+    queue_handler = DroppingQueueHandler(log_queue)
+    queue_handler.addFilter(UpdateContextFilter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(settings.LOG_LEVEL.upper())
+
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    return listener
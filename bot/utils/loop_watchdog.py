@@ -0,0 +1,120 @@
+"""
+Сторож event loop
+
+Обработчики синхронно ходят в БД и к модели, и пока такой вызов идёт,
+стоят все пользователи. Корутина-пульс раз в interval замеряет опоздание
+цикла (метрика toxa_event_loop_lag_seconds), а отдельный поток следит за
+пульсом: если его нет дольше порога, он снимает стек потока event loop
+и пишет в лог вместе с обработчиком и update_id зависшей задачи.
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from typing import Optional
+from bot.utils.metrics import LOOP_LAG, LOOP_STALLS
+from bot.utils.request_context import running_tasks
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+class LoopWatchdog:
+    """
+    Замер опоздания event loop и поиск блокирующих вызовов
+
+    Args:
+        threshold: Сколько секунд без пульса считается блокировкой
+        interval: Период пульса, секунд
+    """
+
+    def __init__(self, threshold: float, interval: float = 0.1):
+        self.threshold = threshold
+        self.interval = interval
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._heartbeat: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        self._last_beat = time.monotonic()
+        self.stalls = 0
+
+    def start(self):
+        """Запускает пульс в текущем event loop и сторожевой поток"""
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._heartbeat = asyncio.create_task(self._beat())
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._heartbeat:
+            self._heartbeat.cancel()
+        if self._thread:
+            self._thread.join(timeout=self.interval * 2)
+
+    async def _beat(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            LOOP_LAG.observe(max(0.0, now - expected))
+            self._last_beat = now
+
+    def _watch(self):
+        # Последний пульс, на котором уже сообщили о блокировке (одна запись на блокировку)
+        reported_beat = None
+        while not self._stopped.wait(self.interval):
+            last_beat = self._last_beat
+            stalled = time.monotonic() - last_beat
+            if stalled < self.threshold:
+                if reported_beat is not None and last_beat != reported_beat:
+                    logger.warning(f"Event loop снова отвечает, блокировка длилась {last_beat - reported_beat:.2f} с")
+                    reported_beat = None
+                continue
+            if reported_beat == last_beat:
+                continue
+            reported_beat = last_beat
+            self._report(stalled)
+
+    def _report(self, stalled: float):
+        """Пишет в лог стек event loop и обновление, которое его держит"""
+        self.stalls += 1
+        task = asyncio.current_task(self._loop) if self._loop else None
+        context = running_tasks.get(task) if task is not None else None
+        handler = context.handler if context else "вне обновлений"
+        LOOP_STALLS.inc(handler=handler)
+
+        frame = sys._current_frames().get(self._loop_thread_id)
+        stack = _format_loop_stack(frame) if frame is not None else "(стек недоступен)\n"
+        if context:
+            where = f"обработчик {context.handler}, update_id {context.update_id}, пользователь {context.user_key}"
+        else:
+            where = f"задача {task.get_name()}" if task is not None else "вне задач"
+        logger.warning(f"Event loop заблокирован {stalled:.2f} с ({where}). Стек:\n{stack.rstrip()}")
+
+
+def _format_loop_stack(frame) -> str:
+    """Стек потока event loop без кадров самого asyncio (начинается с колбэка цикла)"""
+    frames = traceback.extract_stack(frame)
+    asyncio_dir = os.path.dirname(asyncio.__file__)
+    start = 0
+    for i, entry in enumerate(frames):
+        if entry.filename.startswith(asyncio_dir):
+            start = i + 1
+    # Если блокирует сам asyncio (например, selector), показываем всё
+    return "".join(traceback.format_list(frames[start:] or frames))
+
+
+def start_loop_watchdog() -> Optional[LoopWatchdog]:
+    """Запускает сторож в текущем event loop (если LOOP_WATCHDOG_THRESHOLD > 0)"""
+    if settings.LOOP_WATCHDOG_THRESHOLD <= 0:
+        return None
+    watchdog = LoopWatchdog(settings.LOOP_WATCHDOG_THRESHOLD, settings.LOOP_WATCHDOG_INTERVAL)
+    watchdog.start()
+    return watchdog
@@ -0,0 +1,286 @@
+"""
+Метрики бота в текстовом формате Prometheus
+
+Метрики живут в памяти процесса и отдаются по HTTP на /metrics
+(METRICS_HOST:METRICS_PORT; в режиме воркеров у воркера i порт METRICS_PORT + 1 + i).
+"""
+import threading
+from collections import deque
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from bot.utils.http_server import HTTPServer, Request, Response
+
+# Границы корзин гистограмм по умолчанию (секунды)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LabelValues = Tuple[str, ...]
+
+
+class Metric:
+    """Базовая метрика с метками"""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labels: Iterable[str] = (),
+                 function: Optional[Callable[[], float]] = None):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(labels)
+        # Значение можно не хранить, а читать при выдаче (счётчики других модулей)
+        self.function = function
+        self._lock = threading.Lock()
+        self._values: Dict[LabelValues, float] = {}
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def value(self, **labels) -> float:
+        """Текущее значение (для проверок и бенчмарков)"""
+        if self.function:
+            return self.function()
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> List[Tuple[str, LabelValues, float]]:
+        if self.function:
+            return [("", (), float(self.function()))]
+        with self._lock:
+            if not self._values and not self.label_names:
+                return [("", (), 0.0)]
+            return [("", key, value) for key, value in self._values.items()]
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, key, value in self.samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(self.label_names, key)} {_format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    """Монотонно растущий счётчик"""
+
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+
+class Gauge(Metric):
+    """Значение, которое может расти и уменьшаться"""
+
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    """Распределение значений по корзинам (плюс сумма и количество)"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+        # Метки -> (счётчики корзин, сумма, количество)
+        self._series: Dict[LabelValues, Tuple[List[int], float, int]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total, count = self._series.get(key) or ([0] * len(self.buckets), 0.0, 0)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self._series[key] = (counts, total + value, count + 1)
+
+    def value(self, **labels) -> float:
+        """Количество наблюдений"""
+        series = self._series.get(self._key(labels))
+        return series[2] if series else 0
+
+    def count(self) -> int:
+        """Количество наблюдений по всем меткам"""
+        with self._lock:
+            return sum(count for _, _, count in self._series.values())
+
+    def samples(self) -> List[Tuple[str, LabelValues, float]]:
+        result = []
+        with self._lock:
+            series = [(key, list(counts), total, count) for key, (counts, total, count) in self._series.items()]
+        for key, counts, total, count in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                result.append(("_bucket", key + (_format_value(bound),), cumulative))
+            result.append(("_bucket", key + ("+Inf",), count))
+            result.append(("_sum", key, total))
+            result.append(("_count", key, count))
+        return result
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, key, value in self.samples():
+            names = self.label_names + ("le",) if suffix == "_bucket" else self.label_names
+            lines.append(f"{self.name}{suffix}{_format_labels(names, key)} {_format_value(value)}")
+        return lines
+
+
+class Summary(Metric):
+    """Квантили по последним наблюдениям (скользящее окно)"""
+
+    kind = "summary"
+
+    def __init__(self, name: str, help_text: str, quantiles: Iterable[float] = (0.5, 0.95, 0.99), window: int = 1000):
+        super().__init__(name, help_text)
+        self.quantiles = tuple(quantiles)
+        self._window = deque(maxlen=window)
+        self._total = 0.0
+        self._count = 0
+
+    def observe(self, value: float):
+        with self._lock:
+            self._window.append(value)
+            self._total += value
+            self._count += 1
+
+    def value(self, **labels) -> float:
+        """Количество наблюдений"""
+        return self._count
+
+    def quantile(self, q: float) -> float:
+        """Квантиль по окну (0, если наблюдений ещё нет)"""
+        with self._lock:
+            ordered = sorted(self._window)
+        if not ordered:
+            return 0.0
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        for q in self.quantiles:
+            lines.append(f'{self.name}{{quantile="{_format_value(q)}"}} {_format_value(self.quantile(q))}')
+        lines.append(f"{self.name}_sum {_format_value(self._total)}")
+        lines.append(f"{self.name}_count {self._count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Все метрики процесса"""
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        """Добавляет метрику (повторная регистрация с тем же именем заменяет старую)"""
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, labels: Iterable[str] = (),
+                function: Optional[Callable[[], float]] = None) -> Counter:
+        return self.register(Counter(name, help_text, labels, function))
+
+    def gauge(self, name: str, help_text: str, labels: Iterable[str] = (),
+              function: Optional[Callable[[], float]] = None) -> Gauge:
+        return self.register(Gauge(name, help_text, labels, function))
+
+    def histogram(self, name: str, help_text: str, labels: Iterable[str] = (),
+                  buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help_text, labels, buckets))
+
+    def summary(self, name: str, help_text: str, quantiles: Iterable[float] = (0.5, 0.95, 0.99),
+                window: int = 1000) -> Summary:
+        return self.register(Summary(name, help_text, quantiles, window))
+
+    def render(self) -> str:
+        """Все метрики в текстовом формате Prometheus"""
+        lines = []
+        for metric in list(self._metrics.values()):
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                lines.append(f"# {metric.name}: ошибка чтения ({e})")
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(names: Tuple[str, ...], values: LabelValues) -> str:
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        escaped = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{name}="{escaped}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+registry = MetricsRegistry()
+
+# Обновления
+UPDATE_LATENCY = registry.histogram(
+    "toxa_update_duration_seconds", "Время обработки обновления", ["handler"])
+UPDATE_WAIT = registry.histogram(
+    "toxa_update_wait_seconds", "Ожидание обработки (очередь пользователя и общий лимит)", ["handler"])
+UPDATES_PENDING = registry.gauge(
+    "toxa_updates_pending", "Обновлений в обработке и в ожидании")
+
+# БД
+DB_QUERIES_PER_UPDATE = registry.histogram(
+    "toxa_db_queries_per_update", "SQL-запросов на обновление", ["handler"],
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200))
+DB_TIME_PER_UPDATE = registry.histogram(
+    "toxa_db_seconds_per_update", "Время SQL-запросов на обновление", ["handler"])
+DB_QUERIES = registry.counter(
+    "toxa_db_queries_total", "Всего SQL-запросов")
+
+# ИИ
+AI_LATENCY = registry.histogram(
+    "toxa_ai_request_duration_seconds", "Время запроса к модели", ["kind", "provider"])
+AI_FALLBACKS = registry.counter(
+    "toxa_ai_fallbacks_total", "Ответы без модели (правила или заготовки)", ["kind", "reason"])
+AI_TOKENS = registry.counter(
+    "toxa_ai_tokens_total", "Потрачено токенов", ["type"])
+
+# Bot API
+BOT_API_IN_FLIGHT = registry.gauge(
+    "toxa_bot_api_requests_in_flight", "Запросов к Bot API в процессе отправки")
+BOT_API_LATENCY = registry.histogram(
+    "toxa_bot_api_request_duration_seconds", "Время запроса к Bot API", ["method"])
+
+# Event loop
+LOOP_LAG = registry.summary(
+    "toxa_event_loop_lag_seconds", "Опоздание event loop (последние замеры)")
+LOOP_STALLS = registry.counter(
+    "toxa_event_loop_stalls_total", "Блокировки event loop дольше порога", ["handler"])
+
+# Планировщик
+SCHEDULER_JOB_LAG = registry.histogram(
+    "toxa_scheduler_job_lag_seconds", "Задержка запуска задачи относительно расписания", ["job"],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 15.0, 60.0, 300.0))
+
+
+async def start_metrics_server(host: str, port: int) -> HTTPServer:
+    """Запускает HTTP-сервер с /metrics"""
+    server = HTTPServer(host, port, max_connections=10)
+
+    async def handle_metrics(request: Request) -> Response:
+        return Response(200, registry.render().encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8")
+
+    server.route("GET", "/metrics", handle_metrics)
+    await server.start()
+    return server
@@ -0,0 +1,60 @@
+"""
+Бот без сети: отвечает на вызовы Bot API правдоподобными заготовками
+
+Нужен для бенчмарков, воспроизведения записанного трафика и воркеров в тестовом режиме.
+"""
+import asyncio
+import time
+from typing import Any, Dict
+from telegram.ext import ExtBot
+
+OFFLINE_TOKEN = "123456:offline"
+
+
+class OfflineBot(ExtBot):
+    """
+    ExtBot, который не ходит в Telegram
+
+    Args:
+        latency_ms: Искусственная задержка каждого вызова (имитация сети)
+    """
+
+    def __init__(self, token: str = OFFLINE_TOKEN, latency_ms: float = 0.0, **kwargs):
+        super().__init__(token, **kwargs)
+        # Объекты telegram заморожены после __init__; изменяемое состояние храним в словарях
+        with self._unfrozen():
+            self._offline_latency = latency_ms / 1000
+            self._offline_state = {"message_id": 0}
+            self.api_calls: Dict[str, int] = {}
+
+    async def _do_post(self, endpoint: str, data: Dict[str, Any], **kwargs) -> Any:
+        self.api_calls[endpoint] = self.api_calls.get(endpoint, 0) + 1
+        if self._offline_latency:
+            await asyncio.sleep(self._offline_latency)
+
+        if endpoint == "getMe":
+            return {
+                "id": int(self.token.split(":")[0]),
+                "is_bot": True,
+                "first_name": "Toxa",
+                "username": "toxa_offline_bot",
+            }
+
+        if endpoint in ("sendMessage", "editMessageText", "editMessageReplyMarkup"):
+            if "message_id" in data:
+                message_id = data["message_id"]
+            else:
+                self._offline_state["message_id"] += 1
+                message_id = self._offline_state["message_id"]
+            message = {
+                "message_id": message_id,
+                "date": int(time.time()),
+                "chat": {"id": data.get("chat_id") or 0, "type": "private"},
+                "text": data.get("text", ""),
+            }
+            reply_markup = data.get("reply_markup")
+            if reply_markup is not None:
+                message["reply_markup"] = reply_markup.to_dict() if hasattr(reply_markup, "to_dict") else reply_markup
+            return message
+
+        return True
@@ -0,0 +1,112 @@
+"""
+Кэш готовых сообщений (текст + клавиатура) по версии пользователя
+
+Версия пользователя растёт при любой записи его задач, логов, ачивок или XP
+(отслеживается событиями сессии SQLAlchemy), поэтому кэш не нужно чистить вручную:
+запись со старой версией просто не используется.
+"""
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+from sqlalchemy import event
+from bot.database.db import SessionLocal
+from bot.database.models import User, Task, TaskLog, UserAchievement
+from bot.utils.metrics import registry
+from config.settings import settings
+
+
+class RenderCache:
+    """LRU-кэш отрендеренных сообщений с версионированием по пользователю"""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        # TTL - страховка от записей, сделанных другим процессом (их версии здесь не видны)
+        self.ttl = ttl
+        self._versions: Dict[int, int] = {}
+        self._entries: "OrderedDict[Tuple[int, Hashable], Tuple[int, float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def version(self, user_id: int) -> int:
+        """Текущая версия данных пользователя"""
+        return self._versions.get(user_id, 0)
+
+    def bump(self, user_id: int):
+        """Отмечает, что данные пользователя изменились"""
+        self._versions[user_id] = self._versions.get(user_id, 0) + 1
+
+    def get(self, user_id: int, view: Hashable) -> Optional[Any]:
+        """Кэшированное значение или None, если его нет или оно устарело"""
+        key = (user_id, view)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        version, created_at, value = entry
+        if version != self.version(user_id) or time.monotonic() - created_at > self.ttl:
+            del self._entries[key]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, user_id: int, view: Hashable, value: Any, version: int):
+        """
+        Сохраняет значение
+
+        Args:
+            version: Версия пользователя на момент начала рендеринга
+        """
+        if version != self.version(user_id):
+            # Данные изменились, пока мы рендерили
+            return
+        self._entries[(user_id, view)] = (version, time.monotonic(), value)
+        self._entries.move_to_end((user_id, view))
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get_or_render(self, user_id: int, view: Hashable, render: Callable[[], Any]) -> Any:
+        """Возвращает кэшированное значение или рендерит и кэширует новое"""
+        value = self.get(user_id, view)
+        if value is None:
+            version = self.version(user_id)
+            value = render()
+            self.put(user_id, view, value, version)
+        return value
+
+
+render_cache = RenderCache(settings.RENDER_CACHE_SIZE, settings.RENDER_CACHE_TTL)
+
+registry.counter("toxa_render_cache_hits_total", "Попадания в кэш сообщений", function=lambda: render_cache.hits)
+registry.counter("toxa_render_cache_misses_total", "Промахи кэша сообщений", function=lambda: render_cache.misses)
+
+
+def _changed_user_ids(session) -> set:
+    """ID пользователей, чьи данные затронуты сбросом сессии"""
+    user_ids = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, User):
+            user_ids.add(obj.id)
+        elif isinstance(obj, (Task, TaskLog, UserAchievement)):
+            user_ids.add(obj.user_id)
+    user_ids.discard(None)
+    return user_ids
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _collect_changed_users(session, flush_context):
+    session.info.setdefault("render_changed_users", set()).update(_changed_user_ids(session))
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _bump_changed_users(session):
+    for user_id in session.info.pop("render_changed_users", ()):
+        render_cache.bump(user_id)
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _forget_changed_users(session):
+    session.info.pop("render_changed_users", None)
@@ -0,0 +1,93 @@
+"""
+Контекст обрабатываемого обновления
+
+Ставится в PerUserUpdateProcessor на время обработки и виден всему коду,
+который выполняется внутри (в том числе в потоках asyncio.to_thread):
+по нему SQL-запросы и вызовы ИИ относятся к своему обновлению.
+"""
+import asyncio
+import functools
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Optional
+from telegram import Update
+
+
+class UpdateContext:
+    """Что известно об обновлении, пока оно обрабатывается"""
+
+    def __init__(self, handler: str, user_key=None, update_id: Optional[int] = None):
+        self.handler = handler
+        self.user_key = user_key
+        self.update_id = update_id
+        self.started = time.perf_counter()
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        # Запросы обновления для профилировщика SQL (заполняет он сам, если включён)
+        self.sql_profile = None
+
+
+# Метки метрик: известные команды (заполняет register_handlers) и действия кнопок;
+# остальное сводится к одной метке, чтобы произвольный текст не плодил серии метрик
+KNOWN_COMMANDS = set()
+CALLBACK_ACTIONS = {"complete", "miss", "tasks", "habit"}
+
+current_update: ContextVar[Optional[UpdateContext]] = ContextVar("current_update", default=None)
+
+# Задачи asyncio, которые сейчас обрабатывают обновления: по ним сторожевой
+# поток event loop (он не видит contextvars цикла) находит обновление зависшей задачи
+running_tasks: Dict[asyncio.Task, UpdateContext] = {}
+
+
+def get_update_context() -> Optional[UpdateContext]:
+    """Контекст текущего обновления (None вне обработки обновлений и задач планировщика)"""
+    return current_update.get()
+
+
+@contextmanager
+def update_scope(context: UpdateContext):
+    """Делает context текущим на время обработки (в том числе для других потоков)"""
+    token = current_update.set(context)
+    task = asyncio.current_task()
+    if task is not None:
+        running_tasks[task] = context
+    try:
+        yield context
+    finally:
+        if task is not None:
+            running_tasks.pop(task, None)
+        current_update.reset(token)
+
+
+def in_job_context(handler: str):
+    """
+    Декоратор задачи планировщика: её запросы идут под меткой handler,
+    как запросы обработчика обновления
+
+    Args:
+        handler: Метка задачи, например "job:reminder"
+    """
+    def decorator(func: Callable[..., Awaitable[Any]]):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with update_scope(UpdateContext(handler)):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def update_label(update: object) -> str:
+    """Короткая метка обновления для метрик: команда, сообщение или действие кнопки"""
+    if not isinstance(update, Update):
+        return type(update).__name__
+    if update.message:
+        text = update.message.text or ""
+        if text.startswith("/"):
+            command = text.split()[0].split("@")[0][1:].lower()
+            return f"/{command}" if command in KNOWN_COMMANDS else "/other"
+        return "message"
+    if update.callback_query:
+        action = (update.callback_query.data or "").split(":")[0].split("_")[0]
+        return f"callback:{action if action in CALLBACK_ACTIONS else 'other'}"
+    return "other"
@@ -0,0 +1,220 @@
+"""
+Выборочный профилировщик работающего бота
+
+Включается на время (или на N обновлений) командой /profile или сигналом
+SIGUSR2. Отдельный поток раз в PROFILE_SAMPLE_INTERVAL снимает стек потока
+event loop и относит его к обработчику задачи, которая сейчас выполняется
+(message, callback:complete, job:daily_tasks...). Результат - файл свёрнутых
+стеков (формат flamegraph.pl, speedscope, inferno): первым кадром стека идёт
+обработчик. Пока профилировщик выключен, он ничего не стоит: потока нет.
+
+Снимается только поток event loop - именно он общий для всех пользователей;
+работа в потоках asyncio.to_thread в профиль не попадает.
+"""
+import asyncio
+import logging
+import os
+import selectors
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Callable, Dict, Optional
+from bot.utils.metrics import UPDATE_LATENCY
+from bot.utils.request_context import running_tasks
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+OUTSIDE_UPDATES = "вне обновлений"
+
+_ASYNCIO_DIR = os.path.dirname(asyncio.__file__)
+
+
+class ProfileResult:
+    """Итог одного запуска профилировщика"""
+
+    def __init__(self, path: str, duration: float, samples: int, idle: int, by_handler: Dict[str, int],
+                 top_functions: Dict[str, int]):
+        self.path = path
+        self.duration = duration
+        self.samples = samples
+        self.idle = idle
+        self.by_handler = by_handler
+        self.top_functions = top_functions
+
+    def summary(self, top: int = 10) -> str:
+        """Короткая сводка для администратора"""
+        busy = self.samples - self.idle
+        lines = [
+            f"Профиль за {self.duration:.1f} с: {self.samples} замеров, "
+            f"event loop занят {busy * 100 / max(1, self.samples):.0f}% времени",
+            f"Файл: {self.path}",
+        ]
+        if busy:
+            lines.append("\nПо обработчикам:")
+            for handler, count in sorted(self.by_handler.items(), key=lambda item: item[1], reverse=True)[:top]:
+                lines.append(f"  {handler}: {count * 100 / busy:.0f}%")
+            lines.append("\nФункции (собственное время):")
+            for function, count in sorted(self.top_functions.items(), key=lambda item: item[1], reverse=True)[:top]:
+                lines.append(f"  {count * 100 / busy:.0f}%  {function}")
+        return "\n".join(lines)
+
+
+class SamplingProfiler:
+    """
+    Снимает стеки event loop по таймеру
+
+    Args:
+        interval: Период замеров, секунд
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @property
+    def active(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, seconds: float, max_updates: int = 0,
+              on_done: Optional[Callable[[ProfileResult], None]] = None) -> bool:
+        """
+        Запускает профилирование в текущем event loop
+
+        Args:
+            seconds: Наибольшая длительность
+            max_updates: Остановиться после стольких обработанных обновлений (0 - только по времени)
+            on_done: Вызывается в event loop с результатом
+
+        Returns:
+            False, если профилировщик уже запущен
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self.active:
+                return False
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run,
+                args=(loop, threading.get_ident(), min(seconds, settings.PROFILE_MAX_SECONDS), max_updates, on_done),
+                name="sampling-profiler",
+                daemon=True,
+            )
+            self._thread.start()
+        return True
+
+    def stop(self):
+        """Досрочно останавливает профилирование (результат всё равно записывается)"""
+        self._stop.set()
+
+    def _run(self, loop: asyncio.AbstractEventLoop, loop_thread_id: int, seconds: float, max_updates: int,
+             on_done: Optional[Callable[[ProfileResult], None]]):
+        stacks: Counter = Counter()
+        functions: Counter = Counter()
+        by_handler: Counter = Counter()
+        samples = idle = 0
+        updates_at_start = UPDATE_LATENCY.count()
+        started = time.monotonic()
+        deadline = started + seconds
+
+        while not self._stop.wait(self.interval) and time.monotonic() < deadline:
+            if max_updates and UPDATE_LATENCY.count() - updates_at_start >= max_updates:
+                break
+            frame = sys._current_frames().get(loop_thread_id)
+            if frame is None:
+                break
+            samples += 1
+            frames = _user_frames(frame)
+            if not frames:
+                # Цикл ждёт событий (select) - бот свободен
+                idle += 1
+                continue
+            task = asyncio.current_task(loop)
+            context = running_tasks.get(task) if task is not None else None
+            handler = context.handler if context else OUTSIDE_UPDATES
+            stacks[";".join([handler] + frames)] += 1
+            functions[frames[-1]] += 1
+            by_handler[handler] += 1
+
+        duration = time.monotonic() - started
+        try:
+            path = _write_collapsed(stacks)
+        except OSError as e:
+            logger.warning(f"Не удалось записать профиль: {e}")
+            path = "(не записан)"
+        result = ProfileResult(path, duration, samples, idle, dict(by_handler), dict(functions))
+        logger.info(f"Профиль записан: {path} ({samples} замеров за {duration:.1f} с)")
+        if on_done and not loop.is_closed():
+            loop.call_soon_threadsafe(on_done, result)
+
+
+def _user_frames(frame) -> list:
+    """Кадры стека от колбэка цикла вглубь, без кадров самого asyncio, вида файл:функция"""
+    frames = []
+    while frame is not None:
+        code = frame.f_code
+        if code.co_filename.startswith(_ASYNCIO_DIR):
+            break
+        if code.co_filename == selectors.__file__:
+            # Ожидание событий в select - не работа
+            frame = frame.f_back
+            continue
+        frames.append(f"{_short_path(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    frames.reverse()
+    return frames
+
+
+def _short_path(filename: str) -> str:
+    """Путь относительно проекта или site-packages - короче и одинаков на разных машинах"""
+    index = filename.rfind("site-packages" + os.sep)
+    if index >= 0:
+        return filename[index + len("site-packages") + 1:]
+    index = filename.rfind(os.sep + "bot" + os.sep)
+    if index >= 0:
+        return filename[index + 1:]
+    return os.path.basename(filename)
+
+
+def _write_collapsed(stacks: Counter) -> str:
+    """Пишет свёрнутые стеки (строка: кадры через ";" и число замеров)"""
+    directory = Path(settings.PROFILE_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f"profile-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.folded"
+    with open(path, "w", encoding="utf-8") as f:
+        for stack, count in stacks.most_common():
+            f.write(f"{stack} {count}\n")
+    return str(path)
+
+
+sampling_profiler = SamplingProfiler(settings.PROFILE_SAMPLE_INTERVAL)
+
+
+def install_profile_signal(loop: asyncio.AbstractEventLoop) -> bool:
+    """
+    SIGUSR2 запускает профилирование на PROFILE_SIGNAL_SECONDS (повторный сигнал - останавливает)
+
+    Returns:
+        False, если сигналы недоступны (Windows или не главный поток)
+    """
+    import signal
+
+    if not hasattr(signal, "SIGUSR2"):
+        return False
+
+    def on_signal():
+        if sampling_profiler.active:
+            sampling_profiler.stop()
+        else:
+            sampling_profiler.start(settings.PROFILE_SIGNAL_SECONDS)
+            logger.info(f"Профилирование по сигналу на {settings.PROFILE_SIGNAL_SECONDS} с")
+
+    try:
+        loop.add_signal_handler(signal.SIGUSR2, on_signal)
+    except (NotImplementedError, RuntimeError, ValueError):
+        return False
+    return True
@@ -0,0 +1,196 @@
+"""
+Профилировщик SQL-запросов по обновлениям
+
+Включается при старте (SQL_PROFILE=true) или командой /sqlprofile on.
+Каждый запрос и его время относятся к обработчику текущего обновления
+(или задаче планировщика); один и тот же запрос, повторённый внутри одного
+обновления SQL_PROFILE_REPEAT_THRESHOLD раз и больше, помечается как
+вероятный N+1 (запрос в цикле вместо одной выборки).
+
+В режиме воркеров у каждого процесса свой профилировщик: команда
+включает его в том воркере, который обработал команду администратора.
+"""
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+from bot.utils.request_context import UpdateContext
+from config.settings import settings
+
+# Обработчик для запросов вне обновлений и задач (старт, фоновые потоки)
+BACKGROUND = "вне обновлений"
+
+_WHITESPACE = re.compile(r"\s+")
+_SELECT_COLUMNS = re.compile(r"^SELECT (.+?) FROM ")
+
+
+class StatementStats:
+    """Статистика одного текста запроса"""
+
+    __slots__ = ("count", "seconds", "repeated_updates", "max_repeats", "duplicates")
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        # Обновлений, в которых запрос повторился не меньше порога, и наибольший повтор
+        self.repeated_updates = 0
+        self.max_repeats = 0
+        # Повторы с теми же параметрами (одинаковые данные читаются дважды)
+        self.duplicates = 0
+
+
+class HandlerProfile:
+    """Запросы одного обработчика"""
+
+    def __init__(self):
+        self.updates = 0
+        self.queries = 0
+        self.seconds = 0.0
+        self.statements: Dict[str, StatementStats] = {}
+
+
+class UpdateQueries:
+    """Запросы внутри одного обновления (хранится в UpdateContext.sql_profile)"""
+
+    __slots__ = ("counts", "seen")
+
+    def __init__(self):
+        self.counts: Dict[str, int] = {}
+        self.seen = set()
+
+
+def normalize_statement(statement: str) -> str:
+    """Текст запроса в одну строку (параметры и так вынесены SQLAlchemy)"""
+    return _WHITESPACE.sub(" ", statement).strip()
+
+
+class SQLProfiler:
+    """
+    Сводка SQL-запросов по обработчикам
+
+    Args:
+        repeat_threshold: С какого повтора запроса внутри обновления он считается N+1
+    """
+
+    def __init__(self, repeat_threshold: int = 3):
+        self.enabled = False
+        self.repeat_threshold = max(2, repeat_threshold)
+        self.started_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self._handlers: Dict[str, HandlerProfile] = {}
+
+    def enable(self):
+        if not self.enabled:
+            self.enabled = True
+            self.started_at = time.time()
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        """Очищает собранную статистику"""
+        with self._lock:
+            self._handlers = {}
+            self.started_at = time.time() if self.enabled else None
+
+    def record(self, context: Optional[UpdateContext], statement: str, parameters, elapsed: float):
+        """Учитывает выполненный запрос (вызывается из события движка)"""
+        text = normalize_statement(statement)
+        handler = context.handler if context is not None else BACKGROUND
+
+        with self._lock:
+            profile = self._handlers.get(handler)
+            if profile is None:
+                profile = self._handlers[handler] = HandlerProfile()
+            stats = profile.statements.get(text)
+            if stats is None:
+                stats = profile.statements[text] = StatementStats()
+            profile.queries += 1
+            profile.seconds += elapsed
+            stats.count += 1
+            stats.seconds += elapsed
+
+            if context is None:
+                return
+
+            queries = context.sql_profile
+            if queries is None:
+                # Первый запрос обновления
+                queries = context.sql_profile = UpdateQueries()
+                profile.updates += 1
+
+            repeats = queries.counts.get(text, 0) + 1
+            queries.counts[text] = repeats
+            if repeats == self.repeat_threshold:
+                stats.repeated_updates += 1
+            if repeats >= self.repeat_threshold:
+                stats.max_repeats = max(stats.max_repeats, repeats)
+
+            key = (text, repr(parameters))
+            if key in queries.seen:
+                stats.duplicates += 1
+            else:
+                queries.seen.add(key)
+
+    def report(self, top: int = 5) -> str:
+        """Текстовая сводка: обработчики по суммарному времени в БД, их самые тяжёлые запросы и N+1"""
+        with self._lock:
+            handlers = sorted(self._handlers.items(), key=lambda item: item[1].seconds, reverse=True)
+            lines = [self._header()]
+            if not handlers:
+                lines.append("Запросов пока не было.")
+            for handler, profile in handlers:
+                lines.append("")
+                lines.extend(self._handler_lines(handler, profile, top))
+        return "\n".join(lines)
+
+    def write_report(self, path: Optional[str] = None) -> str:
+        """Записывает сводку в файл (по умолчанию SQL_PROFILE_REPORT_PATH) и возвращает путь"""
+        path = path or settings.SQL_PROFILE_REPORT_PATH
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.report(top=20) + "\n")
+        return path
+
+    def _header(self) -> str:
+        state = "включён" if self.enabled else "выключен"
+        if self.started_at is None:
+            return f"Профилировщик SQL {state}"
+        since = time.strftime("%d.%m.%Y %H:%M:%S", time.localtime(self.started_at))
+        return f"Профилировщик SQL {state}, данные с {since}"
+
+    def _handler_lines(self, handler: str, profile: HandlerProfile, top: int) -> List[str]:
+        if profile.updates:
+            lines = [
+                f"{handler}: {profile.updates} обн., "
+                f"{profile.queries / profile.updates:.1f} запр./обн., "
+                f"{profile.seconds * 1000 / profile.updates:.1f} мс/обн."
+            ]
+        else:
+            lines = [f"{handler}: {profile.queries} запр., {profile.seconds * 1000:.1f} мс"]
+
+        heaviest = sorted(profile.statements.items(), key=lambda item: item[1].seconds, reverse=True)[:top]
+        for text, stats in heaviest:
+            lines.append(f"  {stats.count}x {stats.seconds * 1000:.1f} мс  {_shorten(text)}")
+
+        repeated = [(text, stats) for text, stats in profile.statements.items() if stats.repeated_updates]
+        repeated.sort(key=lambda item: (item[1].repeated_updates, item[1].max_repeats), reverse=True)
+        for text, stats in repeated[:top]:
+            lines.append(
+                f"  N+1: до {stats.max_repeats} повторов в {stats.repeated_updates} обн."
+                f"{f', {stats.duplicates} с теми же параметрами' if stats.duplicates else ''}"
+                f"  {_shorten(text)}"
+            )
+        return lines
+
+
+def _shorten(text: str, limit: int = 160) -> str:
+    """Короткий вид запроса для сводки: без списка колонок SELECT"""
+    text = _SELECT_COLUMNS.sub("SELECT … FROM ", text, count=1)
+    return text if len(text) <= limit else text[:limit - 1] + "…"
+
+
+sql_profiler = SQLProfiler(settings.SQL_PROFILE_REPEAT_THRESHOLD)
+if settings.SQL_PROFILE:
+    sql_profiler.enable()
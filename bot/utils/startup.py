@@ -0,0 +1,43 @@
+"""
+Замер этапов запуска бота
+
+Отчёт пишется в лог, когда бот начинает принимать обновления,
+и отдельно - когда закончен фоновый прогрев (FAST_START).
+"""
+import time
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
+
+
+class StartupTimer:
+    """
+    Длительности этапов запуска
+
+    Args:
+        started: Момент начала запуска (time.perf_counter()); по умолчанию - сейчас
+    """
+
+    def __init__(self, started: Optional[float] = None):
+        self.started = started if started is not None else time.perf_counter()
+        self.steps: List[Tuple[str, float]] = []
+
+    @contextmanager
+    def step(self, name: str):
+        """Замеряет этап"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.steps.append((name, time.perf_counter() - started))
+
+    def mark(self, name: str, since: float):
+        """Записывает этап, начатый в момент since"""
+        self.steps.append((name, time.perf_counter() - since))
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def report(self, title: str) -> str:
+        """Строка вида "title за 1.23 с: этап 0.50 с, этап 0.10 с" """
+        steps = ", ".join(f"{name} {seconds:.2f} с" for name, seconds in self.steps)
+        return f"{title} за {self.elapsed():.2f} с: {steps}" if steps else f"{title} за {self.elapsed():.2f} с"
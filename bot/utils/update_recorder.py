@@ -0,0 +1,117 @@
+"""
+Запись входящих обновлений для воспроизведения (python -m bot.tools.replay)
+
+Каждая строка лога - JSON {"t": секунды от начала записи, "u": обновление}.
+ID пользователей и чатов заменяются псевдонимами (HMAC от ID), имена и
+юзернеймы удаляются. Файл с окончанием .gz пишется сжатым.
+"""
+import gzip
+import hashlib
+import hmac
+import json
+import logging
+import os
+import time
+from typing import Any, Optional
+from telegram import Update
+from telegram.ext import Application, TypeHandler
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Поля, по которым узнаём объект пользователя или чата
+PERSON_FIELDS = ("is_bot", "type")
+PRIVATE_FIELDS = ("first_name", "last_name", "username", "title", "phone_number")
+
+
+class UpdateRecorder:
+    """
+    Дописывает обновления в лог
+
+    Args:
+        path: Путь к логу (.jsonl или .jsonl.gz)
+        secret: Ключ псевдонимизации; с одним ключом псевдонимы совпадают между запусками
+        flush_every: Сбрасывать буфер на диск каждые N обновлений
+    """
+
+    def __init__(self, path: str, secret: str = "", flush_every: int = 100):
+        self.path = path
+        self._key = (secret or os.urandom(16).hex()).encode("utf-8")
+        self.flush_every = flush_every
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        if path.endswith(".gz"):
+            self._file = gzip.open(path, "at", encoding="utf-8")
+        else:
+            self._file = open(path, "a", encoding="utf-8")
+        self._started = time.monotonic()
+        self._unflushed = 0
+        self.recorded = 0
+
+    def pseudonym(self, value: int) -> int:
+        """Псевдоним ID: стабильный для ключа, знак сохраняется (у групп ID отрицательные)"""
+        digest = hmac.new(self._key, str(abs(value)).encode("utf-8"), hashlib.sha256).digest()
+        pseudonym = int.from_bytes(digest[:6], "big") or 1
+        return -pseudonym if value < 0 else pseudonym
+
+    def anonymize(self, data: Any) -> Any:
+        """Копия данных обновления без настоящих ID и имён"""
+        if isinstance(data, list):
+            return [self.anonymize(item) for item in data]
+        if not isinstance(data, dict):
+            return data
+
+        is_person = isinstance(data.get("id"), int) and any(field in data for field in PERSON_FIELDS)
+        result = {}
+        for key, value in data.items():
+            if is_person and key == "id":
+                result[key] = self.pseudonym(value)
+            elif is_person and key in PRIVATE_FIELDS:
+                if key == "first_name":
+                    result[key] = "User"
+            elif key == "chat_instance":
+                result[key] = hmac.new(self._key, value.encode("utf-8"), hashlib.sha256).hexdigest()[:16]
+            else:
+                result[key] = self.anonymize(value)
+        return result
+
+    def record(self, update: Update):
+        """Записывает обновление"""
+        line = {"t": round(time.monotonic() - self._started, 3), "u": self.anonymize(update.to_dict())}
+        self._file.write(json.dumps(line, ensure_ascii=False, separators=(",", ":")) + "\n")
+        self.recorded += 1
+        self._unflushed += 1
+        if self._unflushed >= self.flush_every:
+            self._file.flush()
+            self._unflushed = 0
+
+    def close(self):
+        self._file.close()
+
+
+def attach_recorder(application: Application, path: Optional[str] = None) -> Optional[UpdateRecorder]:
+    """
+    Включает запись обновлений приложения (если задан путь или UPDATE_LOG_PATH)
+
+    Запись стоит в группе до всех обработчиков (и до маршрутизатора воркеров)
+    и не мешает дальнейшей обработке.
+
+    Returns:
+        Рекордер или None, если запись выключена
+    """
+    path = path or settings.UPDATE_LOG_PATH
+    if not path:
+        return None
+    if not settings.UPDATE_LOG_SECRET:
+        logger.warning("UPDATE_LOG_SECRET не задан: псевдонимы пользователей будут другими после перезапуска")
+
+    recorder = UpdateRecorder(path, settings.UPDATE_LOG_SECRET)
+
+    async def record(update: Update, context):
+        try:
+            recorder.record(update)
+        except Exception as e:
+            logger.warning(f"Не удалось записать обновление: {e}")
+
+    application.add_handler(TypeHandler(Update, record), group=-1000)
+    logger.info(f"Запись обновлений в {path}")
+    return recorder
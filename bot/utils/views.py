@@ -0,0 +1,248 @@
+"""
+Готовые представления (текст + клавиатура) для команд и рассылок
+
+Рендеринг идёт через кэш по версии пользователя: /tasks, /progress и ежедневная
+рассылка переиспользуют текст, пока данные пользователя не изменились.
+"""
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from sqlalchemy.orm import Session, joinedload
+from bot.database.models import User, Task, Category, UserAchievement, HabitTemplate
+from bot.gamification.habits import HabitTracker
+from bot.utils.formatters import MessageFormatter
+from bot.utils.render_cache import render_cache
+from config.settings import settings
+
+
+# Фильтры по сроку: код в callback_data -> подпись
+DEADLINE_FILTERS = {
+    "t": "на сегодня",
+    "w": "на неделю",
+    "o": "просроченные",
+    "n": "без срока",
+}
+
+# Слова в /tasks -> код фильтра по сроку
+DEADLINE_KEYWORDS = {
+    "сегодня": "t",
+    "неделя": "w",
+    "просрочено": "o",
+    "просроченные": "o",
+    "бессрочные": "n",
+}
+
+
+class TaskFilter:
+    """Фильтр списка задач: категория и срок (компактно кодируется в callback_data)"""
+
+    def __init__(self, category_id: int = 0, deadline: str = ""):
+        self.category_id = category_id
+        self.deadline = deadline
+
+    def encode(self) -> str:
+        return f"{self.category_id}:{self.deadline}"
+
+    @staticmethod
+    def decode(data: str) -> "TaskFilter":
+        category_id, deadline = data.split(":")
+        return TaskFilter(int(category_id), deadline if deadline in DEADLINE_FILTERS else "")
+
+    @staticmethod
+    def from_args(db: Session, args: List[str]) -> Tuple[Optional["TaskFilter"], Optional[str]]:
+        """
+        Разбирает аргументы /tasks: [категория] [сегодня|неделя|просрочено|бессрочные]
+
+        Returns:
+            (фильтр, None) или (None, текст ошибки)
+        """
+        deadline = ""
+        words = []
+        for word in args:
+            code = DEADLINE_KEYWORDS.get(word.lower())
+            if code:
+                deadline = code
+            else:
+                words.append(word)
+
+        category_id = 0
+        if words:
+            name = " ".join(words)
+            # Сравниваем в Python: lower() в SQLite не работает с кириллицей
+            category = next(
+                (c for c in db.query(Category).all() if c.name.lower() == name.lower()),
+                None
+            )
+            if not category:
+                return None, f"❌ Категория «{name}» не найдена"
+            category_id = category.id
+
+        return TaskFilter(category_id, deadline), None
+
+    def apply(self, query):
+        """Добавляет условия фильтра к запросу задач"""
+        if self.category_id:
+            query = query.filter(Task.category_id == self.category_id)
+
+        today_start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+        if self.deadline == "t":
+            query = query.filter(Task.deadline >= today_start, Task.deadline < today_start + timedelta(days=1))
+        elif self.deadline == "w":
+            query = query.filter(Task.deadline >= today_start, Task.deadline < today_start + timedelta(days=7))
+        elif self.deadline == "o":
+            query = query.filter(Task.deadline < today_start)
+        elif self.deadline == "n":
+            query = query.filter(Task.deadline.is_(None))
+        return query
+
+    def describe(self, db: Session) -> str:
+        """Подпись фильтра для заголовка"""
+        parts = []
+        if self.category_id:
+            category = db.query(Category).filter(Category.id == self.category_id).first()
+            parts.append(category.name if category else "?")
+        if self.deadline:
+            parts.append(DEADLINE_FILTERS[self.deadline])
+        return ", ".join(parts)
+
+
+def compact_task_keyboard(task_ids: List[int]) -> List[List[InlineKeyboardButton]]:
+    """Компактные кнопки: по две задачи в ряд, название - по номеру в тексте"""
+    buttons = []
+    for number, task_id in enumerate(task_ids, 1):
+        buttons.append(InlineKeyboardButton(f"✅ {number}", callback_data=f"complete_{task_id}"))
+        buttons.append(InlineKeyboardButton(f"❌ {number}", callback_data=f"miss_{task_id}"))
+    return [buttons[i:i + 4] for i in range(0, len(buttons), 4)]
+
+
+def parse_tasks_callback(data: str) -> Tuple[TaskFilter, int, bool]:
+    """
+    Разбирает callback_data кнопок листания: tasks:<n|p><id>:<категория>:<срок>
+
+    Returns:
+        (фильтр, курсор, назад ли)
+    """
+    _, page, filter_data = data.split(":", 2)
+    return TaskFilter.decode(filter_data), int(page[1:]), page[0] == "p"
+
+
+def render_tasks_view(db: Session, user_id: int, task_filter: Optional[TaskFilter] = None,
+                      cursor: int = 0, backwards: bool = False) -> Tuple[str, Optional[InlineKeyboardMarkup]]:
+    """
+    Страница активных задач с кнопками
+
+    Листание по ключу (user_id, id): страница - один запрос по индексу
+    с LIMIT, без OFFSET и без загрузки всех задач.
+
+    Args:
+        db: Сессия БД
+        user_id: ID пользователя в БД
+        task_filter: Фильтр (по умолчанию - все активные задачи)
+        cursor: ID задачи, от которой листаем (0 - первая страница)
+        backwards: Листать назад (задачи с id меньше курсора)
+
+    Returns:
+        (текст, клавиатура или None, если задач нет)
+    """
+    task_filter = task_filter or TaskFilter()
+
+    def render():
+        size = settings.TASKS_PAGE_SIZE
+        # Категории подгружаем сразу, иначе будет запрос на каждую задачу
+        query = task_filter.apply(db.query(Task).options(joinedload(Task.category)).filter(
+            Task.user_id == user_id,
+            Task.is_active == True,
+            Task.is_completed == False
+        ))
+
+        tasks = []
+        has_prev = has_next = False
+        if backwards:
+            rows = query.filter(Task.id < cursor).order_by(Task.id.desc()).limit(size + 1).all()
+            tasks = list(reversed(rows[:size]))
+            has_prev = len(rows) > size
+            has_next = True
+        if not tasks:
+            start = cursor if not backwards else 0
+            rows = query.filter(Task.id > start).order_by(Task.id).limit(size + 1).all()
+            if not rows and start:
+                # Задачи после курсора закончились (например, их выполнили) - показываем начало
+                start = 0
+                rows = query.order_by(Task.id).limit(size + 1).all()
+            tasks = rows[:size]
+            has_prev = start > 0
+            has_next = len(rows) > size
+
+        message = MessageFormatter.format_task_page(tasks, task_filter.describe(db))
+        if not tasks:
+            return message, None
+
+        keyboard = compact_task_keyboard([task.id for task in tasks])
+
+        navigation = []
+        if has_prev:
+            navigation.append(InlineKeyboardButton("◀️ Назад", callback_data=f"tasks:p{tasks[0].id}:{task_filter.encode()}"))
+        if has_next:
+            navigation.append(InlineKeyboardButton("Вперёд ▶️", callback_data=f"tasks:n{tasks[-1].id}:{task_filter.encode()}"))
+        if navigation:
+            keyboard.append(navigation)
+
+        return message, InlineKeyboardMarkup(keyboard)
+
+    view = ("tasks", task_filter.encode(), cursor, backwards)
+    if task_filter.deadline in ("t", "w", "o"):
+        # Эти фильтры считаются от сегодняшней даты - в полночь страница меняется
+        view += (datetime.utcnow().date(),)
+    return render_cache.get_or_render(user_id, view, render)
+
+
+def render_progress_view(db: Session, user: User) -> str:
+    """
+    Прогресс пользователя (XP, уровень, ачивки)
+
+    Args:
+        db: Сессия БД
+        user: Пользователь
+
+    Returns:
+        Текст сообщения
+    """
+    def render():
+        message = MessageFormatter.format_progress(user)
+
+        # Ачивки вместе с описаниями одним запросом
+        achievements = db.query(UserAchievement).options(
+            joinedload(UserAchievement.achievement)
+        ).filter(UserAchievement.user_id == user.id).all()
+        if achievements:
+            message += "\n\n" + MessageFormatter.format_achievements(achievements)
+
+        return message
+
+    return render_cache.get_or_render(user.id, "progress", render)
+
+
+def render_habits_view(db: Session, user_id: int) -> Tuple[str, Optional[InlineKeyboardMarkup]]:
+    """
+    Активные привычки с сериями и кнопками отключения
+
+    Returns:
+        (текст, клавиатура или None, если привычек нет)
+    """
+    habits = db.query(HabitTemplate).options(joinedload(HabitTemplate.category)).filter(
+        HabitTemplate.user_id == user_id,
+        HabitTemplate.is_active == True
+    ).order_by(HabitTemplate.id).all()
+
+    today = datetime.utcnow().date()
+    message = MessageFormatter.format_habits(
+        habits,
+        [HabitTracker.current_streak(habit, today) for habit in habits],
+        [HabitTracker.describe(habit) for habit in habits]
+    )
+    if not habits:
+        return message, None
+
+    buttons = [InlineKeyboardButton(f"🗑 {number}", callback_data=f"habit_stop_{habit.id}")
+               for number, habit in enumerate(habits, 1)]
+    return message, InlineKeyboardMarkup([buttons[i:i + 4] for i in range(0, len(buttons), 4)])
@@ -18,18 +18,147 @@ class Settings(BaseSettings):
     # Telegram
     TELEGRAM_BOT_TOKEN: str = os.getenv("TELEGRAM_BOT_TOKEN", "")
     
+    # Режим получения обновлений: "polling" или "webhook"
+    BOT_MODE: str = os.getenv("BOT_MODE", "polling")
+    
+    # Вебхук
+    WEBHOOK_LISTEN: str = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+    WEBHOOK_PORT: int = int(os.getenv("WEBHOOK_PORT", "8443"))
+    WEBHOOK_PATH: str = os.getenv("WEBHOOK_PATH", "/telegram")
+    WEBHOOK_URL: str = os.getenv("WEBHOOK_URL", "")  # Публичный адрес, например https://bot.example.com
+    WEBHOOK_SECRET_TOKEN: str = os.getenv("WEBHOOK_SECRET_TOKEN", "")
+    WEBHOOK_MAX_CONNECTIONS: int = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+    
+    # Параллельная обработка обновлений (обновления одного пользователя - всегда по очереди)
+    CONCURRENT_UPDATES: int = int(os.getenv("CONCURRENT_UPDATES", "16"))  # 1 - последовательно
+    MAX_PENDING_UPDATES: int = int(os.getenv("MAX_PENDING_UPDATES", "1000"))
+    
+    # Процессы-воркеры (0 или 1 - всё в одном процессе)
+    WORKERS: int = int(os.getenv("WORKERS", "0"))
+    WORKER_LEADERBOARD_REFRESH: float = float(os.getenv("WORKER_LEADERBOARD_REFRESH", "60"))  # Секунд
+    
+    # Логи: запись в файл идёт из фонового потока, файл ротируется и сжимается
+    LOG_FILE: str = os.getenv("LOG_FILE", "bot.log")  # Пусто - только консоль; у воркера i - bot.worker<i>.log
+    LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
+    LOG_FORMAT: str = os.getenv("LOG_FORMAT", "text")  # "text" или "json"
+    LOG_MAX_BYTES: int = int(os.getenv("LOG_MAX_BYTES", str(20 * 1024 * 1024)))  # 0 - без ротации по размеру
+    LOG_ROTATE_HOURS: float = float(os.getenv("LOG_ROTATE_HOURS", "24"))  # 0 - без ротации по времени
+    LOG_BACKUP_COUNT: int = int(os.getenv("LOG_BACKUP_COUNT", "10"))  # Сжатых старых частей
+    LOG_QUEUE_SIZE: int = int(os.getenv("LOG_QUEUE_SIZE", "10000"))  # При переполнении записи отбрасываются
+    
+    # Метрики Prometheus на http://METRICS_HOST:METRICS_PORT/metrics (0 - выключены)
+    METRICS_HOST: str = os.getenv("METRICS_HOST", "127.0.0.1")
+    METRICS_PORT: int = int(os.getenv("METRICS_PORT", "9108"))  # Воркер i - METRICS_PORT + 1 + i
+    
+    # Администраторы бота: Telegram ID через запятую (служебные команды вроде /sqlprofile)
+    ADMIN_IDS: str = os.getenv("ADMIN_IDS", "")
+    
+    # Профилировщик SQL по обработчикам (включается и командой /sqlprofile on)
+    SQL_PROFILE: bool = os.getenv("SQL_PROFILE", "false").lower() in ("1", "true", "yes")
+    SQL_PROFILE_REPEAT_THRESHOLD: int = int(os.getenv("SQL_PROFILE_REPEAT_THRESHOLD", "3"))  # Повторов запроса за обновление для пометки N+1
+    SQL_PROFILE_REPORT_PATH: str = os.getenv("SQL_PROFILE_REPORT_PATH", f"{BASE_DIR}/data/sql_profile.txt")
+    
+    # Сторож event loop: блокировку дольше порога пишет в лог со стеком вызова (0 - выключен)
+    LOOP_WATCHDOG_THRESHOLD: float = float(os.getenv("LOOP_WATCHDOG_THRESHOLD", "0.5"))  # Секунд
+    LOOP_WATCHDOG_INTERVAL: float = float(os.getenv("LOOP_WATCHDOG_INTERVAL", "0.1"))  # Секунд между замерами
+    
+    # Выборочный профилировщик (команда /profile, сигнал SIGUSR2)
+    PROFILE_DIR: str = os.getenv("PROFILE_DIR", f"{BASE_DIR}/data/profiles")
+    PROFILE_SAMPLE_INTERVAL: float = float(os.getenv("PROFILE_SAMPLE_INTERVAL", "0.005"))  # Секунд между замерами
+    PROFILE_SIGNAL_SECONDS: float = float(os.getenv("PROFILE_SIGNAL_SECONDS", "30"))  # Длительность по сигналу
+    PROFILE_MAX_SECONDS: float = float(os.getenv("PROFILE_MAX_SECONDS", "600"))
+    
+    # Запись входящих обновлений для воспроизведения (пусто - не записывать)
+    UPDATE_LOG_PATH: str = os.getenv("UPDATE_LOG_PATH", "")  # Например data/updates.jsonl.gz
+    UPDATE_LOG_SECRET: str = os.getenv("UPDATE_LOG_SECRET", "")  # Ключ псевдонимизации ID
+    
+    # Окно подавления повторных нажатий кнопок (секунд)
+    CALLBACK_DEDUP_WINDOW: float = float(os.getenv("CALLBACK_DEDUP_WINDOW", "10"))
+    
     # OpenAI
     OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY", "")
     OPENAI_MODEL: str = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")
     
+    # Провайдер ИИ: "openai", "local", "stub", "rules" (пусто - openai при наличии ключа, иначе rules)
+    AI_PROVIDER: str = os.getenv("AI_PROVIDER", "")
+    
+    # Локальный сервер модели с OpenAI-совместимым API
+    LOCAL_AI_URL: str = os.getenv("LOCAL_AI_URL", "http://127.0.0.1:8080/v1")
+    LOCAL_AI_MODEL: str = os.getenv("LOCAL_AI_MODEL", "local-model")
+    LOCAL_AI_TIMEOUT: float = float(os.getenv("LOCAL_AI_TIMEOUT", "30"))
+    
+    # Заглушка ИИ для нагрузочных тестов
+    STUB_AI_LATENCY_MS: float = float(os.getenv("STUB_AI_LATENCY_MS", "0"))
+    STUB_AI_JITTER_MS: float = float(os.getenv("STUB_AI_JITTER_MS", "0"))
+    STUB_AI_ERROR_RATE: float = float(os.getenv("STUB_AI_ERROR_RATE", "0"))
+    STUB_AI_SEED: int = int(os.getenv("STUB_AI_SEED", "0"))
+    
+    # Лимиты ИИ на пользователя
+    AI_RATE_LIMIT_BURST: int = int(os.getenv("AI_RATE_LIMIT_BURST", "5"))  # Запросов подряд без ожидания
+    AI_RATE_LIMIT_PER_MINUTE: float = float(os.getenv("AI_RATE_LIMIT_PER_MINUTE", "6"))  # Скорость пополнения
+    AI_DAILY_TOKEN_BUDGET: int = int(os.getenv("AI_DAILY_TOKEN_BUDGET", "20000"))  # 0 - без лимита
+    
+    # Потоковая выдача ответов ИИ
+    AI_STREAMING: bool = os.getenv("AI_STREAMING", "true").lower() in ("1", "true", "yes")
+    STREAM_EDIT_INTERVAL: float = float(os.getenv("STREAM_EDIT_INTERVAL", "1.0"))  # Секунд между правками сообщения
+    
+    # Быстрый старт: проверка схемы БД пропускается, если её отпечаток не изменился,
+    # а рейтинги, напоминания и клиент ИИ загружаются в фоне после начала приёма обновлений
+    FAST_START: bool = os.getenv("FAST_START", "true").lower() in ("1", "true", "yes")
+    
     # Database
     DATABASE_URL: str = os.getenv("DATABASE_URL", f"sqlite:///{BASE_DIR}/data/bot.db")
+    # Пул соединений (PostgreSQL и другие серверные БД)
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "5"))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+    DB_POOL_TIMEOUT: float = float(os.getenv("DB_POOL_TIMEOUT", "30"))  # Секунд ожидания свободного соединения
+    DB_POOL_RECYCLE: int = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # Секунд жизни соединения
+    DB_STATEMENT_TIMEOUT_MS: int = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "5000"))  # 0 - без ограничения
+    DB_LOCK_TIMEOUT: float = float(os.getenv("DB_LOCK_TIMEOUT", "15"))  # SQLite: ожидание блокировки, секунд
+    DIGEST_BATCH_SIZE: int = int(os.getenv("DIGEST_BATCH_SIZE", "500"))  # Пользователей за выборку в рассылке
     
     # Геймификация
     XP_PER_TASK: int = int(os.getenv("XP_PER_TASK", "10"))
     XP_MULTIPLIER: float = float(os.getenv("XP_MULTIPLIER", "1.0"))
     LEVEL_UP_BASE_XP: int = int(os.getenv("LEVEL_UP_BASE_XP", "100"))
     
+    # Рейтинги
+    LEADERBOARD_SIZE: int = int(os.getenv("LEADERBOARD_SIZE", "10"))
+    LEADERBOARD_SNAPSHOT_PATH: str = os.getenv("LEADERBOARD_SNAPSHOT_PATH", f"{BASE_DIR}/data/leaderboard.json")
+    LEADERBOARD_SNAPSHOT_MINUTES: int = int(os.getenv("LEADERBOARD_SNAPSHOT_MINUTES", "10"))
+    
+    # Свёртка старых записей лога задач в помесячные итоги
+    TASK_LOG_RETENTION_DAYS: int = int(os.getenv("TASK_LOG_RETENTION_DAYS", "90"))  # 0 - не сворачивать; не меньше 35
+    TASK_LOG_ARCHIVE_DIR: str = os.getenv("TASK_LOG_ARCHIVE_DIR", f"{BASE_DIR}/data/archive")  # Пусто - без архива
+    TASK_LOG_COMPACT_BATCH: int = int(os.getenv("TASK_LOG_COMPACT_BATCH", "5000"))
+    TASK_LOG_COMPACT_HOUR: int = int(os.getenv("TASK_LOG_COMPACT_HOUR", "4"))  # Час запуска (по TIMEZONE)
+    
+    # Выгрузка истории для аналитики (python -m bot.tools.export)
+    EXPORT_DIR: str = os.getenv("EXPORT_DIR", f"{BASE_DIR}/data/export")
+    EXPORT_CHUNK_SIZE: int = int(os.getenv("EXPORT_CHUNK_SIZE", "10000"))
+    # Сколько последних id перечитывать (PostgreSQL: строки с меньшим id могут зафиксироваться позже); на SQLite не нужно
+    EXPORT_OVERLAP_IDS: int = int(os.getenv("EXPORT_OVERLAP_IDS", "1000"))
+    
+    # Постраничный вывод задач
+    TASKS_PAGE_SIZE: int = int(os.getenv("TASKS_PAGE_SIZE", "10"))
+    TASK_TITLE_PREVIEW: int = int(os.getenv("TASK_TITLE_PREVIEW", "120"))  # Символов названия в списке
+    MAX_BATCH_TASKS: int = int(os.getenv("MAX_BATCH_TASKS", "20"))  # Задач из одного многострочного сообщения
+    
+    # Кэш готовых сообщений (/tasks, /progress, рассылка)
+    RENDER_CACHE_SIZE: int = int(os.getenv("RENDER_CACHE_SIZE", "10000"))
+    RENDER_CACHE_TTL: float = float(os.getenv("RENDER_CACHE_TTL", "600"))  # Секунд
+    
+    # Планировщик при нескольких репликах:
+    # "single" - задачи выполняет каждая копия (одна реплика),
+    # "leader" - только реплика, держащая аренду в БД,
+    # "partition" - каждая реплика берёт своих пользователей по хэшу Telegram ID
+    SCHEDULER_MODE: str = os.getenv("SCHEDULER_MODE", "single")
+    SCHEDULER_LEASE_TTL: float = float(os.getenv("SCHEDULER_LEASE_TTL", "60"))  # Секунд
+    SCHEDULER_HEARTBEAT: float = float(os.getenv("SCHEDULER_HEARTBEAT", "15"))  # Секунд
+    REPLICA_ID: str = os.getenv("REPLICA_ID", "")  # По умолчанию - хост и PID
+    REPLICA_INDEX: int = int(os.getenv("REPLICA_INDEX", "0"))
+    REPLICA_COUNT: int = int(os.getenv("REPLICA_COUNT", "1"))
+    
     # Напоминания
     DEFAULT_REMINDER_TIME: str = os.getenv("DEFAULT_REMINDER_TIME", "18:00")
     TIMEZONE: str = os.getenv("TIMEZONE", "Europe/Moscow")
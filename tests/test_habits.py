@@ -0,0 +1,68 @@
+"""
+Серии привычек: расписание каждый день, по будням и каждые N дней
+"""
+from datetime import date, timedelta
+from bot.database.models import HabitTemplate
+from bot.gamification.habits import HabitTracker
+
+# Понедельник
+START = date(2026, 10, 5)
+
+
+def make_habit(schedule: str = "daily", interval_days: int = 1) -> HabitTemplate:
+    return HabitTemplate(title="привычка", schedule=schedule, interval_days=interval_days,
+                         starts_on=START, current_streak=0, best_streak=0)
+
+
+def done_on(habit: HabitTemplate, *offsets: int):
+    for offset in offsets:
+        HabitTracker.record_done(habit, START + timedelta(days=offset))
+
+
+def streaks(habit: HabitTemplate, offsets) -> list:
+    return [HabitTracker.current_streak(habit, START + timedelta(days=offset)) for offset in offsets]
+
+
+def test_daily_streak():
+    habit = make_habit()
+    done_on(habit, 0, 1)
+    assert habit.current_streak == 2
+    # Сегодня выполнено; завтра ещё не выполнено - серия держится; послезавтра - прервана
+    assert streaks(habit, [1, 2, 3]) == [2, 2, 0]
+
+
+def test_weekdays_streak_survives_weekend():
+    habit = make_habit("weekdays")
+    done_on(habit, 3, 4)  # Четверг, пятница
+    assert habit.current_streak == 2
+    # Суббота, воскресенье, понедельник (ещё не выполнено), вторник
+    assert streaks(habit, [5, 6, 7, 8]) == [2, 2, 2, 0]
+    done_on(habit, 7)
+    assert habit.current_streak == 3
+
+
+def test_every_n_days_streak_between_due_days():
+    habit = make_habit("every", 3)
+    done_on(habit, 0, 3)
+    assert habit.current_streak == 2
+    # Дни 4-5 не по расписанию, 6 - по расписанию и ещё не выполнен, 7 - день 6 пропущен
+    assert streaks(habit, [3, 4, 5, 6, 7]) == [2, 2, 2, 2, 0]
+
+
+def test_every_n_days_missed_due_day_restarts_streak():
+    habit = make_habit("every", 3)
+    done_on(habit, 0, 6)
+    assert habit.current_streak == 1
+    assert habit.best_streak == 1
+
+
+def test_due_days():
+    every = make_habit("every", 3)
+    weekdays = make_habit("weekdays")
+    assert [HabitTracker.is_due(every, START + timedelta(days=offset)) for offset in range(7)] == \
+        [True, False, False, True, False, False, True]
+    assert HabitTracker.latest_due(every, START + timedelta(days=5)) == START + timedelta(days=3)
+    assert HabitTracker.latest_due(weekdays, START + timedelta(days=6)) == START + timedelta(days=4)
+    assert HabitTracker.previous_due(weekdays, START + timedelta(days=7)) == START + timedelta(days=4)
+    assert HabitTracker.latest_due(make_habit(), START - timedelta(days=1)) is None
+    assert HabitTracker.previous_due(weekdays, START) is None